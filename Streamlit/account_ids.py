@@ -0,0 +1,25 @@
+"""
+Deterministic account-ID encoding.
+
+Python salts str hashes per process, so hash(str(x)) gives the same MSISDN a
+different ID in every Streamlit worker and after every restart. IDs here are
+hashed with a fixed-key SipHash (pandas' vectorized hash_array), which is stable
+across processes and runs without Python-level per-row work.
+"""
+import numpy as np
+import pandas as pd
+
+# 16-byte SipHash key. Changing it changes every account hash (saved velocity state, model ID features).
+ACCOUNT_HASH_KEY = 'picket-ai-acct01'
+
+# Range of the account-ID features in the 11-value preprocess_transaction list
+MODEL_ID_MODULUS = 1000000
+
+
+def hash_account_ids(ids):
+    """Stable 64-bit hash of every account ID (hashed by its string form)"""
+    values = np.asarray(ids).reshape(-1)
+    if values.dtype != object:
+        values = values.astype(str).astype(object)
+    return pd.util.hash_array(values, encoding='utf8', hash_key=ACCOUNT_HASH_KEY, categorize=False)
+
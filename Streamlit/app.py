@@ -1,11 +1,14 @@
 import streamlit as st
-import xgboost as xgb
-import numpy as np
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
 import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Only the lightweight registry is imported up front. xgboost, pandas and plotly
+# load inside the pages and code paths that use them, and the model itself is
+# loaded and warmed on a background thread while the first page renders.
+import metrics
+from model_registry import SERVABLE_FORMATS, ModelRegistry, is_servable
 
 # Page configuration
 st.set_page_config(
@@ -304,6 +307,12 @@ st.markdown("""
         box-shadow: 0 2px 10px rgba(255, 107, 107, 0.3);
     }
     
+    .badge-warming {
+        background: linear-gradient(135deg, #ffb74d, #ffa726);
+        color: white;
+        box-shadow: 0 2px 10px rgba(255, 183, 77, 0.3);
+    }
+    
     /* Cute metric styling */
     .stMetric {
         background: rgba(255, 255, 255, 0.1);
@@ -346,65 +355,170 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Global variables
+def warm_up_model(name, model):
+    """Score one dummy transaction so the first real submission skips lazy initialization"""
+    from scoring import WARMUP_TRANSACTION, analyze_transaction
+
+    if is_servable(model):
+        analyze_transaction(model, WARMUP_TRANSACTION)
+
 @st.cache_resource
-def load_model():
-    """Load the XGBoost model safely across environments"""
-    try:
-        # ✅ Build absolute path so it works both locally and on Streamlit Cloud
-        model_path = os.path.join(os.path.dirname(__file__), "models", "3momtsim_fraud_model.bin")
+def get_model_registry():
+    """One lazily loading model registry per server process, shared by every session"""
+    return ModelRegistry(on_load=warm_up_model)
+
+@st.cache_resource
+def get_model_loader():
+    """Background thread that loads and warms models off the render path"""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-loader')
 
-        # Optional: Debug info (can remove after confirming)
-        print("Looking for model at:", model_path)
-        print("Exists:", os.path.exists(model_path))
+@st.cache_resource
+def get_model_loads():
+    """Background load of every model name, shared by every session: model name -> future of load_model"""
+    return {}
 
-        if os.path.exists(model_path):
-            classifier = xgb.Booster()
-            classifier.load_model(model_path)
-            return classifier, True
-        else:
-            return None, False
+def submit_model_load(model_name):
+    """
+    The background load of model_name, submitted again only if none is pending and the last
+    one failed or its model has since been evicted from the registry
+    """
+    loads = get_model_loads()
+    future = loads.get(model_name)
+    if future is None or (future.done() and not (future.result()[1] and get_model_registry().is_warm(model_name))):
+        future = loads[model_name] = get_model_loader().submit(load_model, model_name)
+    return future
+
+@st.cache_data
+def list_servable_models(models_mtime):
+    """
+    Names of the artifacts the scoring pages can serve; describe() opens every artifact,
+    so this is cached and keyed on the models/ directory's mtime (adding or replacing one changes it)
+    """
+    return [m['name'] for m in get_model_registry().describe() if m['format'] in SERVABLE_FORMATS]
+
+@st.cache_resource
+def start_metrics_server():
+    """Expose /metrics from the app process when FRAUDGUARD_METRICS_PORT is set"""
+    port = os.environ.get('FRAUDGUARD_METRICS_PORT')
+    if port:
+        metrics.enable()
+        return metrics.start_http_server(int(port))
+    return None
+
+@st.cache_resource
+def get_result_cache():
+    """Scoring results shared by every session, so resubmitted transactions skip the model"""
+    from result_cache import ResultCache
+
+    return ResultCache()
+
+@st.cache_resource
+def get_feature_store():
+    """
+    Per-account velocity features, shared by every session of this server process.
+    With FRAUDGUARD_VELOCITY_SNAPSHOT set, the store starts from the latest snapshot
+    in that directory and keeps publishing new ones, so restarts keep account history.
+    """
+    import atexit
+
+    from velocity import AccountFeatureStore
+
+    snapshot = os.environ.get('FRAUDGUARD_VELOCITY_SNAPSHOT')
+    if not snapshot:
+        return AccountFeatureStore()
+    store = AccountFeatureStore.load_snapshot(snapshot, writable=True) or AccountFeatureStore()
+    store.start_autosave(snapshot)
+    atexit.register(store.stop_autosave)
+    return store
+
+@st.cache_resource
+def get_shadow_scorer():
+    """
+    Candidate models from FRAUDGUARD_SHADOW_MODELS (comma-separated) scored after every
+    dashboard prediction on a background thread and compared with the selected model
+    in FRAUDGUARD_SHADOW_LOG (see shadow.py); None when no candidates are set
+    """
+    import atexit
+
+    from shadow import DEFAULT_SHADOW_LOG, ShadowScorer
+
+    candidates = [name.strip() for name in os.environ.get('FRAUDGUARD_SHADOW_MODELS', '').split(',') if name.strip()]
+    if not candidates:
+        return None
+    scorer = ShadowScorer(get_model_registry(), candidates, os.environ.get('FRAUDGUARD_SHADOW_LOG', DEFAULT_SHADOW_LOG))
+    atexit.register(scorer.close)
+    return scorer
+
+def retire_scoring_pool(pool):
+    """Close a replaced scoring pool once the reruns that picked it up have finished"""
+    from model_watcher import retire
+
+    retire(pool)
+
+@st.cache_resource
+def get_model_watcher():
+    """
+    Reloads warm models whose artifact in models/ is replaced, validates them on a canary
+    batch and swaps them in without a restart (see model_watcher.py); polls every
+    FRAUDGUARD_MODEL_WATCH_INTERVAL seconds (default 5, 0 disables)
+    """
+    import atexit
+
+    from model_watcher import DEFAULT_WATCH_INTERVAL, ModelWatcher
+
+    interval = float(os.environ.get('FRAUDGUARD_MODEL_WATCH_INTERVAL') or DEFAULT_WATCH_INTERVAL)
+    if interval <= 0:
+        return None
+
+    def drop_scoring_pools(name, model):
+        # The next rerun loads the new model and builds a pool around it; the old one is retired on release
+        get_model_loads().pop(name, None)
+        get_scoring_pool.clear(name)
+        if name == get_model_registry().default_name:
+            get_scoring_pool.clear(None)
+
+    watcher = ModelWatcher(get_model_registry(), interval, on_swap=drop_scoring_pools).start()
+    atexit.register(watcher.stop)
+    return watcher
+
+@st.cache_resource(on_release=retire_scoring_pool)
+def get_scoring_pool(model_name=None):
+    """Worker processes sharing one copy of the model, so concurrent sessions score on several cores"""
+    from scoring_pool import ScoringPool
+
+    return ScoringPool(get_model_registry().get(model_name), int(os.environ['FRAUDGUARD_PROCESSES']))
+
+def load_model(model_name=None):
+    """Load the XGBoost model safely across environments"""
+    try:
+        classifier = get_model_registry().get(model_name)
+        if is_servable(classifier) and int(os.environ.get('FRAUDGUARD_PROCESSES') or 1) > 1:
+            classifier = get_scoring_pool(model_name)
     except Exception as e:
         print(f"Error loading model: {e}")
         return None, False
+    # Started here, on the loader thread, so the watcher's imports never delay the first render
+    get_model_watcher()
+    return classifier, is_servable(classifier)
+
+def wait_for_model(model):
+    """Resolve the background model load; returns (classifier, model_loaded)"""
+    if not model.done():
+        with st.spinner(' Warming up the model...'):
+            return model.result()
+    return model.result()
 
 def preprocess_transaction(step, transaction_type, amount, initiator, oldBalInitiator, newBalInitiator, recipient, oldBalRecipient, newBalRecipient):
     """Preprocess transaction data for MomtSim model prediction"""
     try:
-        # Encode transaction type based on MomtSim data
-        type_mapping = {
-            'DEPOSIT': 0,
-            'WITHDRAWAL': 1, 
-            'TRANSFER': 2,
-            'PAYMENT': 3,
-            'DEBIT': 4
-        }
-        
-        type_encoded = type_mapping.get(transaction_type, 0)
-        
-        # Calculate the error balance features using notebook formulas
-        errorbalanceRec = oldBalRecipient + amount - newBalRecipient
-        errorbalanceInit = newBalInitiator + amount - oldBalInitiator
-        
-        # Handle account IDs - convert to numeric if string
-        initiator_id = initiator if isinstance(initiator, (int, float)) else hash(str(initiator)) % 1000000
-        recipient_id = hash(str(recipient)) % 1000000 if isinstance(recipient, str) else recipient
-        
-        # Create complete feature vector with all features the model expects
-        features = [
-            step,
-            type_encoded,
-            amount,
-            initiator_id,
-            oldBalInitiator,
-            newBalInitiator,
-            recipient_id,
-            oldBalRecipient,
-            newBalRecipient,
-            errorbalanceRec,    # Added
-            errorbalanceInit    # Added
-        ]
-        
-        return features
+        import preprocessing
+
+        # Same columnar implementation the batch path uses, applied to one row
+        return preprocessing.preprocess_transaction(
+            step, transaction_type, amount, initiator,
+            oldBalInitiator, newBalInitiator,
+            recipient, oldBalRecipient, newBalRecipient
+        )
         
     except Exception as e:
         st.error(f"Error preprocessing transaction: {e}")
@@ -453,173 +567,27 @@ def get_friendly_message(fraud_score, confidence_score, recommendation):
     
     return " ".join(messages)
 
+# Progress text shown after each analyze_transaction stage completes
+ANALYSIS_STAGES = {
+    'preprocess': ' Features ready, scoring with confidence metrics...',
+    'predict': ' Model scored, explaining risk factors...',
+    'risk_factors': ' Analysis complete'
+}
+
 def predict_fraud_with_confidence(classifier, features):
     """
     Make fraud prediction with REAL model confidence
     Returns: (fraud_probability, confidence_score, method_used, confidence_breakdown)
     """
-    try:
-        # Create DataFrame with all 9 features the model expects
-        feature_df = pd.DataFrame({
-            'step': [features[0]],
-            'transactionType': [features[1]], 
-            'amount': [features[2]], 
-            'oldBalInitiator': [features[4]], 
-            'newBalInitiator': [features[5]], 
-            'oldBalRecipient': [features[7]],
-            'newBalRecipient': [features[8]],
-            'errorbalanceRec': [features[9]],     # Now available
-            'errorbalanceInit': [features[10]]    # Now available
-        })
-        
-        # Try prediction with all features
-        fraud_prob = float(classifier.inplace_predict(feature_df)[0])
-        
-        # Method 2: Calculate model confidence using multiple approaches
-        confidence_scores = {}
-        
-        # Approach A: Probability-based confidence
-        # How far the prediction is from 0.5 (uncertain)
-        prob_confidence = abs(fraud_prob - 0.5) * 2
-        confidence_scores['probability_distance'] = prob_confidence
-        
-        # Approach B: Tree voting confidence (if we can access individual trees)
-        try:
-            # Get predictions from individual trees (boosting iterations)
-            tree_predictions = []
-            
-            # Get predictions from different tree subsets to measure variance
-            num_trees = min(classifier.num_boosted_rounds(), 100)  # Limit for performance
-            for i in range(0, num_trees, max(1, num_trees // 10)):
-                end_iter = min(i + max(1, num_trees // 10), num_trees)
-                pred = classifier.inplace_predict(feature_df, iteration_range=(0, end_iter))
-                tree_predictions.append(float(pred[0]))
-            
-            # Calculate variance in predictions across tree subsets
-            pred_variance = np.var(tree_predictions) if len(tree_predictions) > 1 else 0
-            # Convert variance to confidence (lower variance = higher confidence)
-            variance_confidence = max(0, 1 - (pred_variance * 10))  # Scale appropriately
-            confidence_scores['tree_variance'] = variance_confidence
-            
-        except Exception as e:
-            # Fallback if tree-level analysis fails
-            confidence_scores['tree_variance'] = prob_confidence
-        
-        # Approach C: Feature importance based confidence
-        try:
-            # Calculate how much the prediction would change with small feature perturbations
-            perturbation_scores = []
-            
-            for i in range(len(features)):
-                # Create slightly perturbed versions
-                perturbed_features = features.copy()
-                original_val = features[i]
-                
-                # Perturb by ±5%
-                for perturbation in [0.95, 1.05]:
-                    if isinstance(original_val, (int, float)) and original_val != 0:
-                        perturbed_features[i] = original_val * perturbation
-                        
-                        perturbed_df = pd.DataFrame({
-                            'step': [perturbed_features[0]],
-                            'transactionType': [perturbed_features[1]], 
-                            'amount': [perturbed_features[2]], 
-                            'oldBalInitiator': [perturbed_features[4]], 
-                            'newBalInitiator': [perturbed_features[5]], 
-                            'oldBalRecipient': [perturbed_features[7]],
-                            'newBalRecipient': [perturbed_features[8]],
-                            'errorbalanceRec': [perturbed_features[9]],
-                            'errorbalanceInit': [perturbed_features[10]]
-                        })
-                        
-                        perturbed_pred = float(classifier.inplace_predict(perturbed_df)[0])
-                        perturbation_scores.append(abs(perturbed_pred - fraud_prob))
-            
-            # Lower sensitivity to perturbations = higher confidence
-            avg_sensitivity = np.mean(perturbation_scores) if perturbation_scores else 0
-            sensitivity_confidence = max(0, 1 - (avg_sensitivity * 5))  # Scale appropriately
-            confidence_scores['sensitivity'] = sensitivity_confidence
-            
-        except Exception as e:
-            confidence_scores['sensitivity'] = prob_confidence
-        
-        # Approach D: Ensemble-style confidence using feature masking
-        try:
-            # Create multiple slightly different feature combinations
-            ensemble_predictions = []
-            base_prediction = fraud_prob
-            
-            # Test with feature masking (setting some features to neutral values)
-            for mask_idx in range(min(3, len(features))):  # Test masking up to 3 features
-                masked_features = features.copy()
-                # Mask less important features with neutral values
-                if mask_idx == 0:  # Mask step
-                    masked_features[0] = 1
-                elif mask_idx == 1:  # Mask initiator ID
-                    masked_features[3] = 0
-                elif mask_idx == 2:  # Mask recipient ID  
-                    masked_features[6] = 0
-                
-                masked_df = pd.DataFrame({
-                    'step': [masked_features[0]],
-                    'transactionType': [masked_features[1]], 
-                    'amount': [masked_features[2]], 
-                    'oldBalInitiator': [masked_features[4]], 
-                    'newBalInitiator': [masked_features[5]], 
-                    'oldBalRecipient': [masked_features[7]],
-                    'newBalRecipient': [masked_features[8]],
-                    'errorbalanceRec': [masked_features[9]],
-                    'errorbalanceInit': [masked_features[10]]
-                })
-                
-                masked_pred = float(classifier.inplace_predict(masked_df)[0])
-                ensemble_predictions.append(masked_pred)
-            
-            # Calculate consistency across masked predictions
-            ensemble_variance = np.var([base_prediction] + ensemble_predictions) if ensemble_predictions else 0
-            ensemble_confidence = max(0, 1 - (ensemble_variance * 8))
-            confidence_scores['ensemble_consistency'] = ensemble_confidence
-            
-        except Exception as e:
-            confidence_scores['ensemble_consistency'] = prob_confidence
-        
-        # Combine all confidence measures (weighted average)
-        weights = {
-            'probability_distance': 0.3,
-            'tree_variance': 0.25, 
-            'sensitivity': 0.25,
-            'ensemble_consistency': 0.2
-        }
-        
-        final_confidence = sum(
-            confidence_scores[method] * weights[method] 
-            for method in weights if method in confidence_scores
-        )
-        
-        # Ensure confidence is between 0 and 1
-        final_confidence = max(0.0, min(1.0, final_confidence))
-        
+    from scoring import predict_with_confidence
+
+    fraud_prob, final_confidence, method, confidence_scores = predict_with_confidence(classifier, features, get_result_cache())
+    
+    if method == "XGBoost_Model":
         # Add debug info to show model was used
         st.info(f"🤖 **MODEL USED**: XGBoost prediction = {fraud_prob:.3f} | Confidence = {final_confidence:.3f}")
-        
-        return fraud_prob, final_confidence, "XGBoost_Model", confidence_scores
-        
-    except Exception as e:
-        # Show when fallback is used
-        # st.warning(f"⚠️ **FALLBACK USED**: Model failed ({str(e)}), using rule-based scoring")
-        
-        # Fallback calculation with low confidence indicator
-        amount_risk = min(features[2] / 1000000, 0.5)
-        balance_risk = 0.3 if features[4] > 0 and features[5] == 0 else 0.1
-        type_risk = 0.2 if features[1] in [1, 2] else 0.05
-        
-        fallback_score = min(amount_risk + balance_risk + type_risk, 0.95)
-        # Fallback has low confidence since it's rule-based
-        fallback_confidence = 0.3
-        
-        #st.info(f"📋 **FALLBACK CALCULATION**: Score = {fallback_score:.3f} | Confidence = {fallback_confidence:.3f}")
-        
-        return fallback_score, fallback_confidence, "Rule_Based_Fallback", {'error': str(e)}
+    
+    return fraud_prob, final_confidence, method, confidence_scores
 
 def interpret_model_confidence(confidence_score):
     """Convert numerical confidence to human readable interpretation"""
@@ -636,6 +604,15 @@ def interpret_model_confidence(confidence_score):
     else:
         return "Low", "🔴", "Model is uncertain - human review recommended"
 
+# Result card styling for each recommendation: (status_class, icon, title)
+RECOMMENDATION_DISPLAY = {
+    "BLOCK_LOW_CONFIDENCE": ("result-danger", "❌", "Transaction Failed"),
+    "HUMAN_REVIEW_REQUIRED": ("result-uncertain", "❓", "Uncertain Prediction"),
+    "APPROVE": ("result-success", "✅", "Transaction Approved"),
+    "REVIEW": ("result-warning", "⚠️", "Review Required"),
+    "BLOCK": ("result-danger", "❌", "Fraud Detected")
+}
+
 def display_results_with_real_confidence(fraud_score, confidence_score, method_used, confidence_breakdown, risk_factors):
     """Display results with React app inspired form and results, keeping existing overall design"""
     
@@ -648,66 +625,25 @@ def display_results_with_real_confidence(fraud_score, confidence_score, method_u
     with col3:
         st.metric("🔍 Method Used", method_used.replace('_', ' '))
     
-    # Determine risk level with confidence consideration
-    base_risk = "LOW" if fraud_score < 0.4 else "MEDIUM" if fraud_score < 0.7 else "HIGH"
-    
-    # Adjust recommendation based on confidence
-    if confidence_score < 0.7:  # Require 70%+ confidence for financial decisions
-        if fraud_score > 0.3:  # Any fraud score above 30% with low confidence = block
-            recommendation = "BLOCK_LOW_CONFIDENCE"
-            status_class = "result-danger"
-            icon = "❌"
-            title = "Transaction Failed"
-        else:
-            recommendation = "HUMAN_REVIEW_REQUIRED"
-            status_class = "result-uncertain"
-            icon = "❓"
-            title = "Uncertain Prediction"
-        
-        # React-style results display
-        st.markdown(f"""
-        <div class="results-container">
-            <div class="result-status {status_class}">
-                <div class="result-icon">{icon}</div>
-                <div class="result-title">{title}</div>
-            </div>
-            <h4 style="color: white; margin: 16px 0;">Confidence:</h4>
-            <div class="confidence-circle" style="--percentage: {confidence_score*360}deg;">
-                <div class="confidence-text">{confidence_score:.0%}</div>
-            </div>
+    from scoring import recommend
+
+    # Determine risk level and recommendation with confidence consideration
+    base_risk, recommendation = recommend(fraud_score, confidence_score)
+    status_class, icon, title = RECOMMENDATION_DISPLAY[recommendation]
+    
+    # React-style results display
+    st.markdown(f"""
+    <div class="results-container">
+        <div class="result-status {status_class}">
+            <div class="result-icon">{icon}</div>
+            <div class="result-title">{title}</div>
         </div>
-        """, unsafe_allow_html=True)
-        
-    else:  # Good confidence (70%+)
-        if base_risk == "LOW":
-            recommendation = "APPROVE"
-            status_class = "result-success"
-            icon = "✅"
-            title = "Transaction Approved"
-        elif base_risk == "MEDIUM":
-            recommendation = "REVIEW"
-            status_class = "result-warning"
-            icon = "⚠️"
-            title = "Review Required"
-        else:
-            recommendation = "BLOCK"
-            status_class = "result-danger"
-            icon = "❌"
-            title = "Fraud Detected"
-        
-        # React-style results display
-        st.markdown(f"""
-        <div class="results-container">
-            <div class="result-status {status_class}">
-                <div class="result-icon">{icon}</div>
-                <div class="result-title">{title}</div>
-            </div>
-            <h4 style="color: white; margin: 16px 0;">Confidence:</h4>
-            <div class="confidence-circle" style="--percentage: {confidence_score*360}deg;">
-                <div class="confidence-text">{confidence_score:.0%}</div>
-            </div>
+        <h4 style="color: white; margin: 16px 0;">Confidence:</h4>
+        <div class="confidence-circle" style="--percentage: {confidence_score*360}deg;">
+            <div class="confidence-text">{confidence_score:.0%}</div>
         </div>
-        """, unsafe_allow_html=True)
+    </div>
+    """, unsafe_allow_html=True)
     
     # Friendly message (keep existing style)
     friendly_message = get_friendly_message(fraud_score, confidence_score, recommendation)
@@ -721,49 +657,6 @@ def display_results_with_real_confidence(fraud_score, confidence_score, method_u
     
 
 
-def calculate_risk_factors(transaction_type, amount, oldBalInitiator, newBalInitiator):
-    """Calculate risk factors for explanation"""
-    factors = []
-    
-    # Transaction amount factor
-    if amount > 200000:
-        impact = min(0.4, amount / 1000000)
-        factors.append({
-            'factor': 'High Transaction Amount',
-            'impact': impact,
-            'description': f'Large transaction: {amount:,.0f} UGX'
-        })
-    
-
-    
-    # Transaction type factor
-    if transaction_type in ['WITHDRAWAL', 'TRANSFER']:
-        factors.append({
-            'factor': 'Risky Transaction Type',
-            'impact': 0.3,
-            'description': f'{transaction_type} transactions have elevated fraud risk'
-        })
-    
-    # Account emptying pattern
-    if oldBalInitiator > 0 and newBalInitiator == 0:
-        factors.append({
-            'factor': 'Account Emptying Pattern',
-            'impact': 0.35,
-            'description': 'Complete account balance transferred'
-        })
-    
-    # Large balance change
-    if oldBalInitiator > 0:
-        balance_change_ratio = abs(oldBalInitiator - newBalInitiator) / oldBalInitiator
-        if balance_change_ratio > 0.8:
-            factors.append({
-                'factor': 'Large Balance Change',
-                'impact': 0.25,
-                'description': 'Significant portion of account balance involved'
-            })
-    
-    return factors
-
 # Main App
 def main():
     # Cute animated header
@@ -774,8 +667,7 @@ def main():
     <p class="sub-header">Mobile Money Fraud Detection for Uganda </p>
     ''', unsafe_allow_html=True)
     
-    # Load model
-    classifier, model_loaded = load_model()
+    start_metrics_server()
     
     # Cute sidebar
     with st.sidebar:
@@ -784,12 +676,25 @@ def main():
             "Fraud Detection Magic", 
             "EDA", 
             " Demo Playground", 
-            "Model Infor"
+            "Batch Scoring",
+            "Model Infor",
+            "Diagnostics"
         ])
         
         st.markdown("---")
         st.subheader(" AI Status")
-        if model_loaded:
+
+        # Only native XGBoost boosters and compiled models can be served by the scoring pages
+        registry = get_model_registry()
+        booster_names = list_servable_models(os.stat(registry.model_dir).st_mtime_ns)
+        default_index = booster_names.index(registry.default_name) if registry.default_name in booster_names else 0
+        model_name = st.selectbox("Model", booster_names, index=default_index, key='model_name') if booster_names else None
+
+        # Load model in the background; pages only wait for it when they score
+        model = submit_model_load(model_name)
+        if not model.done():
+            st.markdown('<div class="status-badge badge-warming"> Model Warming Up</div>', unsafe_allow_html=True)
+        elif model.result()[1]:
             st.markdown('<div class="status-badge badge-success"> MomtSim Model Ready!</div>', unsafe_allow_html=True)
             #st.info(" Model: MomtSim XGBoost")
         else:
@@ -798,15 +703,19 @@ def main():
     
     # Main Content with cute routing
     if page == "Fraud Detection Magic":
-        fraud_detection_page(classifier, model_loaded)
+        fraud_detection_page(model)
     elif page == "EDA":
         analytics_page()
     elif page == " Demo Playground":
-        demo_data_page(classifier, model_loaded)
+        demo_data_page(model)
+    elif page == "Batch Scoring":
+        batch_scoring_page(model)
     elif page == "Model Infor":
         model_info_page()
+    elif page == "Diagnostics":
+        diagnostics_page()
 
-def fraud_detection_page(classifier, model_loaded):
+def fraud_detection_page(model):
     st.markdown('<h2 class="rainbow-text">Model Performance Overview</h2>', unsafe_allow_html=True)
     
     # Fixed-size stats cards with consistent structure
@@ -907,6 +816,8 @@ def fraud_detection_page(classifier, model_loaded):
                 validation_errors.append("Amount must be greater than 0")
             
             # Display validation errors
+            classifier, model_loaded = wait_for_model(model) if not validation_errors else (None, False)
+
             if validation_errors:
                 st.markdown("""
                 <div class="risk-high">
@@ -927,36 +838,66 @@ def fraud_detection_page(classifier, model_loaded):
                 st.markdown("</div>", unsafe_allow_html=True)
             
             else:
-                # Show cute loading animation
-                with st.spinner(' AI is analyzing with confidence metrics...'):
-                    import time
-                    time.sleep(1)
-                    
-                    # Process prediction with MomtSim structure - USING STEP=1 AS DEFAULT
-                    processed_features = preprocess_transaction(
-                        1, transaction_type, amount, initiator,  # Using step=1 as default
-                        oldBalInitiator, newBalInitiator, 
-                        recipient, oldBalRecipient, newBalRecipient
+                from scoring import analyze_transaction
+
+                progress_bar = st.progress(0.0, text=' AI is analyzing with confidence metrics...')
+                shadow = get_shadow_scorer()
+                try:
+                    # Step is not on the form, so score with step=1 as the default
+                    result = analyze_transaction(
+                        classifier,
+                        {
+                            'step': 1, 'transactionType': transaction_type, 'amount': amount,
+                            'initiator': initiator, 'oldBalInitiator': oldBalInitiator,
+                            'newBalInitiator': newBalInitiator, 'recipient': recipient,
+                            'oldBalRecipient': oldBalRecipient, 'newBalRecipient': newBalRecipient
+                        },
+                        progress=lambda stage, done: progress_bar.progress(done, text=ANALYSIS_STAGES[stage]),
+                        cache=get_result_cache(),
+                        feature_store=get_feature_store(),
+                        shadow=shadow and (lambda *batch: shadow.submit(*batch, primary=st.session_state.get('model_name')))
                     )
-                    
-                    if processed_features is None:
-                        st.error(" Error processing transaction")
-                        st.markdown("</div>", unsafe_allow_html=True)
-                    else:
-                        # Get prediction with real confidence
-                        fraud_score, confidence, method, confidence_breakdown = predict_fraud_with_confidence(
-                            classifier, processed_features
-                        )
-                        
-                        # Calculate risk factors
-                        risk_factors = calculate_risk_factors(transaction_type, amount, 
-                                                            oldBalInitiator, newBalInitiator)
-                        
-                        # Display results with real confidence
+                except Exception as e:
+                    result = None
+                    st.error(f"Error preprocessing transaction: {e}")
+                progress_bar.empty()
+
+                if result is None:
+                    st.error(" Error processing transaction")
+                    st.markdown("</div>", unsafe_allow_html=True)
+                else:
+                    if result['method'] == "XGBoost_Model":
+                        st.info(f"🤖 **MODEL USED**: XGBoost prediction = {result['fraud_score']:.3f} | "
+                                f"Confidence = {result['confidence']:.3f}")
+
+                    with metrics.timer('render'):
                         display_results_with_real_confidence(
-                            fraud_score, confidence, method, confidence_breakdown, risk_factors
+                            result['fraud_score'], result['confidence'], result['method'],
+                            result['confidence_breakdown'], result['risk_factors']
                         )
-        
+
+                    timings = result['timings_ms']
+                    st.caption(f"Scored in {timings['total']:.1f} ms "
+                               f"(features {timings['preprocess']:.1f} ms, model {timings['predict']:.1f} ms, "
+                               f"risk factors {timings['risk_factors']:.1f} ms)"
+                               + (f" · confidence tiers: {', '.join(result['confidence_breakdown']['tiers'])}"
+                                  if 'tiers' in result['confidence_breakdown'] else ""))
+
+                    velocity = result['velocity']
+                    if velocity is not None:
+                        with st.expander(" Account Velocity (before this transaction)"):
+                            col1, col2 = st.columns(2)
+                            for col, role in ((col1, 'sender'), (col2, 'recipient')):
+                                with col:
+                                    st.markdown(f"**{role.title()}**")
+                                    st.metric("Transactions (1h / 24h)",
+                                              f"{velocity[f'{role}_count_1h']:.0f} / {velocity[f'{role}_count_24h']:.0f}")
+                                    st.metric("Amount (24h)", f"{velocity[f'{role}_amount_24h']:,.0f} UGX")
+                                    st.metric("Counterparties (24h)", velocity[f'{role}_counterparties_24h'])
+                                    since = velocity[f'{role}_seconds_since_last']
+                                    st.metric("Since last transaction",
+                                              f"{since / 60:.1f} min" if since is not None else "first seen")
+
         else:
             st.markdown("""
             <div style="text-align: center; padding: 40px; color: rgba(255,255,255,0.8);">
@@ -967,6 +908,11 @@ def fraud_detection_page(classifier, model_loaded):
         
         st.markdown("</div>", unsafe_allow_html=True)
 def analytics_page():
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+
     st.markdown('<h2 class="rainbow-text">EDA</h2>', unsafe_allow_html=True)
     
     # Real dataset statistics
@@ -1347,7 +1293,7 @@ def analytics_page():
         </div>
     </div>
     """, unsafe_allow_html=True)
-def demo_data_page(classifier, model_loaded):
+def demo_data_page(model):
     st.markdown('<h2 class="rainbow-text"> Demo Playground</h2>', unsafe_allow_html=True)
     
     st.markdown(" **Test with MomtSim demo scenarios:**")
@@ -1407,6 +1353,7 @@ def demo_data_page(classifier, model_loaded):
             
             with col2:
                 if st.button(f"🧪 Test Demo {i+1}", key=f"demo_{i}"):
+                    classifier, model_loaded = wait_for_model(model)
                     if model_loaded:
                         with st.spinner(f'{demo["emoji"]} Testing...'):
                             processed = preprocess_transaction(
@@ -1428,6 +1375,94 @@ def demo_data_page(classifier, model_loaded):
                     else:
                         st.error("🚫 Model not loaded")
 
+# Largest scored file offered as an in-browser download (FRAUDGUARD_MAX_DOWNLOAD_MB overrides it)
+DEFAULT_DOWNLOAD_LIMIT_MB = 200
+
+def batch_scoring_page(model):
+    from batch_scoring import DEFAULT_CHUNK_SIZE
+
+    st.markdown('<h2 class="rainbow-text">Batch Scoring</h2>', unsafe_allow_html=True)
+    
+    st.markdown("Score a full MomtSim export (CSV or Parquet). The file is streamed in chunks, "
+                "so memory stays bounded whatever the file size.")
+    
+    source = st.radio("Input", ["Upload a file", "Path on server"], horizontal=True)
+    if source == "Upload a file":
+        uploaded = st.file_uploader("MomtSim export", type=["csv", "parquet"])
+        input_file = uploaded
+    else:
+        input_path = st.text_input("Input file path", placeholder="/data/exports/momtsim_2024-01-01.csv")
+        input_file = input_path if input_path and os.path.exists(input_path) else None
+        if input_path and input_file is None:
+            st.error(f"❌ File not found: {input_path}")
+    
+    destination = st.radio("Output", ["Download in the browser", "Path on server"], horizontal=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        chunk_size = st.number_input("Chunk size (rows)", min_value=1000, value=DEFAULT_CHUNK_SIZE, step=10000)
+    with col2:
+        if destination == "Path on server":
+            # .parquet writes Parquet, anything else CSV
+            output_file = st.text_input("Output file path", placeholder="/data/exports/scored.csv")
+        else:
+            output_format = st.selectbox("Output format", ["csv", "parquet"])
+            output_file = f"scored.{output_format}"
+    download_limit_mb = float(os.environ.get('FRAUDGUARD_MAX_DOWNLOAD_MB') or DEFAULT_DOWNLOAD_LIMIT_MB)
+    if destination == "Download in the browser":
+        st.caption(f"Results up to {download_limit_mb:g} MB can be downloaded; write larger ones to a server path.")
+    
+    if st.button("Score File", type="primary", disabled=input_file is None or not output_file):
+        classifier, model_loaded = wait_for_model(model)
+        if not model_loaded:
+            st.error("🚫 Model not loaded")
+            return
+        
+        # A download is written to a temporary directory that is removed once the button holds it
+        scratch = tempfile.mkdtemp() if destination == "Download in the browser" else None
+        output_path = os.path.join(scratch, output_file) if scratch else output_file
+        try:
+            score_and_offer(classifier, input_file, output_path, int(chunk_size),
+                            parquet=uploaded.name.lower().endswith(".parquet") if source == "Upload a file" else None,
+                            download_limit_mb=download_limit_mb if scratch else None)
+        finally:
+            if scratch:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+def score_and_offer(classifier, input_file, output_path, chunk_size, parquet, download_limit_mb):
+    """Score a file for the Batch Scoring page, then show the summary and the download (if any)"""
+    from batch_scoring import score_file
+
+    progress_text = st.empty()
+    
+    def report(chunks, rows):
+        progress_text.info(f"Chunk {chunks} done - {rows:,} rows scored")
+    
+    try:
+        summary = score_file(classifier, input_file, output_path, chunk_size, progress=report, parquet=parquet)
+    except Exception as e:
+        st.error(f"❌ Batch scoring failed: {e}")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(" Rows Scored", f"{summary['rows']:,}")
+    with col2:
+        st.metric(" High Risk", f"{summary['high_risk']:,}")
+    with col3:
+        st.metric(" Throughput", f"{summary['rows_per_second']:,.0f} rows/s")
+    
+    if download_limit_mb is None:
+        st.success(f"✅ Results written to {output_path}")
+        return
+    # The download button keeps the whole file in server memory until the session ends
+    size_mb = os.path.getsize(output_path) / (1024 * 1024)
+    if size_mb > download_limit_mb:
+        st.warning(f"Results are {size_mb:,.1f} MB, above the {download_limit_mb:g} MB download limit. "
+                   "Score the file again with a server output path.")
+        return
+    with open(output_path, "rb") as f:
+        st.download_button("Download Results", f, file_name=os.path.basename(output_path))
+
 def model_info_page():
     st.markdown('<h2 class="rainbow-text">About the dataset</h2>', unsafe_allow_html=True)
 
@@ -1469,5 +1504,66 @@ def model_info_page():
         for key, value in metrics_data.items():
             st.metric(f" {key}", value)
 
+def diagnostics_page():
+    st.markdown('<h2 class="rainbow-text">Diagnostics</h2>', unsafe_allow_html=True)
+    
+    st.markdown("Stage timers and counters for the scoring path in this server process. "
+                "Recording is off by default and costs next to nothing until it is switched on.")
+    
+    recording = st.toggle("Record metrics", value=metrics.enabled())
+    if recording != metrics.enabled():
+        metrics.enable(recording)
+    if st.button("Reset metrics"):
+        metrics.reset()
+    
+    data = metrics.snapshot()
+    counters = data['counters']
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric(" Transactions Scored", f"{counters.get('transactions_scored', 0):,}")
+    with col2:
+        st.metric(" Fallback Activations", f"{counters.get('fallback_activations', 0):,}")
+    with col3:
+        st.metric(" Booster Calls", f"{counters.get('booster_calls', 0):,}")
+    with col4:
+        scored = counters.get('transactions_scored', 0)
+        per_transaction = counters.get('booster_calls', 0) / scored if scored else 0
+        st.metric(" Booster Calls / Transaction", f"{per_transaction:.2f}")
+    
+    if data['stages']:
+        st.markdown("###  Stage Timings")
+        st.table([
+            {
+                'Stage': stage,
+                'Calls': summary['count'],
+                'Mean (ms)': f"{summary['sum'] / summary['count'] * 1000:.3f}" if summary['count'] else '-',
+                'Total (s)': f"{summary['sum']:.3f}"
+            }
+            for stage, summary in data['stages'].items()
+        ])
+    elif not recording:
+        st.info("Switch on recording (or start the app with FRAUDGUARD_METRICS=1), then score some transactions.")
+    
+    st.markdown("###  Result Cache")
+    cache_stats = get_result_cache().stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric(" Cached Results", f"{cache_stats['entries']:,} / {cache_stats['max_entries']:,}")
+    with col2:
+        hit_rate = cache_stats['hit_rate']
+        st.metric(" Hit Rate", f"{hit_rate:.0%}" if hit_rate is not None else "-")
+    with col3:
+        st.metric(" Hits / Misses", f"{cache_stats['hits']:,} / {cache_stats['misses']:,}")
+    with col4:
+        st.metric(" Evictions / Expired", f"{cache_stats['evictions']:,} / {cache_stats['expirations']:,}")
+    if st.button("Clear result cache"):
+        get_result_cache().clear()
+    
+    with st.expander("Prometheus text format"):
+        st.code(metrics.render_prometheus(), language="text")
+        port = os.environ.get('FRAUDGUARD_METRICS_PORT')
+        if port:
+            st.caption(f"Also served at http://127.0.0.1:{port}/metrics")
+
 if __name__ == "__main__":
     main()
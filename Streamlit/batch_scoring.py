@@ -0,0 +1,193 @@
+"""
+Bulk scoring of MomtSim CSV/Parquet exports.
+
+The input is streamed in fixed-size chunks; each chunk is preprocessed column-wise,
+scored with one booster call and appended to the output file, so memory stays
+bounded by the chunk size rather than the file size.
+
+Usage:
+    python batch_scoring.py transactions.csv scored.csv [--chunk-size 100000] [--model 2momtsim_fraud_model.bin]
+                            [--processes 8] [--compiled] [--risk-factors]
+
+With --processes, every chunk is split over worker processes (see scoring_pool.py).
+With --compiled, the booster is compiled into flat node arrays first (see
+compiled_model.py): a pool then holds one copy of the model in shared memory
+instead of one per worker, and a single process scores with the compiled model.
+
+Calibrated ensembles (--model CalibratedEnsemble.pkl, see ensemble.py) score
+files that carry their engineered feature columns instead of MomtSim ones.
+
+With --risk-factors, every row also gets the rule-based risk factors that fired
+(see risk_rules.py), evaluated over the whole chunk at once: riskFactorBits (bit i
+= rule i of the active table) and riskFactors (their names, '; '-separated).
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from compiled_model import CompiledBooster, compile_booster
+from ensemble import ServingEnsemble
+from model_registry import ModelRegistry, is_servable
+from preprocessing import MOMTSIM_COLUMNS, preprocess_transactions
+from risk_rules import active_rules
+from scoring import load_booster
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def _is_parquet(path):
+    return os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+
+
+def iter_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE, parquet=None):
+    """Yield DataFrames of at most chunk_size rows from a CSV or Parquet file (path or file object)"""
+    if parquet is None:
+        parquet = _is_parquet(getattr(source, 'name', source))
+
+    if parquet:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size)
+
+
+def score_chunk(classifier, chunk, risk_factors=False):
+    """
+    Score one chunk with a single model call and append fraudScore / riskLevel columns
+    risk_factors: also append riskFactorBits / riskFactors from the active rule table
+    """
+    if isinstance(classifier, ServingEnsemble):
+        fraud_scores = classifier.predict(chunk)
+    else:
+        missing = [col for col in MOMTSIM_COLUMNS if col not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing MomtSim columns: {', '.join(missing)}")
+        fraud_scores = classifier.inplace_predict(preprocess_transactions(chunk))
+
+    scored = chunk.copy()
+    scored['fraudScore'] = fraud_scores
+    scored['riskLevel'] = np.where(fraud_scores < 0.4, 'LOW', np.where(fraud_scores < 0.7, 'MEDIUM', 'HIGH'))
+    if risk_factors:
+        rules = active_rules()
+        bits, _ = rules.evaluate(chunk)
+        scored['riskFactorBits'] = bits
+        scored['riskFactors'] = rules.labels(bits)
+    return scored
+
+
+class _ChunkWriter:
+    """Append scored chunks to a CSV or Parquet file as they are produced"""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = _is_parquet(path)
+        self._parquet_writer = None
+        self._wrote_header = False
+
+    def write(self, frame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='a' if self._wrote_header else 'w',
+                         header=not self._wrote_header, index=False)
+            self._wrote_header = True
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def score_file(classifier, input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, parquet=None,
+               risk_factors=False):
+    """
+    Stream input_path through the model chunk by chunk and write results to output_path
+    progress: optional callback(chunks_done, rows_done) called after every chunk
+    risk_factors: add the rule-based risk factor columns (see score_chunk)
+    Returns: summary dict with rows, chunks, fraud counts and throughput
+    """
+    start = time.perf_counter()
+    rows = chunks = high_risk = 0
+
+    writer = _ChunkWriter(output_path)
+    try:
+        for chunk in iter_chunks(input_path, chunk_size, parquet=parquet):
+            scored = score_chunk(classifier, chunk, risk_factors)
+            writer.write(scored)
+
+            rows += len(scored)
+            chunks += 1
+            high_risk += int((scored['riskLevel'] == 'HIGH').sum())
+            if progress is not None:
+                progress(chunks, rows)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'rows': rows,
+        'chunks': chunks,
+        'high_risk': high_risk,
+        'seconds': elapsed,
+        'rows_per_second': rows / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a MomtSim CSV/Parquet export in streaming chunks")
+    parser.add_argument('input', help="CSV or Parquet file with MomtSim columns")
+    parser.add_argument('output', help="Destination file (.csv or .parquet)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--model', default=None,
+                        help="Model name from models/ (see model_registry.py) or a model file path")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Score each chunk on this many worker processes sharing the model")
+    parser.add_argument('--compiled', action='store_true',
+                        help="Score with compiled node arrays (see compiled_model.py); with --processes the "
+                             "workers share one copy instead of each deserializing the booster")
+    parser.add_argument('--risk-factors', action='store_true',
+                        help="Add the rule-based risk factors of every row (see risk_rules.py)")
+    args = parser.parse_args()
+
+    if args.model and not os.path.exists(args.model):
+        try:
+            classifier = ModelRegistry().get(args.model)
+        except KeyError as e:
+            raise SystemExit(e.args[0])
+    else:
+        classifier, model_loaded = load_booster(args.model)
+        if not model_loaded:
+            raise SystemExit("Model could not be loaded")
+
+    def report(chunks, rows):
+        print(f"  chunk {chunks}: {rows:,} rows scored", flush=True)
+
+    if (args.processes > 1 or args.compiled) and not is_servable(classifier):
+        raise SystemExit("--processes and --compiled need an XGBoost or compiled booster")
+    if args.compiled and args.processes <= 1 and not isinstance(classifier, CompiledBooster):
+        classifier = compile_booster(classifier)
+    if args.processes > 1:
+        from scoring_pool import ScoringPool
+
+        with ScoringPool(classifier, args.processes, compiled=args.compiled) as pool:
+            summary = score_file(pool, args.input, args.output, args.chunk_size, progress=report,
+                                 risk_factors=args.risk_factors)
+    else:
+        summary = score_file(classifier, args.input, args.output, args.chunk_size, progress=report,
+                             risk_factors=args.risk_factors)
+    print(f"Scored {summary['rows']:,} rows in {summary['seconds']:.1f}s "
+          f"({summary['rows_per_second']:,.0f} rows/s), {summary['high_risk']:,} HIGH risk")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Measure cold-start latency of the Streamlit app and the scoring path.
+
+Every sample runs in a fresh interpreter so import and model-load costs are paid
+again, the way they are after a deploy or a worker restart:
+
+    first_render     app.py script run until the default page is rendered
+    app_first_score  app start until the first form submission is scored
+    first_score      import the scoring path, load the default model, score one transaction
+
+Usage:
+    python benchmarks/bench_cold_start.py [--runs 5] [--json cold_start.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each probe prints its elapsed milliseconds on an ELAPSED_MS line
+PROBES = {
+    'first_render': '''
+import time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+at = AppTest.from_file('app.py', default_timeout=120).run()
+assert not at.exception, at.exception
+print('ELAPSED_MS', (time.perf_counter() - start) * 1000, flush=True)
+''',
+    'app_first_score': '''
+import time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+at = AppTest.from_file('app.py', default_timeout=120).run()
+at.text_input(key='initiator_id').set_value('256700000001')
+at.text_input(key='recipient_id').set_value('M192000')
+at.number_input[0].set_value(300000.0)
+at.button[0].click().run()
+assert not at.exception and at.caption, at.exception
+print('ELAPSED_MS', (time.perf_counter() - start) * 1000, flush=True)
+''',
+    'first_score': '''
+import time
+start = time.perf_counter()
+from model_registry import ModelRegistry
+from scoring import WARMUP_TRANSACTION, analyze_transaction
+analyze_transaction(ModelRegistry().get(), WARMUP_TRANSACTION)
+print('ELAPSED_MS', (time.perf_counter() - start) * 1000, flush=True)
+''',
+}
+
+
+def run_probe(code):
+    completed = subprocess.run([sys.executable, '-c', code], cwd=APP_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise SystemExit(f"Probe failed:\n{completed.stderr}")
+    elapsed = [line.split()[1] for line in completed.stdout.splitlines() if line.startswith('ELAPSED_MS ')]
+    return float(elapsed[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="Fresh processes per probe")
+    parser.add_argument('--json', default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in PROBES.items():
+        timings = np.array([run_probe(code) for _ in range(args.runs)])
+        results[name] = {
+            'runs': args.runs,
+            'p50_ms': float(np.percentile(timings, 50)),
+            'min_ms': float(timings.min()),
+            'max_ms': float(timings.max())
+        }
+        print(f"{name:>16}: p50 {results[name]['p50_ms']:.0f} ms | "
+              f"min {results[name]['min_ms']:.0f} ms | max {results[name]['max_ms']:.0f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
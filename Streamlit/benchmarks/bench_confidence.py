@@ -0,0 +1,139 @@
+"""
+Compare the batched confidence engine against the original per-row implementation.
+
+Checks that the weighted confidence breakdown matches (the staged tree-variance
+predictions are summed from leaf values, so they agree to float32 rounding) and
+reports how much per-transaction latency dropped.
+
+Usage:
+    python benchmarks/bench_confidence.py [--model models/3momtsim_fraud_model.bin] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from confidence import CONFIDENCE_WEIGHTS, compute_confidence  # noqa: E402
+
+# The three demo playground transactions, already preprocessed (IDs fixed so runs are comparable)
+SAMPLE_FEATURES = [
+    [1, 2, 300000, 537030, 400000, 500000, 192000, 100000, 400000, 0, 400000],
+    [1, 1, 300000.0, 54321, 300000.0, 0.0, 12345, 0.0, 0.0, 300000.0, 0.0],
+    [1, 3, 5000.0, 11111, 50000.0, 45000.0, 22222, 10000.0, 15000.0, 0.0, 0.0],
+]
+
+# Staged predictions agree with iteration_range predictions to one float32 ulp
+TREE_VARIANCE_ATOL = 1e-6
+
+
+def _one_row_frame(features):
+    return pd.DataFrame({
+        'step': [features[0]],
+        'transactionType': [features[1]],
+        'amount': [features[2]],
+        'oldBalInitiator': [features[4]],
+        'newBalInitiator': [features[5]],
+        'oldBalRecipient': [features[7]],
+        'newBalRecipient': [features[8]],
+        'errorbalanceRec': [features[9]],
+        'errorbalanceInit': [features[10]]
+    })
+
+
+def legacy_confidence(classifier, features):
+    """The original one-DataFrame-per-variant implementation, kept as the reference"""
+    feature_df = _one_row_frame(features)
+    fraud_prob = float(classifier.inplace_predict(feature_df)[0])
+
+    confidence_scores = {}
+    prob_confidence = abs(fraud_prob - 0.5) * 2
+    confidence_scores['probability_distance'] = prob_confidence
+
+    tree_predictions = []
+    num_trees = min(classifier.num_boosted_rounds(), 100)
+    for i in range(0, num_trees, max(1, num_trees // 10)):
+        end_iter = min(i + max(1, num_trees // 10), num_trees)
+        pred = classifier.inplace_predict(feature_df, iteration_range=(0, end_iter))
+        tree_predictions.append(float(pred[0]))
+    pred_variance = np.var(tree_predictions) if len(tree_predictions) > 1 else 0
+    confidence_scores['tree_variance'] = max(0, 1 - (pred_variance * 10))
+
+    perturbation_scores = []
+    for i in range(len(features)):
+        perturbed_features = features.copy()
+        original_val = features[i]
+        for perturbation in [0.95, 1.05]:
+            if isinstance(original_val, (int, float)) and original_val != 0:
+                perturbed_features[i] = original_val * perturbation
+                perturbed_pred = float(classifier.inplace_predict(_one_row_frame(perturbed_features))[0])
+                perturbation_scores.append(abs(perturbed_pred - fraud_prob))
+    avg_sensitivity = np.mean(perturbation_scores) if perturbation_scores else 0
+    confidence_scores['sensitivity'] = max(0, 1 - (avg_sensitivity * 5))
+
+    ensemble_predictions = []
+    for mask_idx in range(min(3, len(features))):
+        masked_features = features.copy()
+        if mask_idx == 0:
+            masked_features[0] = 1
+        elif mask_idx == 1:
+            masked_features[3] = 0
+        elif mask_idx == 2:
+            masked_features[6] = 0
+        ensemble_predictions.append(float(classifier.inplace_predict(_one_row_frame(masked_features))[0]))
+    ensemble_variance = np.var([fraud_prob] + ensemble_predictions) if ensemble_predictions else 0
+    confidence_scores['ensemble_consistency'] = max(0, 1 - (ensemble_variance * 8))
+
+    final_confidence = sum(confidence_scores[m] * CONFIDENCE_WEIGHTS[m] for m in CONFIDENCE_WEIGHTS)
+    return fraud_prob, max(0.0, min(1.0, final_confidence)), confidence_scores
+
+
+def _time_per_call(fn, classifier, repeat):
+    timings = []
+    for _ in range(repeat):
+        for features in SAMPLE_FEATURES:
+            start = time.perf_counter()
+            fn(classifier, features)
+            timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--model', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                        'models', '3momtsim_fraud_model.bin'))
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    classifier = xgb.Booster()
+    classifier.load_model(args.model)
+
+    for features in SAMPLE_FEATURES:
+        expected = legacy_confidence(classifier, features)
+        actual = compute_confidence(classifier, features)
+        matches = expected[0] == actual[0] and all(
+            np.isclose(expected[2][method], actual[2][method], rtol=0, atol=TREE_VARIANCE_ATOL)
+            if method == 'tree_variance' else expected[2][method] == actual[2][method]
+            for method in CONFIDENCE_WEIGHTS
+        )
+        if not matches:
+            raise SystemExit(f"Mismatch for {features}:\n  legacy  {expected}\n  batched {actual}")
+    print(f"Breakdown matches for {len(SAMPLE_FEATURES)} transactions")
+
+    legacy_ms = _time_per_call(legacy_confidence, classifier, args.repeat)
+    batched_ms = _time_per_call(compute_confidence, classifier, args.repeat)
+
+    for name, timings in [('legacy', legacy_ms), ('batched', batched_ms)]:
+        print(f"{name:>8}: p50 {np.percentile(timings, 50):.3f} ms | p99 {np.percentile(timings, 99):.3f} ms")
+    speedup = np.median(legacy_ms) / np.median(batched_ms)
+    print(f"Per-transaction latency dropped {speedup:.1f}x "
+          f"({np.median(legacy_ms) - np.median(batched_ms):.3f} ms saved at p50)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare the calibrated ensemble serving path with its base learners and with scikit-learn.
+
+For every calibrated artifact this times, on the same batch of synthetic features:
+
+    sklearn      the pickled object's own predict_proba (base learners one after the other)
+    serving      ensemble.ServingEnsemble.predict (base learners concurrently, vectorized calibration)
+    <learner>    each base learner of the serving path alone
+
+and reports serving time relative to the slowest single learner and to the sum of
+them. The serving path can only approach the slowest learner with at least as
+many cores as base learners.
+
+Usage:
+    python benchmarks/bench_ensemble.py [--rows 100000] [--models CalibratedEnsemble.pkl ...] [--threads 2]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ensemble import load_calibrated  # noqa: E402
+from model_registry import MODEL_DIR  # noqa: E402
+
+DEFAULT_MODELS = ('CalibratedEnsemble.pkl', 'LightGBM_calibrated.pkl', 'XGBoost_calibrated.pkl')
+
+
+def best_seconds(fn, repeats):
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_model(path, rows, repeats, threads):
+    import joblib
+
+    model = load_calibrated(path, threads=threads)
+    reference = joblib.load(path)
+    batch = np.random.default_rng(0).standard_normal((rows, model.n_features_in_))
+    if model.feature_names is not None:
+        import pandas as pd
+
+        batch = pd.DataFrame(batch, columns=model.feature_names)
+    matrix = model.prepare(batch)
+
+    timings = {
+        'sklearn': best_seconds(lambda: reference.predict_proba(batch), repeats),
+        'serving': best_seconds(lambda: model.predict(batch), repeats)
+    }
+    learners = {learner.name: best_seconds(lambda: learner.predict(matrix), repeats) for learner in model.learners}
+    model.close()
+    return timings, learners
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=None, help="OpenMP threads per base learner")
+    parser.add_argument('--models', nargs='+', default=list(DEFAULT_MODELS))
+    args = parser.parse_args()
+
+    # Pickles from older library versions warn on every load and predict
+    warnings.simplefilter('ignore')
+    for name in args.models:
+        timings, learners = bench_model(os.path.join(MODEL_DIR, name), args.rows, args.repeats, args.threads)
+        slowest, total = max(learners.values()), sum(learners.values())
+        print(f"{name}: sklearn {args.rows / timings['sklearn']:,.0f} rows/s | "
+              f"serving {args.rows / timings['serving']:,.0f} rows/s "
+              f"({timings['serving'] / slowest:.2f}x slowest learner, {timings['serving'] / total:.2f}x their sum)")
+        for learner, seconds in learners.items():
+            print(f"  {learner:>16}: {args.rows / seconds:,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Benchmark every model artifact in Streamlit/models/ on synthetic MomtSim transactions.
+
+For each artifact (run in its own process so peak memory is per model) this reports:
+
+    single       p50/p95/p99 latency of preprocess_transaction, predict_with_confidence,
+                 calculate_risk_factors and the three together, one transaction at a time
+    batch        rows/s of preprocess_transactions + one predict call at several batch sizes
+    confidence   per-transaction cost of each confidence approach (matrix build, base
+                 prediction, perturbation rows, masked rows, staged tree variance and
+                 TreeSHAP contributions)
+    memory       peak resident set size of the benchmark process
+
+Boosters that cannot score the MomtSim features get an error and no timings (their
+transactions would only measure the rule-based fallback). Pickled scikit-learn wrappers are trained on 30 engineered features the MomtSim
+columns do not provide, so only their predict_proba batch throughput is measured
+(on synthetic features of the right width). Results are written as JSON, keyed by
+artifact, together with the git commit, so runs can be diffed between commits.
+
+Usage:
+    python benchmarks/bench_models.py [--output bench_models.json] [--transactions 500] [--models 3momtsim_fraud_model.bin ...]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from preprocessing import MOMTSIM_COLUMNS  # noqa: E402
+
+BATCH_SIZES = (1, 64, 1024, 16384)
+
+# Roughly the MomtSim type mix
+TYPE_WEIGHTS = {'PAYMENT': 0.35, 'TRANSFER': 0.25, 'WITHDRAWAL': 0.2, 'DEPOSIT': 0.15, 'DEBIT': 0.05}
+
+
+def synthetic_transactions(n, seed=0):
+    """MomtSim-shaped transactions with plausible amounts, balances and account IDs"""
+    rng = np.random.default_rng(seed)
+    amount = np.round(rng.lognormal(mean=10.5, sigma=1.5, size=n), 2)
+    old_init = np.round(amount * rng.uniform(0.5, 3.0, n), 2)
+    # A tenth of senders empty their account, as in the fraud pattern the app flags
+    emptied = rng.random(n) < 0.1
+    new_init = np.where(emptied, 0.0, np.maximum(old_init - amount, 0.0))
+    old_rec = np.round(rng.lognormal(mean=10.0, sigma=2.0, size=n), 2)
+
+    return pd.DataFrame({
+        'step': rng.integers(1, 721, n),
+        'transactionType': rng.choice(list(TYPE_WEIGHTS), size=n, p=list(TYPE_WEIGHTS.values())),
+        'amount': amount,
+        'initiator': np.char.add('2567', rng.integers(10_000_000, 99_999_999, n).astype(str)),
+        'oldBalInitiator': old_init,
+        'newBalInitiator': new_init,
+        'recipient': np.char.add('M', rng.integers(100_000, 999_999, n).astype(str)),
+        'oldBalRecipient': old_rec,
+        'newBalRecipient': old_rec + amount
+    })[MOMTSIM_COLUMNS]
+
+
+def _percentiles(timings_s):
+    timings_ms = np.asarray(timings_s) * 1000
+    return {f'p{q}_ms': float(np.percentile(timings_ms, q)) for q in (50, 95, 99)}
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_single(classifier, transactions):
+    from preprocessing import preprocess_transaction
+    from scoring import calculate_risk_factors, predict_with_confidence
+
+    timings = {'preprocess': [], 'predict_with_confidence': [], 'risk_factors': [], 'total': []}
+    methods = {}
+    for row in transactions.itertuples(index=False):
+        features, preprocess_s = _timed(preprocess_transaction, *row)
+        prediction, predict_s = _timed(predict_with_confidence, classifier, features)
+        _, factors_s = _timed(calculate_risk_factors, row.transactionType, row.amount,
+                              row.oldBalInitiator, row.newBalInitiator)
+
+        timings['preprocess'].append(preprocess_s)
+        timings['predict_with_confidence'].append(predict_s)
+        timings['risk_factors'].append(factors_s)
+        timings['total'].append(preprocess_s + predict_s + factors_s)
+        methods[prediction[2]] = methods.get(prediction[2], 0) + 1
+
+    return {**{stage: _percentiles(values) for stage, values in timings.items()}, 'methods': methods}
+
+
+def bench_confidence(classifier, transactions):
+    """Median per-transaction cost of each piece of the confidence computation"""
+    from confidence import build_confidence_matrix, feature_contributions, has_contributions, tree_variance_predictions
+    from preprocessing import preprocess_transaction
+
+    parts = {'build_matrix': [], 'base_prediction': [], 'perturbation': [], 'masking': [], 'tree_variance': []}
+    if has_contributions(classifier):
+        parts['contributions'] = []
+    for row in transactions.itertuples(index=False):
+        (matrix, num_perturbed), build_s = _timed(build_confidence_matrix, preprocess_transaction(*row))
+        parts['build_matrix'].append(build_s)
+        parts['base_prediction'].append(_timed(classifier.inplace_predict, matrix[:1])[1])
+        parts['perturbation'].append(_timed(classifier.inplace_predict, matrix[1:1 + num_perturbed])[1])
+        parts['masking'].append(_timed(classifier.inplace_predict, matrix[1 + num_perturbed:])[1])
+        parts['tree_variance'].append(_timed(tree_variance_predictions, classifier, matrix[:1])[1])
+        if 'contributions' in parts:
+            parts['contributions'].append(_timed(feature_contributions, classifier, matrix[:1])[1])
+
+    return {part: float(np.median(values) * 1000) for part, values in parts.items()}
+
+
+def bench_batch(predict, make_batch, min_seconds=0.5):
+    results = {}
+    for size in BATCH_SIZES:
+        batch = make_batch(size)
+        rows = calls = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_seconds:
+            predict(batch)
+            rows += size
+            calls += 1
+        elapsed = time.perf_counter() - start
+        results[str(size)] = {'rows_per_second': rows / elapsed, 'ms_per_call': elapsed / calls * 1000}
+    return results
+
+
+def bench_artifact(name, num_transactions):
+    """Benchmark one artifact in this process"""
+    from model_registry import ModelRegistry, artifact_format, is_servable
+    from preprocessing import preprocess_transactions
+
+    registry = ModelRegistry()
+    result = {'format': artifact_format(registry.path(name))}
+    try:
+        model, load_s = _timed(registry.get, name)
+    except Exception as e:
+        result['error'] = f"load failed: {e!r}"
+        return result
+    result['load_ms'] = load_s * 1000
+
+    transactions = synthetic_transactions(max(num_transactions, max(BATCH_SIZES)))
+    if is_servable(model):
+        sample = transactions.head(num_transactions)
+        try:
+            # predict_with_confidence falls back to rules when the model raises, so score the
+            # sample first rather than time the fallback as this model's latency
+            model.inplace_predict(preprocess_transactions(sample))
+            timings = {'single': bench_single(model, sample), 'confidence': bench_confidence(model, sample),
+                       'batch': bench_batch(lambda batch: model.inplace_predict(preprocess_transactions(batch)),
+                                            lambda size: transactions.head(size))}
+        except Exception as e:
+            # e.g. boosters trained on a different feature set; no timings are reported for them
+            result['error'] = f"model cannot score MomtSim features: {e!r}"
+        else:
+            result.update(timings)
+    else:
+        num_features = getattr(model, 'n_features_in_', None)
+        if num_features is None:
+            result['error'] = "not servable and input width unknown"
+        else:
+            rng = np.random.default_rng(0)
+            result['batch'] = bench_batch(model.predict_proba,
+                                          lambda size: rng.standard_normal((size, num_features)).astype(np.float32))
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mb'] = peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summary_line(name, result):
+    if 'single' not in result and 'batch' not in result:
+        return f"{name:<28} {result.get('error', 'skipped')}"
+    parts = []
+    if 'single' in result:
+        total = result['single']['total']
+        parts.append(f"single p50 {total['p50_ms']:.2f} / p99 {total['p99_ms']:.2f} ms")
+    if 'batch' in result:
+        largest = str(max(BATCH_SIZES))
+        parts.append(f"batch {result['batch'][largest]['rows_per_second']:,.0f} rows/s")
+    parts.append(f"peak {result['peak_rss_mb']:.0f} MB")
+    if 'error' in result:
+        parts.append(result['error'][:60])
+    return f"{name:<28} " + " | ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default='bench_models.json', help="JSON results file")
+    parser.add_argument('--transactions', type=int, default=500, help="Transactions for the single-row timings")
+    parser.add_argument('--models', nargs='*', help="Artifact names (defaults to everything in models/)")
+    parser.add_argument('--artifact', help=argparse.SUPPRESS)  # child-process mode
+    args = parser.parse_args()
+
+    if args.artifact:
+        json.dump(bench_artifact(args.artifact, args.transactions), sys.stdout)
+        return
+
+    from model_registry import ModelRegistry
+
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'transactions': args.transactions,
+        'batch_sizes': list(BATCH_SIZES),
+        'artifacts': {}
+    }
+    for name in args.models or ModelRegistry().names():
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--artifact', name, '--transactions', str(args.transactions)],
+            capture_output=True, text=True
+        )
+        if completed.returncode == 0:
+            result = json.loads(completed.stdout)
+        else:
+            result = {'error': completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'crashed'}
+        report['artifacts'][name] = result
+        print(_summary_line(name, result), flush=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Measure how ScoringPool throughput scales with worker processes.
+
+For each process count, a pool is started once and timed on:
+
+    confidence  predict_with_confidence_batch over --transactions synthetic transactions
+    predict     inplace_predict over --rows synthetic rows (the batch_scoring path)
+
+The in-process booster is measured as the 0-process baseline. Throughput can only
+scale up to the number of physical cores.
+
+Usage:
+    python benchmarks/bench_pool.py [--processes 1 2 4 8] [--compiled] [--json pool.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import ModelRegistry  # noqa: E402
+from preprocessing import MODEL_FEATURE_INDEX, TYPE_MAPPING, preprocess_transaction  # noqa: E402
+from scoring import predict_with_confidence_batch  # noqa: E402
+from scoring_pool import ScoringPool  # noqa: E402
+
+TYPES = list(TYPE_MAPPING)
+
+
+def synthetic_features(count, seed=0):
+    rng = np.random.default_rng(seed)
+    features = []
+    for _ in range(count):
+        old_balance = float(rng.uniform(0, 1e6))
+        amount = float(rng.uniform(1, old_balance + 1))
+        features.append(preprocess_transaction(
+            int(rng.integers(1, 744)), TYPES[rng.integers(0, len(TYPES))], amount, '256700000001',
+            old_balance, max(0.0, old_balance - amount), 'M192000', 0.0, amount
+        ))
+    return features
+
+
+def measure(classifier, features, rows, repeats):
+    confidence_seconds = predict_seconds = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict_with_confidence_batch(classifier, features)
+        confidence_seconds = min(confidence_seconds, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        classifier.inplace_predict(rows)
+        predict_seconds = min(predict_seconds, time.perf_counter() - start)
+    return {
+        'confidence_tps': len(features) / confidence_seconds,
+        'predict_rows_per_second': len(rows) / predict_seconds
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--transactions', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--compiled', action='store_true', help="Share compiled node arrays (one copy) instead of the booster (one copy per worker)")
+    parser.add_argument('--json', default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    booster = ModelRegistry().get()
+    features = synthetic_features(args.transactions)
+    rows = np.repeat(np.array([[f[i] for i in MODEL_FEATURE_INDEX] for f in features], dtype=np.float32),
+                     -(-args.rows // len(features)), axis=0)[:args.rows]
+
+    results = {'in_process': measure(booster, features, rows, args.repeats)}
+    for processes in sorted(set(args.processes)):
+        with ScoringPool(booster, processes, compiled=args.compiled) as pool:
+            results[f'{processes}_processes'] = measure(pool, features, rows, args.repeats)
+
+    baseline = results['in_process']
+    for name, result in results.items():
+        print(f"{name:>14}: {result['confidence_tps']:>8,.0f} tx/s with confidence "
+              f"({result['confidence_tps'] / baseline['confidence_tps']:.2f}x) | "
+              f"{result['predict_rows_per_second']:>10,.0f} rows/s "
+              f"({result['predict_rows_per_second'] / baseline['predict_rows_per_second']:.2f}x)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Load-test a running scoring service (python service.py) and report client-side latency.
+
+Usage:
+    python benchmarks/bench_service.py [--url http://127.0.0.1:8000] [--requests 2000] [--concurrency 8]
+"""
+import argparse
+import http.client
+import json
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Same shape the dashboard form posts
+SAMPLE_PAYLOAD = {
+    'step': '1',
+    'type': 'TRANSFER',
+    'amount': '300000',
+    'nameOrig': '256700000001',
+    'oldbalanceOrg': '400000',
+    'newbalanceOrig': '100000',
+    'nameDest': 'M192000',
+    'oldbalanceDest': '100000',
+    'newbalanceDest': '400000'
+}
+
+
+def _worker(url, count):
+    parsed = urllib.parse.urlparse(url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80)
+    body = json.dumps(SAMPLE_PAYLOAD)
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        connection.request('POST', '/predict', body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status != 200:
+            raise SystemExit(f"Request failed with HTTP {response.status}")
+    connection.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    per_worker = max(1, args.requests // args.concurrency)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(_worker, [args.url] * args.concurrency, [per_worker] * args.concurrency))
+    elapsed = time.perf_counter() - start
+
+    timings = np.concatenate(results)
+    print(f"{len(timings)} requests, concurrency {args.concurrency}: "
+          f"p50 {np.percentile(timings, 50):.2f} ms | p99 {np.percentile(timings, 99):.2f} ms | "
+          f"{len(timings) / elapsed:,.0f} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+"""
+Compiled-tree inference for XGBoost boosters.
+
+compile_booster() exports every tree of a booster into flat NumPy node arrays.
+Each tree is padded to a complete binary tree of the ensemble's maximum depth,
+so node i's children are always 2i+1 and 2i+2: the arrays per tree are the split
+feature, threshold and missing-value direction of every internal node, plus the
+value (and original node id) of every leaf slot. A leaf that ends early is
+replicated into all the slots below it, so every row takes exactly max_depth
+steps and the traversal is a fixed loop of vectorized gathers over all
+(row, tree) pairs at once.
+
+Margins are accumulated tree by tree in float32 like XGBoost does, so they match
+Booster.predict(output_margin=True) to float32 rounding.
+
+predict_contribs() gives the same path-dependent TreeSHAP contributions as
+Booster.predict(pred_contribs=True), from per-leaf path tables built at compile
+time out of the node covers: for every real leaf, the split taken at each step
+down to it and, per distinct feature on that path, the share of the training
+cover that follows the path. The TreeSHAP path polynomial is then evaluated for
+all (row, leaf) pairs at once, one vectorized step per path depth, so the
+confidence engine's sensitivity tier is the same whichever way a model is served.
+
+A compiled model is saved as a plain .npz file and loads with NumPy alone, so a
+serving process that only uses compiled models never imports xgboost.
+
+Usage:
+    python compiled_model.py models/3momtsim_fraud_model.bin [models/3momtsim_fraud_model.npz] [--verify]
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+LOGISTIC_OBJECTIVES = ('binary:logistic', 'reg:logistic')
+
+# Padding doubles the slots per level, so very deep trees are better left to XGBoost
+MAX_COMPILED_DEPTH = 16
+
+# Largest margin difference from Booster.predict accepted by --verify
+MARGIN_ATOL = 1e-5
+
+# TreeSHAP path tables of a CompiledBooster, one row per real leaf (see _path_tables)
+PATH_ARRAYS = ('path_feature', 'path_threshold', 'path_default_right', 'path_right', 'path_element',
+               'element_feature', 'element_cover', 'path_leaf_value')
+
+
+def _tree_depth(left, right, node=0):
+    if left[node] < 0:
+        return 0
+    return 1 + max(_tree_depth(left, right, left[node]), _tree_depth(left, right, right[node]))
+
+
+def _path_tables(trees, depth):
+    """
+    TreeSHAP tables of every real leaf, padded to depth steps:
+        path_feature / path_threshold / path_default_right  split tested at each step
+        path_right                                          branch the path takes there
+        path_element                                        distinct feature (element) the step belongs to, -1 for padding
+        element_feature                                     feature of each element, -1 for padding
+        element_cover                                       cover share following the path, over the element's splits
+        path_leaf_value                                     the leaf's output
+    plus the expected margin of the trees (cover-weighted leaf average, XGBoost's bias term)
+    """
+    leaves = []
+    for tree in trees:
+        left, right, cover = tree['left_children'], tree['right_children'], tree['sum_hessian']
+        stack = [(0, [])]
+        while stack:
+            node, steps = stack.pop()
+            if left[node] < 0:
+                leaves.append((steps, tree['split_conditions'][node]))
+                continue
+            for child, went_right in ((left[node], False), (right[node], True)):
+                ratio = cover[child] / cover[node] if cover[node] > 0 else 0.0
+                stack.append((child, steps + [(node, tree, went_right, ratio)]))
+
+    tables = {
+        'path_feature': np.zeros((len(leaves), depth), dtype=np.intp),
+        'path_threshold': np.zeros((len(leaves), depth), dtype=np.float32),
+        'path_default_right': np.zeros((len(leaves), depth), dtype=bool),
+        'path_right': np.zeros((len(leaves), depth), dtype=bool),
+        'path_element': np.full((len(leaves), depth), -1, dtype=np.int8),
+        'element_feature': np.full((len(leaves), depth), -1, dtype=np.intp),
+        'element_cover': np.ones((len(leaves), depth), dtype=np.float64),
+        'path_leaf_value': np.zeros(len(leaves), dtype=np.float32)
+    }
+    expected_margin = 0.0
+    for k, (steps, value) in enumerate(leaves):
+        elements = []
+        for i, (node, tree, went_right, ratio) in enumerate(steps):
+            feature = tree['split_indices'][node]
+            if feature not in elements:
+                elements.append(feature)
+            element = elements.index(feature)
+            tables['path_feature'][k, i] = feature
+            tables['path_threshold'][k, i] = tree['split_conditions'][node]
+            tables['path_default_right'][k, i] = not tree['default_left'][node]
+            tables['path_right'][k, i] = went_right
+            tables['path_element'][k, i] = element
+            tables['element_feature'][k, element] = feature
+            tables['element_cover'][k, element] *= ratio
+        tables['path_leaf_value'][k] = value
+        expected_margin += value * np.prod([ratio for *_, ratio in steps])
+    return tables, expected_margin
+
+
+class CompiledBooster:
+    """Complete-binary-tree ensemble with the subset of the Booster API the scoring code uses"""
+
+    def __init__(self, feature, threshold, default_right, leaf_value, leaf_node,
+                 iteration_indptr, base_margin, objective, feature_names=None, num_features=None,
+                 expected_margin=None, **path_tables):
+        # Internal nodes: (n_trees, 2**depth - 1); leaf slots: (n_trees, 2**depth)
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.default_right = np.asarray(default_right, dtype=bool)
+        self.leaf_value = np.asarray(leaf_value, dtype=np.float32)
+        self.leaf_node = np.asarray(leaf_node, dtype=np.int32)
+        self.iteration_indptr = np.asarray(iteration_indptr, dtype=np.int64)
+        self.base_margin = np.float32(base_margin)
+        self.objective = str(objective)
+        self.feature_names = list(feature_names) if feature_names is not None and len(feature_names) else None
+        self.num_features = int(num_features)
+
+        self.num_trees, self.num_internal = self.feature.shape
+        self.max_depth = int(np.log2(self.leaf_value.shape[1]))
+        self._tree_base = np.arange(self.num_trees, dtype=np.intp) * self.num_internal
+        self._leaf_base = np.arange(self.num_trees, dtype=np.intp) * self.leaf_value.shape[1]
+
+        # TreeSHAP path tables (absent from .npz files compiled before predict_contribs existed)
+        self.expected_margin = None if expected_margin is None else float(expected_margin)
+        self.path_tables = {name: np.asarray(path_tables[name]) for name in PATH_ARRAYS if name in path_tables}
+        self._element_onehot = None
+
+    @classmethod
+    def from_json(cls, model):
+        """Build from a booster's JSON model (bytes, str or the parsed dict)"""
+        if not isinstance(model, dict):
+            model = json.loads(model)
+        learner = model['learner']
+        gbtree = learner['gradient_booster']['model']
+        trees = gbtree['trees']
+
+        if any(split_type != 0 for tree in trees for split_type in tree['split_type']):
+            raise ValueError("Categorical splits are not supported by compiled inference")
+        depth = max(_tree_depth(tree['left_children'], tree['right_children']) for tree in trees)
+        if depth > MAX_COMPILED_DEPTH:
+            raise ValueError(f"Trees of depth {depth} are too deep to compile (max {MAX_COMPILED_DEPTH})")
+
+        num_internal, num_leaves = 2 ** depth - 1, 2 ** depth
+        feature = np.zeros((len(trees), num_internal), dtype=np.intp)
+        threshold = np.zeros((len(trees), num_internal), dtype=np.float32)
+        default_right = np.zeros((len(trees), num_internal), dtype=bool)
+        leaf_value = np.zeros((len(trees), num_leaves), dtype=np.float32)
+        leaf_node = np.zeros((len(trees), num_leaves), dtype=np.int32)
+
+        for k, tree in enumerate(trees):
+            left, right = tree['left_children'], tree['right_children']
+            stack = [(0, 0)]  # (original node, slot in the complete tree)
+            while stack:
+                node, slot = stack.pop()
+                if slot >= num_internal:
+                    leaf_value[k, slot - num_internal] = tree['split_conditions'][node]
+                    leaf_node[k, slot - num_internal] = node
+                elif left[node] < 0:
+                    # Early leaf: both children repeat it, so the split below never matters
+                    stack.extend([(node, 2 * slot + 1), (node, 2 * slot + 2)])
+                else:
+                    feature[k, slot] = tree['split_indices'][node]
+                    threshold[k, slot] = tree['split_conditions'][node]
+                    default_right[k, slot] = not tree['default_left'][node]
+                    stack.extend([(left[node], 2 * slot + 1), (right[node], 2 * slot + 2)])
+
+        base_score = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+        objective = learner['objective']['name']
+        base_margin = np.log(base_score / (1 - base_score)) if objective in LOGISTIC_OBJECTIVES else base_score
+        path_tables, expected_margin = _path_tables(trees, depth)
+
+        return cls(
+            feature, threshold, default_right, leaf_value, leaf_node, gbtree['iteration_indptr'],
+            base_margin, objective, learner.get('feature_names'),
+            int(learner['learner_model_param']['num_feature']), expected_margin, **path_tables
+        )
+
+    def num_boosted_rounds(self):
+        return len(self.iteration_indptr) - 1
+
+    def _as_matrix(self, data):
+        matrix = np.ascontiguousarray(data, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.shape[1] != self.num_features:
+            raise ValueError(f"Model expects {self.num_features} features, got {matrix.shape[1]}")
+        return matrix
+
+    def _leaf_positions(self, matrix):
+        """Flat index into leaf_value / leaf_node reached for every row and tree, shape (n_rows, n_trees)"""
+        values = matrix.ravel()
+        has_missing = np.isnan(values).any()
+        feature, threshold, default_right = self.feature.ravel(), self.threshold.ravel(), self.default_right.ravel()
+
+        # Positions index the flattened (n_trees, num_internal) arrays; the children of
+        # tree_base + i are tree_base + 2i + 1 and + 2i + 2, i.e. 2 * position + child_offset (+1)
+        position = np.repeat(self._tree_base[None, :], len(matrix), axis=0)
+        child_offset = 1 - self._tree_base
+        row_base = np.arange(len(matrix), dtype=np.intp)[:, None] * self.num_features if len(matrix) > 1 else 0
+
+        for _ in range(self.max_depth):
+            x = values.take(feature.take(position) + row_base)
+            go_right = x >= threshold.take(position)
+            if has_missing:
+                go_right |= np.isnan(x) & default_right.take(position)
+            position = position * 2 + child_offset
+            position += go_right
+        return position + (self._leaf_base - self._tree_base - self.num_internal)
+
+    def predict_leaf(self, data):
+        """Leaf node id (numbered within its tree, like pred_leaf) for every row and tree"""
+        return self.leaf_node.ravel().take(self._leaf_positions(self._as_matrix(data)))
+
+    def predict_margin(self, data):
+        """Raw margins, accumulated tree by tree in float32"""
+        matrix = self._as_matrix(data)
+        contributions = np.empty((len(matrix), self.num_trees + 1), dtype=np.float32)
+        contributions[:, 0] = self.base_margin
+        contributions[:, 1:] = self.leaf_value.ravel().take(self._leaf_positions(matrix))
+        return np.cumsum(contributions, axis=1, dtype=np.float32)[:, -1]
+
+    def inplace_predict(self, data, predict_type='value'):
+        """Same outputs as Booster.inplace_predict for binary and regression objectives"""
+        margin = self.predict_margin(data)
+        if predict_type == 'margin' or self.objective not in LOGISTIC_OBJECTIVES:
+            return margin
+        return (1 / (1 + np.exp(-margin))).astype(np.float32)
+
+    def predict_contribs(self, data):
+        """
+        Exact TreeSHAP contributions like Booster.predict(pred_contribs=True)
+        Returns: (n_rows, num_features + 1) float32, the last column being the bias
+        """
+        if not self.path_tables:
+            raise ValueError("Model was compiled without TreeSHAP tables; recompile it with compiled_model.py")
+        tables = self.path_tables
+        matrix = self._as_matrix(data)
+        depth = tables['path_feature'].shape[1]
+        if self._element_onehot is None:
+            # Element e of every leaf -> its feature column, so shares sum per feature with one matmul
+            onehot = np.zeros((depth, len(tables['path_leaf_value']), self.num_features + 1))
+            element, leaf = np.nonzero(tables['element_feature'].T >= 0)
+            onehot[element, leaf, tables['element_feature'].T[element, leaf]] = 1.0
+            self._element_onehot = onehot
+
+        # Bit e set where the row leaves the leaf's path at one of element e's splits: (n_rows, n_leaves)
+        x = matrix[:, tables['path_feature']]
+        go_right = x >= tables['path_threshold']
+        go_right |= np.isnan(x) & tables['path_default_right']
+        # One bit per element, and a path has up to depth of them
+        mask_dtype = next(dtype for dtype in (np.uint8, np.uint16, np.uint32, np.uint64)
+                          if np.iinfo(dtype).bits >= depth)
+        left_path = np.zeros(x.shape[:2], dtype=mask_dtype)
+        for step in range(depth):
+            element = tables['path_element'][:, step]
+            bits = np.where(element >= 0, np.left_shift(mask_dtype(1), element.clip(0).astype(mask_dtype)), 0)
+            bits = bits.astype(mask_dtype)
+            left_path |= np.where(go_right[..., step] == tables['path_right'][:, step], 0, bits)
+
+        # Element-first layout keeps every step below a contiguous (n_rows, n_leaves) operation
+        one = [((left_path >> mask_dtype(element) & 1) == 0).astype(np.float64) for element in range(depth)]
+        zero = np.ascontiguousarray(tables['element_cover'].T)
+
+        # EXTEND: permutation weights of the path subsets, element 0 being the root's dummy
+        weights = [np.ones(left_path.shape)] + [np.zeros(left_path.shape) for _ in range(depth)]
+        for length in range(1, depth + 1):
+            element_one, element_zero = one[length - 1], zero[length - 1]
+            for j in range(length, -1, -1):
+                extended = element_zero * weights[j] * ((length - j) / (length + 1)) if j < length else 0.0
+                if j:
+                    extended = extended + element_one * weights[j - 1] * (j / (length + 1))
+                weights[j] = extended
+
+        # UNWIND: each element's share, weighted by how its own fraction moves the leaf value
+        contributions = np.zeros((len(matrix), self.num_features + 1))
+        for element in range(depth):
+            element_one, element_zero = one[element], zero[element]
+            following = element_one != 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                inverse_zero = np.where(element_zero != 0, 1 / element_zero, 0.0)
+            next_portion = weights[depth]
+            total = np.zeros(left_path.shape)
+            for j in range(depth - 1, -1, -1):
+                hot = next_portion * ((depth + 1) / (j + 1))
+                cold = weights[j] * inverse_zero * ((depth + 1) / (depth - j))
+                total += np.where(following, hot, cold)
+                next_portion = weights[j] - hot * element_zero * ((depth - j) / (depth + 1))
+            shares = total * (element_one - element_zero) * tables['path_leaf_value']
+            contributions += shares @ self._element_onehot[element]
+        contributions[:, -1] = self.base_margin + self.expected_margin
+        return contributions.astype(np.float32)
+
+    def staged_tree_tables(self):
+        """
+        Leaf tables in the layout confidence.tree_variance_predictions uses:
+        (leaf_values [n_trees, max_nodes], iteration_indptr, base_margin, logistic)
+        """
+        leaf_values = np.zeros((self.num_trees, self.leaf_node.max() + 1), dtype=np.float32)
+        leaf_values[np.arange(self.num_trees)[:, None], self.leaf_node] = self.leaf_value
+        return leaf_values, self.iteration_indptr, self.base_margin, self.objective in LOGISTIC_OBJECTIVES
+
+    def save(self, path):
+        """Write the node arrays to an .npz file (loadable without pickle or xgboost)"""
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(
+                f, feature=self.feature.astype(np.int32), threshold=self.threshold,
+                default_right=self.default_right, leaf_value=self.leaf_value, leaf_node=self.leaf_node,
+                iteration_indptr=self.iteration_indptr, base_margin=self.base_margin,
+                objective=np.array(self.objective), feature_names=np.array(self.feature_names or [], dtype=str),
+                num_features=np.int64(self.num_features),
+                **({'expected_margin': np.float64(self.expected_margin), **self.path_tables} if self.path_tables else {})
+            )
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            path_tables = {name: arrays[name] for name in PATH_ARRAYS if name in arrays.files}
+            return cls(
+                arrays['feature'], arrays['threshold'], arrays['default_right'], arrays['leaf_value'],
+                arrays['leaf_node'], arrays['iteration_indptr'], arrays['base_margin'],
+                arrays['objective'].item(), arrays['feature_names'].tolist(), arrays['num_features'].item(),
+                arrays['expected_margin'].item() if 'expected_margin' in arrays.files else None, **path_tables
+            )
+
+
+def compile_booster(classifier):
+    """Compile an xgb.Booster into a CompiledBooster"""
+    return CompiledBooster.from_json(bytes(classifier.save_raw('json')))
+
+
+def _verification_rows(compiled, rows, seed):
+    rng = np.random.default_rng(seed)
+    thresholds = compiled.threshold.ravel()
+    # Sample around the real split points so every branch gets exercised
+    data = rng.choice(thresholds, size=(rows, compiled.num_features)) * rng.uniform(0.9, 1.1, (rows, compiled.num_features))
+    data = data.astype(np.float32)
+    data[rng.random(data.shape) < 0.01] = np.nan
+    return data
+
+
+def max_margin_difference(classifier, compiled, rows=10000, seed=0):
+    """Largest |margin| gap between the booster and its compiled form on random rows"""
+    data = _verification_rows(compiled, rows, seed)
+    expected = classifier.inplace_predict(data, predict_type='margin')
+    return float(np.max(np.abs(expected - compiled.predict_margin(data))))
+
+
+def max_contribution_difference(classifier, compiled, rows=2000, seed=0):
+    """Largest TreeSHAP contribution gap between the booster and its compiled form on random rows"""
+    import xgboost as xgb
+
+    data = _verification_rows(compiled, rows, seed)
+    expected = classifier.predict(xgb.DMatrix(data, feature_names=classifier.feature_names), pred_contribs=True)
+    return float(np.max(np.abs(expected - compiled.predict_contribs(data))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile an XGBoost model into flat NumPy node arrays")
+    parser.add_argument('model', help="Native XGBoost model file")
+    parser.add_argument('output', nargs='?', help="Destination .npz (defaults to the model path with .npz)")
+    parser.add_argument('--verify', action='store_true',
+                        help="Check margins and TreeSHAP contributions against Booster.predict")
+    args = parser.parse_args()
+
+    import xgboost as xgb
+
+    classifier = xgb.Booster()
+    classifier.load_model(args.model)
+    compiled = compile_booster(classifier)
+
+    output = args.output or os.path.splitext(args.model)[0] + '.npz'
+    compiled.save(output)
+    print(f"Compiled {compiled.num_trees} trees (depth {compiled.max_depth}) to {output}")
+
+    if args.verify:
+        loaded = CompiledBooster.load(output)
+        difference = max_margin_difference(classifier, loaded)
+        contribution_difference = max_contribution_difference(classifier, loaded)
+        print(f"Max margin difference vs Booster.predict: {difference:.3g}, "
+              f"max contribution difference: {contribution_difference:.3g}")
+        if max(difference, contribution_difference) > MARGIN_ATOL:
+            raise SystemExit(f"Compiled model differs by more than {MARGIN_ATOL}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+"""
+Batched confidence engine for the MomtSim XGBoost model.
+
+The confidence score combines four approaches (probability distance, tree
+variance, sensitivity and feature masking). Instead of building a one-row
+DataFrame and calling the booster once per variant, every variant row is
+stacked into a single contiguous float32 matrix and scored in one call.
+
+XGBoost's exact TreeSHAP contributions (pred_contribs) are computed on the same
+DMatrix as the pred_leaf pass and returned in the breakdown to explain the score;
+compiled models compute the same contributions from their node covers
+(CompiledBooster.predict_contribs). They do not feed the confidence score:
+sensitivity stays the ±5% perturbation measure, so decisions are unchanged.
+
+In tiered mode (FRAUDGUARD_CONFIDENCE=tiered, or configure(tiered=True)) every
+transaction is first scored on its base row alone. When the probability
+distance by itself settles the decision, the expensive tiers (tree variance,
+perturbation sensitivity and feature masking) are skipped; they only run for
+scores inside the uncertain band around the decision thresholds. The
+breakdown's 'tiers' entry lists the tiers that ran.
+"""
+import json
+import os
+import weakref
+
+import numpy as np
+
+import metrics
+from preprocessing import FEATURE_COLUMNS, MODEL_FEATURE_INDEX
+
+# Sensitivity: perturb every non-zero feature by ±5%
+PERTURBATION_FACTORS = (0.95, 1.05)
+
+# (feature index, neutral value): mask step, initiator ID and recipient ID
+FEATURE_MASKS = [(0, 1), (3, 0), (6, 0)]
+
+# Per-booster leaf tables for the staged tree-variance approach
+_STAGED_TABLES = weakref.WeakKeyDictionary()
+
+# Base score and probability distance, then the three tiers that score extra rows
+CONFIDENCE_TIERS = ('base', 'tree_variance', 'sensitivity', 'masking')
+
+# Fraud score thresholds of scoring.recommend and scoring.risk_level
+DECISION_THRESHOLDS = (0.3, 0.4, 0.7)
+
+# recommend() only decides automatically at 70%+ confidence, which probability
+# distance alone reaches at fraud scores of 0.15 and 0.85
+AUTO_DECISION_CONFIDENCE = 0.7
+
+# Half-width of the uncertain band around every decision boundary
+DEFAULT_UNCERTAIN_BAND = 0.05
+
+# A booster call costs far more than a few extra rows, so small tiered batches
+# score every variant row up front; from this size on the base rows are scored
+# alone first and only uncertain transactions get their variant rows scored
+TIERED_BASE_FIRST_MIN_BATCH = 8
+
+_tiered = os.environ.get('FRAUDGUARD_CONFIDENCE', 'full') == 'tiered'
+_uncertain_band = float(os.environ.get('FRAUDGUARD_UNCERTAIN_BAND', DEFAULT_UNCERTAIN_BAND))
+
+CONFIDENCE_WEIGHTS = {
+    'probability_distance': 0.3,
+    'tree_variance': 0.25,
+    'sensitivity': 0.25,
+    'ensemble_consistency': 0.2
+}
+
+
+def configure(tiered=None, uncertain_band=None):
+    """Set the process-wide confidence mode; arguments left as None are unchanged"""
+    global _tiered, _uncertain_band
+    if tiered is not None:
+        _tiered = bool(tiered)
+    if uncertain_band is not None:
+        if uncertain_band < 0:
+            raise ValueError("uncertain_band must be non-negative")
+        _uncertain_band = float(uncertain_band)
+
+
+def confidence_mode():
+    return {'mode': 'tiered' if _tiered else 'full', 'uncertain_band': _uncertain_band}
+
+
+def is_settled(fraud_prob, uncertain_band=DEFAULT_UNCERTAIN_BAND):
+    """
+    True when probability distance alone settles the decision: it clears the
+    auto-decision confidence bar by the band, and the score is more than the
+    band away from every fraud score threshold
+    """
+    return (abs(fraud_prob - 0.5) * 2 >= AUTO_DECISION_CONFIDENCE + 2 * uncertain_band
+            and all(abs(fraud_prob - threshold) > uncertain_band for threshold in DECISION_THRESHOLDS))
+
+
+def has_contributions(classifier):
+    """xgb.Booster computes TreeSHAP natively; models bringing their own predict_leaf need predict_contribs too"""
+    return not hasattr(classifier, 'predict_leaf') or hasattr(classifier, 'predict_contribs')
+
+
+def build_confidence_matrix(features):
+    """
+    Stack the base row, every perturbed row and every masked row into one matrix
+    Returns: (matrix, num_perturbed) where row 0 is the base transaction,
+    rows 1..num_perturbed are the perturbations and the rest are the masked rows
+    """
+    rows = [list(features)]
+
+    for i, original_val in enumerate(features):
+        if isinstance(original_val, (int, float)) and original_val != 0:
+            for perturbation in PERTURBATION_FACTORS:
+                perturbed_features = list(features)
+                perturbed_features[i] = original_val * perturbation
+                rows.append(perturbed_features)
+
+    num_perturbed = len(rows) - 1
+
+    for mask_idx, neutral_value in FEATURE_MASKS[:min(len(FEATURE_MASKS), len(features))]:
+        masked_features = list(features)
+        masked_features[mask_idx] = neutral_value
+        rows.append(masked_features)
+
+    # Values are combined in float64 first so the float32 cast rounds exactly
+    # like the per-row DataFrames did
+    matrix = np.asarray(rows, dtype=np.float64)[:, MODEL_FEATURE_INDEX]
+    return np.ascontiguousarray(matrix, dtype=np.float32), num_perturbed
+
+
+def _staged_tree_tables(classifier):
+    """
+    Leaf values of every tree (indexed by node id), round boundaries and base margin
+    Parsed from the booster's JSON dump once and cached for the booster's lifetime
+    """
+    tables = _STAGED_TABLES.get(classifier)
+    if tables is None and hasattr(classifier, 'staged_tree_tables'):
+        # Compiled models already hold their leaf values as arrays
+        tables = _STAGED_TABLES[classifier] = classifier.staged_tree_tables()
+    if tables is None:
+        learner = json.loads(classifier.save_raw('json'))['learner']
+        model = learner['gradient_booster']['model']
+        trees = model['trees']
+
+        # Leaf nodes store their output in split_conditions
+        leaf_values = np.zeros((len(trees), max(len(t['split_conditions']) for t in trees)), dtype=np.float32)
+        for k, tree in enumerate(trees):
+            leaf_values[k, :len(tree['split_conditions'])] = tree['split_conditions']
+
+        base_score = float(str(learner['learner_model_param']['base_score']).strip('[]'))
+        logistic = learner['objective']['name'] in ('binary:logistic', 'reg:logistic')
+        base_margin = np.log(base_score / (1 - base_score)) if logistic else base_score
+
+        tables = (leaf_values, np.asarray(model['iteration_indptr'], dtype=np.int64), np.float32(base_margin), logistic)
+        _STAGED_TABLES[classifier] = tables
+    return tables
+
+
+def _dmatrix(classifier, base_rows):
+    import xgboost as xgb
+
+    return xgb.DMatrix(base_rows, feature_names=classifier.feature_names)
+
+
+def tree_variance_predictions(classifier, base_rows, dmatrix=None):
+    """
+    Predictions from growing subsets of boosting rounds for each base row
+    One pred_leaf traversal gives every tree's leaf; the staged margins are a
+    running sum over the rounds, so cost is linear in num_boosted_rounds()
+    dmatrix: optional DMatrix of base_rows to reuse
+    Returns: (n_rows, n_stages) float64 array
+    """
+    leaf_values, iteration_indptr, base_margin, logistic = _staged_tree_tables(classifier)
+
+    if hasattr(classifier, 'predict_leaf'):
+        leaf_index = classifier.predict_leaf(base_rows)
+    else:
+        if dmatrix is None:
+            dmatrix = _dmatrix(classifier, base_rows)
+        leaf_index = classifier.predict(dmatrix, pred_leaf=True).astype(np.int64).reshape(len(base_rows), -1)
+    tree_margins = leaf_values[np.arange(leaf_index.shape[1]), leaf_index]
+
+    # Margin after each boosting round, accumulated in float32 like the booster does
+    round_margins = np.add.reduceat(tree_margins, iteration_indptr[:-1], axis=1)
+    margins = np.concatenate([np.full((len(base_rows), 1), base_margin, dtype=np.float32), round_margins], axis=1)
+    staged_margins = np.cumsum(margins, axis=1, dtype=np.float32)[:, 1:]
+
+    num_trees = classifier.num_boosted_rounds()
+    step = max(1, num_trees // 10)
+    end_iters = [min(i + step, num_trees) for i in range(0, num_trees, step)]
+
+    staged = staged_margins[:, np.asarray(end_iters) - 1]
+    if logistic:
+        staged = 1 / (1 + np.exp(-staged))
+    return staged.astype(np.float64)
+
+
+def feature_contributions(classifier, base_rows, dmatrix=None):
+    """
+    Exact TreeSHAP contributions of each model feature, in margin (log-odds) space
+    Returns: (n_rows, n_features + 1) array, the last column being the bias
+    """
+    if hasattr(classifier, 'predict_contribs'):
+        return classifier.predict_contribs(base_rows)
+    if dmatrix is None:
+        dmatrix = _dmatrix(classifier, base_rows)
+    return classifier.predict(dmatrix, pred_contribs=True).reshape(len(base_rows), -1)
+
+
+def contribution_shifts(contributions):
+    """
+    How far the fraud probability would move if each feature's contribution
+    were taken away, for one transaction's contribution row
+    Returns: (n_features,) array of signed probability shifts
+    """
+    contributions = np.asarray(contributions, dtype=np.float64)
+    margin = contributions.sum()
+    return 1 / (1 + np.exp(-margin)) - 1 / (1 + np.exp(-(margin - contributions[:-1])))
+
+
+def combine_confidence(confidence_scores):
+    """Weighted average of the individual confidence measures, clipped to [0, 1]"""
+    final_confidence = sum(
+        confidence_scores[method] * CONFIDENCE_WEIGHTS[method]
+        for method in CONFIDENCE_WEIGHTS if method in confidence_scores
+    )
+    return max(0.0, min(1.0, final_confidence))
+
+
+def compute_confidence(classifier, features, tiered=None, uncertain_band=None):
+    """
+    Score a preprocessed transaction and every confidence variant with one booster call
+    Returns: (fraud_probability, confidence_score, confidence_breakdown)
+    """
+    return compute_confidence_batch(classifier, [features], tiered, uncertain_band)[0]
+
+
+def compute_confidence_batch(classifier, feature_lists, tiered=None, uncertain_band=None):
+    """
+    Confidence for many preprocessed transactions with a single booster call
+    over all of their variant rows, plus one pred_leaf and one pred_contribs pass
+    over their base rows
+    tiered / uncertain_band: override the configured mode for this call
+    Returns: list of (fraud_probability, confidence_score, confidence_breakdown)
+    """
+    tiered = _tiered if tiered is None else tiered
+    uncertain_band = _uncertain_band if uncertain_band is None else uncertain_band
+
+    if tiered and len(feature_lists) >= TIERED_BASE_FIRST_MIN_BATCH:
+        return _tiered_confidence_batch(classifier, feature_lists, uncertain_band)
+
+    use_contributions = has_contributions(classifier)
+    stacked, offsets, perturbed_counts = _stack_confidence_matrices(feature_lists)
+    predictions = _score_rows(classifier, stacked)
+
+    # Small batches: the variant rows rode along in the one booster call, so tiered
+    # mode only skips the pred_leaf / pred_contribs passes and the combination for settled rows
+    full = [k for k in range(len(feature_lists))
+            if not tiered or not is_settled(predictions[offsets[k]], uncertain_band)]
+    tree_predictions, contributions = _base_row_passes(classifier, stacked[offsets[full]], use_contributions)
+
+    results = [None] * len(feature_lists)
+    with metrics.timer('confidence_combine'):
+        for j, k in enumerate(full):
+            results[k] = _confidence_from_predictions(
+                predictions[offsets[k]:offsets[k + 1]], perturbed_counts[k],
+                tree_predictions[j] if tree_predictions is not None else None,
+                contributions[j] if contributions is not None else None
+            )
+        for k in range(len(feature_lists)):
+            if results[k] is None:
+                results[k] = _fast_confidence(predictions[offsets[k]])
+    if tiered:
+        metrics.increment('confidence_fast_tier', len(feature_lists) - len(full))
+    return results
+
+
+def _tiered_confidence_batch(classifier, feature_lists, uncertain_band):
+    """Score only the base rows first, then every tier for the transactions in the uncertain band"""
+    with metrics.timer('build_matrix'):
+        base_rows = np.asarray([list(features) for features in feature_lists], dtype=np.float64)[:, MODEL_FEATURE_INDEX]
+        base_rows = np.ascontiguousarray(base_rows, dtype=np.float32)
+    base_predictions = _score_rows(classifier, base_rows)
+
+    results = [_fast_confidence(fraud_prob) for fraud_prob in base_predictions]
+    uncertain = [k for k, fraud_prob in enumerate(base_predictions) if not is_settled(fraud_prob, uncertain_band)]
+    if uncertain:
+        full_results = compute_confidence_batch(classifier, [feature_lists[k] for k in uncertain], tiered=False)
+        for k, result in zip(uncertain, full_results):
+            results[k] = result
+    metrics.increment('confidence_fast_tier', len(results) - len(uncertain))
+    return results
+
+
+def _stack_confidence_matrices(feature_lists):
+    """All transactions' variant rows in one matrix, with each transaction's row offsets"""
+    with metrics.timer('build_matrix'):
+        matrices, perturbed_counts = zip(*(build_confidence_matrix(features) for features in feature_lists))
+        offsets = np.cumsum([0] + [len(matrix) for matrix in matrices])
+        return np.concatenate(matrices), offsets, perturbed_counts
+
+
+def _score_rows(classifier, rows):
+    with metrics.timer('booster_predict'):
+        predictions = classifier.inplace_predict(rows).astype(np.float64)
+    metrics.increment('booster_calls')
+    metrics.increment('booster_rows', len(rows))
+    return predictions
+
+
+def _base_row_passes(classifier, base_rows, use_contributions):
+    """
+    Staged tree-variance predictions and TreeSHAP contributions of the base rows,
+    sharing one DMatrix; either is None when it cannot be computed
+    """
+    if not len(base_rows):
+        return None, None
+    dmatrix = tree_predictions = contributions = None
+
+    with metrics.timer('tree_variance'):
+        try:
+            if not hasattr(classifier, 'predict_leaf'):
+                dmatrix = _dmatrix(classifier, base_rows)
+            tree_predictions = tree_variance_predictions(classifier, base_rows, dmatrix)
+            metrics.increment('booster_calls')
+        except Exception:
+            metrics.increment('booster_errors')
+
+    if use_contributions:
+        with metrics.timer('contributions'):
+            try:
+                contributions = feature_contributions(classifier, base_rows, dmatrix)
+                metrics.increment('booster_calls')
+            except Exception:
+                metrics.increment('booster_errors')
+    return tree_predictions, contributions
+
+
+def _fast_confidence(fraud_prob):
+    """
+    Base tier only: the skipped measures take the probability distance, the same
+    stand-in the full path uses when one of them cannot be computed
+    """
+    fraud_prob = float(fraud_prob)
+    prob_confidence = abs(fraud_prob - 0.5) * 2
+    return fraud_prob, max(0.0, min(1.0, prob_confidence)), {
+        'probability_distance': prob_confidence,
+        'tiers': ['base']
+    }
+
+
+def _confidence_from_predictions(predictions, num_perturbed, tree_predictions, contributions=None):
+    """Derive the four confidence measures from one transaction's variant predictions"""
+    fraud_prob = float(predictions[0])
+
+    confidence_scores = {}
+
+    # Approach A: Probability-based confidence
+    prob_confidence = abs(fraud_prob - 0.5) * 2
+    confidence_scores['probability_distance'] = prob_confidence
+
+    # Approach B: Tree voting confidence across boosting-round subsets
+    if tree_predictions is not None:
+        pred_variance = np.var(tree_predictions) if len(tree_predictions) > 1 else 0
+        confidence_scores['tree_variance'] = max(0, 1 - (pred_variance * 10))
+    else:
+        confidence_scores['tree_variance'] = prob_confidence
+
+    # Approach C: Sensitivity to ±5% feature perturbations
+    try:
+        perturbed_preds = predictions[1:1 + num_perturbed]
+        perturbation_scores = np.abs(perturbed_preds - fraud_prob)
+        avg_sensitivity = np.mean(perturbation_scores) if len(perturbation_scores) else 0
+        confidence_scores['sensitivity'] = max(0, 1 - (avg_sensitivity * 5))
+    except Exception:
+        confidence_scores['sensitivity'] = prob_confidence
+
+    # Approach D: Consistency across masked feature combinations
+    try:
+        ensemble_predictions = predictions[1 + num_perturbed:]
+        ensemble_variance = np.var([fraud_prob] + ensemble_predictions.tolist()) if len(ensemble_predictions) else 0
+        confidence_scores['ensemble_consistency'] = max(0, 1 - (ensemble_variance * 8))
+    except Exception:
+        confidence_scores['ensemble_consistency'] = prob_confidence
+
+    final_confidence = combine_confidence(confidence_scores)
+    confidence_scores['tiers'] = list(CONFIDENCE_TIERS)
+    if contributions is not None:
+        confidence_scores['contributions'] = dict(zip(FEATURE_COLUMNS + ['bias'], map(float, contributions)))
+    return fraud_prob, final_confidence, confidence_scores
@@ -0,0 +1,482 @@
+"""
+Serving path for the calibrated scikit-learn artifacts in models/.
+
+CalibratedEnsemble.pkl (XGBoost, LightGBM and CatBoost, each wrapped in a
+CalibratedClassifierCV, averaged after a StandardScaler), LightGBM_calibrated.pkl
+and XGBoost_calibrated.pkl are pickles of the training notebook's objects.
+Scoring them through predict_proba runs every base learner one after the other,
+each behind scikit-learn's input validation, and calibrates them one by one.
+
+ServingEnsemble takes those objects apart once at load time:
+
+    learners     the native model of every base learner (xgb.Booster, lightgbm.Booster,
+                 CatBoostClassifier), predicting the positive-class probability
+    calibration  the isotonic thresholds (or sigmoid coefficients) of every fold as
+                 plain arrays, applied with np.interp over the whole batch
+    scaler       mean and scale of the ensemble's StandardScaler
+
+predict() scales the batch once into one float64 matrix, runs the base learners
+on it concurrently (each library releases the GIL while predicting, and the
+cores are split between them so they do not oversubscribe), then calibrates and
+averages. A batch costs about as much as the slowest base learner rather than
+the sum of all of them.
+
+Unpickling executes code from the file, is slow and gives every process its own
+copy of everything, so a ServingEnsemble can be saved as a .model directory of
+native files instead:
+
+    manifest.json        format version, feature names, learners and their files,
+                         array layout and the SHA-256 of every other file
+    arrays.npy           scaler and calibration arrays, one float64 vector,
+                         memory-mapped read-only on load
+    <learner>-<fold>.*   .ubj (XGBoost UBJSON), .txt (LightGBM model text) or
+                         .cbm (CatBoost binary), loaded by each library itself
+
+Loading checks the format version and every checksum before reading anything.
+
+The models are trained on 30 engineered features (feature_names); MomtSim
+transactions do not carry them, so the dashboard keeps scoring with the booster
+and these artifacts are served to batch jobs whose files have those columns.
+
+Usage:
+    model = load_calibrated('models/CalibratedEnsemble.pkl')
+    fraud_scores = model.predict(frame)   # DataFrame with model.feature_names, or a matrix in that order
+
+    python ensemble.py models/CalibratedEnsemble.pkl [models/CalibratedEnsemble.model] [--verify]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from model_registry import NATIVE_EXTENSION
+
+NATIVE_FORMAT = 1
+MANIFEST_FILE = 'manifest.json'
+ARRAYS_FILE = 'arrays.npy'
+
+# Model file extension of every supported library
+LIBRARY_EXTENSIONS = {'xgboost': '.ubj', 'lightgbm': '.txt', 'catboost': '.cbm'}
+
+# Largest probability difference from the pickle accepted by --verify
+PROBABILITY_ATOL = 1e-6
+
+
+class CalibratedEnsemble:
+    """
+    The training notebook's ensemble, pickled as __main__.CalibratedEnsemble
+    models: CalibratedClassifierCV per base learner, averaged after scaler (fitted on feature_cols)
+    """
+
+    def predict_proba(self, X):
+        """
+        Reference implementation through scikit-learn
+        With LightGBM releases whose LGBMClassifier has decision_function, scikit-learn feeds the
+        LightGBM calibrator raw scores instead of the probabilities it was fitted on;
+        ServingEnsemble always uses probabilities.
+        """
+        if hasattr(X, 'columns'):
+            X = X[list(self.feature_cols)]
+        scaled = self.scaler.transform(X)
+        fraud_scores = np.mean([model.predict_proba(scaled)[:, 1] for model in self.models], axis=0)
+        return np.column_stack([1.0 - fraud_scores, fraud_scores])
+
+
+def _register_pickled_classes():
+    # Pickles made in a notebook reference __main__; resolve them to this module's class
+    main = sys.modules['__main__']
+    if not hasattr(main, 'CalibratedEnsemble'):
+        main.CalibratedEnsemble = CalibratedEnsemble
+
+
+def _native_model(estimator):
+    """(library, native model, options) of a fitted scikit-learn estimator; library is None if unsupported"""
+    kind = type(estimator).__name__
+    if kind == 'XGBClassifier':
+        missing = estimator.missing
+        return 'xgboost', estimator.get_booster(), {'missing': None if np.isnan(missing) else float(missing)}
+    if kind == 'LGBMClassifier':
+        return 'lightgbm', estimator.booster_, {}
+    if kind == 'CatBoostClassifier':
+        return 'catboost', estimator, {}
+    return None, estimator, {}
+
+
+def _native_predictor(library, model, options, threads):
+    """
+    callable(matrix) -> positive-class probability (or decision value) of one fitted model
+    The boosters' calibrators were fitted on probabilities, so those are what their predictors return.
+    """
+    if library == 'xgboost':
+        best = getattr(model, 'best_iteration', None)
+        iteration_range = (0, best + 1) if best is not None else (0, 0)
+        missing = np.nan if options.get('missing') is None else options['missing']
+        model.set_param({'nthread': threads})
+
+        def predict(matrix):
+            return model.inplace_predict(matrix, iteration_range=iteration_range, missing=missing)
+        return predict
+
+    if library == 'lightgbm':
+        def predict(matrix):
+            return model.predict(matrix, num_threads=threads)
+        return predict
+
+    if library == 'catboost':
+        def predict(matrix):
+            return model.predict(matrix, prediction_type='Probability', thread_count=threads)[:, 1]
+        return predict
+
+    # Anything else goes through the same response scikit-learn calibrated
+    if hasattr(model, 'decision_function'):
+        return model.decision_function
+    return lambda matrix: model.predict_proba(matrix)[:, 1]
+
+
+def _calibration(calibrated_classifier):
+    """('isotonic', x, y) or ('sigmoid', a, b) for the positive class of one fold"""
+    if len(calibrated_classifier.calibrators) != 1:
+        raise ValueError("Only binary calibrated classifiers can be served")
+    calibrator = calibrated_classifier.calibrators[0]
+    if calibrated_classifier.method == 'isotonic':
+        return 'isotonic', np.asarray(calibrator.X_thresholds_, dtype=np.float64), \
+            np.asarray(calibrator.y_thresholds_, dtype=np.float64)
+    if calibrated_classifier.method == 'sigmoid':
+        return 'sigmoid', float(calibrator.a_), float(calibrator.b_)
+    raise ValueError(f"Unsupported calibration method {calibrated_classifier.method!r}")
+
+
+def _calibrate(predictions, calibration):
+    kind, first, second = calibration
+    if kind == 'isotonic':
+        # np.interp clamps to the end points, as CalibratedClassifierCV's out_of_bounds='clip'
+        return np.interp(predictions, first, second)
+    return 1.0 / (1.0 + np.exp(first * predictions + second))
+
+
+def _save_native_model(library, model, path):
+    if library == 'catboost':
+        model.save_model(path, format='cbm')
+    else:
+        model.save_model(path)
+
+
+def _load_native_model(library, path):
+    if library == 'xgboost':
+        import xgboost as xgb
+
+        model = xgb.Booster()
+        model.load_model(path)
+        return model
+    if library == 'lightgbm':
+        import lightgbm
+
+        return lightgbm.Booster(model_file=path)
+    if library == 'catboost':
+        from catboost import CatBoostClassifier
+
+        model = CatBoostClassifier()
+        model.load_model(path, format='cbm')
+        return model
+    raise ValueError(f"Unsupported model library {library!r}")
+
+
+def _library_version(library):
+    return getattr(sys.modules.get(library), '__version__', None)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BaseLearner:
+    """
+    One base learner of a ServingEnsemble
+    folds: (library, native model, options, calibration) per calibration fold
+    """
+
+    def __init__(self, name, folds, threads):
+        self.name = name
+        self.folds = folds
+        self.kind = folds[0][0] or type(folds[0][1]).__name__
+        self._predictors = [_native_predictor(library, model, options, threads)
+                            for library, model, options, _ in folds]
+
+    @classmethod
+    def from_calibrated(cls, name, calibrated_model, threads):
+        folds = [(*_native_model(fold.estimator), _calibration(fold))
+                 for fold in calibrated_model.calibrated_classifiers_]
+        return cls(name, folds, threads)
+
+    def predict(self, matrix):
+        """Calibrated positive-class probability, averaged over the calibration folds"""
+        calibrated = [_calibrate(np.asarray(predict(matrix), dtype=np.float64), fold[3])
+                      for predict, fold in zip(self._predictors, self.folds)]
+        return calibrated[0] if len(calibrated) == 1 else np.mean(calibrated, axis=0)
+
+
+class ServingEnsemble:
+    """
+    Warm, thread-safe form of a CalibratedEnsemble or a single CalibratedClassifierCV
+    learners: [(name, folds)] as taken by BaseLearner
+    threads: OpenMP threads per base learner (default: the cores split evenly between them)
+    """
+
+    def __init__(self, learners, num_features, feature_names=None, mean=None, scale=None, threads=None):
+        self.threads = threads or max(1, (os.cpu_count() or 1) // len(learners))
+        self.learners = [learner if isinstance(learner, BaseLearner) else BaseLearner(*learner, self.threads)
+                         for learner in learners]
+        self.n_features_in_ = int(num_features)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self._mean = mean
+        self._scale = scale
+
+        self._executor = None
+        if len(self.learners) > 1:
+            self._executor = ThreadPoolExecutor(len(self.learners), thread_name_prefix='ensemble')
+        self.warm()
+
+    @classmethod
+    def from_calibrated(cls, model, threads=None):
+        """Build from an unpickled CalibratedEnsemble or CalibratedClassifierCV"""
+        if isinstance(model, CalibratedEnsemble):
+            names, models = list(model.model_names), list(model.models)
+            scaler, feature_names = model.scaler, list(model.feature_cols)
+        else:
+            names, models, scaler = [type(model.estimator).__name__], [model], None
+            feature_names = list(getattr(model, 'feature_names_in_', [])) or None
+
+        threads = threads or max(1, (os.cpu_count() or 1) // len(models))
+        mean = scale = None
+        if scaler is not None:
+            if scaler.with_mean:
+                mean = np.asarray(scaler.mean_, dtype=np.float64)
+            if scaler.with_std:
+                scale = np.asarray(scaler.scale_, dtype=np.float64)
+        learners = [BaseLearner.from_calibrated(name, calibrated, threads) for name, calibrated in zip(names, models)]
+        return cls(learners, models[0].n_features_in_, feature_names, mean, scale, threads)
+
+    def warm(self):
+        """Run every base learner once so their lazy initialization is not paid by the first batch"""
+        self.predict(np.zeros((1, self.n_features_in_)))
+
+    def prepare(self, X):
+        """The scaled float64 matrix every base learner reads"""
+        if hasattr(X, 'columns'):
+            if self.feature_names is None:
+                raise ValueError("Model has no feature names; pass a matrix in training column order")
+            missing = [name for name in self.feature_names if name not in X.columns]
+            if missing:
+                raise ValueError(f"Missing model features: {', '.join(missing)}")
+            X = X[self.feature_names].to_numpy(dtype=np.float64)
+        matrix = np.array(X, dtype=np.float64, order='C', ndmin=2)
+        if matrix.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got {matrix.shape[1]}")
+        if self._mean is not None:
+            matrix -= self._mean
+        if self._scale is not None:
+            matrix /= self._scale
+        return matrix
+
+    def predict_learners(self, X):
+        """Calibrated probability of every base learner, shape (learners, rows)"""
+        matrix = self.prepare(X)
+        if self._executor is None:
+            return np.stack([learner.predict(matrix) for learner in self.learners])
+        futures = [self._executor.submit(learner.predict, matrix) for learner in self.learners]
+        return np.stack([future.result() for future in futures])
+
+    def predict(self, X):
+        """Fraud probability of every row"""
+        return self.predict_learners(X).mean(axis=0)
+
+    def predict_proba(self, X):
+        """scikit-learn style (rows, 2) class probabilities"""
+        fraud_scores = self.predict(X)
+        return np.column_stack([1.0 - fraud_scores, fraud_scores])
+
+    def stats(self):
+        return {
+            'learners': [{'name': learner.name, 'kind': learner.kind} for learner in self.learners],
+            'features': self.n_features_in_,
+            'scaled': self._mean is not None or self._scale is not None,
+            'threads_per_learner': self.threads
+        }
+
+    def save(self, directory):
+        """Write the native .model directory (replacing any previous one at that path)"""
+        staging = directory.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        arrays, layout = [], {}
+
+        def add_array(name, values):
+            values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+            layout[name] = [sum(len(array) for array in arrays), len(values)]
+            arrays.append(values)
+            return name
+
+        mean = add_array('mean', self._mean) if self._mean is not None else None
+        scale = add_array('scale', self._scale) if self._scale is not None else None
+        learners, libraries = [], {}
+        for index, learner in enumerate(self.learners):
+            folds = []
+            for fold_index, (library, model, options, (method, first, second)) in enumerate(learner.folds):
+                if library is None:
+                    raise ValueError(f"{learner.name}: {learner.kind} has no native format")
+                file_name = f'{index}-{fold_index}{LIBRARY_EXTENSIONS[library]}'
+                _save_native_model(library, model, os.path.join(staging, file_name))
+                libraries[library] = _library_version(library)
+                folds.append({
+                    'library': library, 'file': file_name, 'options': options, 'calibration': method,
+                    'parameters': [add_array(f'{index}.{fold_index}.{part}', values)
+                                   for part, values in (('first', first), ('second', second))]
+                })
+            learners.append({'name': learner.name, 'folds': folds})
+
+        with open(os.path.join(staging, ARRAYS_FILE), 'wb') as f:
+            np.save(f, np.concatenate(arrays))
+        manifest = {
+            'format': NATIVE_FORMAT,
+            'num_features': self.n_features_in_,
+            'feature_names': self.feature_names,
+            'mean': mean,
+            'scale': scale,
+            'learners': learners,
+            'layout': layout,
+            'libraries': libraries,
+        }
+        manifest['checksums'] = {name: _sha256(os.path.join(staging, name)) for name in sorted(os.listdir(staging))}
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(staging, directory)
+
+    @classmethod
+    def load(cls, directory, threads=None, verify=True):
+        """Load a .model directory; verify: check every file against the manifest's checksums first"""
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != NATIVE_FORMAT:
+            raise ValueError(f"Unsupported model format {manifest.get('format')!r} in {directory}")
+        if verify:
+            for name, checksum in manifest['checksums'].items():
+                if _sha256(os.path.join(directory, name)) != checksum:
+                    raise ValueError(f"Checksum mismatch for {name} in {directory}")
+
+        values = np.load(os.path.join(directory, ARRAYS_FILE), mmap_mode='r')
+
+        def array(name):
+            if name is None:
+                return None
+            offset, length = manifest['layout'][name]
+            return values[offset:offset + length]
+
+        threads = threads or max(1, (os.cpu_count() or 1) // len(manifest['learners']))
+        learners = []
+        for learner in manifest['learners']:
+            folds = []
+            for fold in learner['folds']:
+                model = _load_native_model(fold['library'], os.path.join(directory, fold['file']))
+                first, second = (array(name) for name in fold['parameters'])
+                if fold['calibration'] == 'sigmoid':
+                    first, second = float(first[0]), float(second[0])
+                folds.append((fold['library'], model, fold['options'], (fold['calibration'], first, second)))
+            learners.append((learner['name'], folds))
+        return cls(learners, manifest['num_features'], manifest['feature_names'],
+                   array(manifest['mean']), array(manifest['scale']), threads)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+def load_pickle(path):
+    """Unpickle a calibrated artifact (needs the libraries it was trained with)"""
+    import joblib
+
+    _register_pickled_classes()
+    return joblib.load(path)
+
+
+def load_calibrated(path, threads=None):
+    """Unpickle a calibrated artifact into a ServingEnsemble"""
+    return ServingEnsemble.from_calibrated(load_pickle(path), threads=threads)
+
+
+def reference_predict(model, X):
+    """
+    Fraud probability of an unpickled CalibratedEnsemble or CalibratedClassifierCV through
+    scikit-learn's own estimators and calibrators, each calibrator fed the probabilities it was fitted on
+    Equals model.predict_proba(X)[:, 1] except for the LightGBM decision_function quirk.
+    """
+    def calibrated(calibrated_model, matrix):
+        return np.mean([fold.calibrators[0].predict(fold.estimator.predict_proba(matrix)[:, 1])
+                        for fold in calibrated_model.calibrated_classifiers_], axis=0)
+
+    if isinstance(model, CalibratedEnsemble):
+        if hasattr(X, 'columns'):
+            X = X[list(model.feature_cols)]
+        scaled = model.scaler.transform(X)
+        return np.mean([calibrated(calibrated_model, scaled) for calibrated_model in model.models], axis=0)
+    return calibrated(model, X)
+
+
+def sample_features(model, rows=10000, seed=0):
+    """Rows spread around the training distribution (the scaler's), with heavy tails and some extremes"""
+    rng = np.random.default_rng(seed)
+    standard = rng.standard_normal((rows, model.n_features_in_)) * rng.choice([0.25, 1.0, 4.0], size=(rows, 1))
+    mean = model._mean if model._mean is not None else 0.0
+    scale = model._scale if model._scale is not None else 1.0
+    return standard * scale + mean
+
+
+def max_probability_difference(expected, converted, rows=10000, seed=0):
+    """Largest |probability| gap between two ServingEnsembles on sample_features rows"""
+    data = sample_features(expected, rows, seed)
+    return float(np.max(np.abs(expected.predict(data) - converted.predict(data))))
+
+
+def max_reference_difference(pickled, served, rows=10000, seed=0):
+    """Largest |probability| gap between a ServingEnsemble and reference_predict of its pickle"""
+    data = sample_features(served, rows, seed)
+    return float(np.max(np.abs(reference_predict(pickled, data) - served.predict(data))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a calibrated pickle into the native .model format")
+    parser.add_argument('model', help="Pickled CalibratedEnsemble or CalibratedClassifierCV")
+    parser.add_argument('output', nargs='?', help="Destination directory (defaults to the model path with .model)")
+    parser.add_argument('--verify', action='store_true', help="Check probabilities against the pickle")
+    args = parser.parse_args()
+
+    pickled = load_pickle(args.model)
+    model = ServingEnsemble.from_calibrated(pickled)
+    output = args.output or os.path.splitext(args.model)[0] + NATIVE_EXTENSION
+    model.save(output)
+    print(f"Converted {len(model.learners)} learners ({', '.join(learner.name for learner in model.learners)}) "
+          f"to {output}")
+
+    if args.verify:
+        converted = ServingEnsemble.load(output)
+        differences = {'the pickle': max_reference_difference(pickled, converted),
+                       'the saved learners': max_probability_difference(model, converted)}
+        for against, difference in differences.items():
+            print(f"Max probability difference vs {against}: {difference:.3g}")
+        if max(differences.values()) > PROBABILITY_ATOL:
+            raise SystemExit(f"Converted model differs by more than {PROBABILITY_ATOL}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Lightweight in-process metrics for the scoring path.
+
+Stage timers and counters are recorded only while metrics are enabled (set
+FRAUDGUARD_METRICS=1, or call enable()). When disabled, timer() hands back a
+shared no-op context manager and increment() returns after one flag check, so
+the instrumented code pays well under a microsecond per call.
+
+Recorded values are exported in the Prometheus text exposition format by
+render_prometheus(): the scoring service serves it at GET /metrics, and
+start_http_server() exposes it from any other process (e.g. the Streamlit app,
+with FRAUDGUARD_METRICS_PORT set).
+"""
+import bisect
+import collections
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = 'fraudguard'
+
+# Power-of-two bucket bounds for counts such as batch sizes and queue depths
+DEFAULT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+# Stage latency bucket bounds, in seconds (50 us .. 1 s)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+COUNTER_HELP = {
+    'transactions_scored': 'Transactions scored by the model or the rule-based fallback',
+    'booster_calls': 'Completed booster predict calls (inplace_predict, pred_leaf and pred_contribs)',
+    'booster_errors': 'Booster pred_leaf / pred_contribs passes that raised (their confidence tier is replaced)',
+    'booster_rows': 'Rows sent to the booster across all calls',
+    'fallback_activations': 'Transactions scored by Rule_Based_Fallback because the model failed',
+    'confidence_fast_tier': 'Transactions whose confidence was settled by the base tier alone (tiered mode)',
+    'result_cache_hits': 'Predictions served from the result cache',
+    'result_cache_misses': 'Result cache lookups that had to score the transaction',
+    'result_cache_evictions': 'Result cache entries evicted to stay within max_entries',
+    'stream_events': 'Events read from the streaming feed',
+    'stream_decisions': 'Decisions written to the streaming sink',
+    'stream_invalid_events': 'Streaming events that could not be parsed into a transaction',
+    'shadow_scored': 'Transactions scored by the shadow candidates',
+    'shadow_risk_level_flips': 'Shadow candidate scores in a different risk level (LOW/MEDIUM/HIGH) than the primary score',
+    'shadow_dropped': 'Primary batches not shadow scored because the shadow queue was full'
+}
+
+_enabled = os.environ.get('FRAUDGUARD_METRICS', '') not in ('', '0')
+
+
+class Histogram:
+    """Fixed-bucket counter histogram (bucket i counts values <= bounds[i])"""
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        """Cumulative bucket counts keyed by upper bound, plus count and sum"""
+        with self._lock:
+            buckets, total = {}, 0
+            for bound, count in zip(self.bounds + ['+Inf'], self.counts):
+                total += count
+                buckets[str(bound)] = total
+            return {'buckets': buckets, 'count': self.count, 'sum': self.sum}
+
+
+_lock = threading.Lock()
+_counters = collections.Counter()
+_stages = {}
+
+
+def enable(on=True):
+    """Turn recording on or off for the whole process"""
+    global _enabled
+    _enabled = bool(on)
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    """Forget everything recorded so far"""
+    with _lock:
+        _counters.clear()
+        _stages.clear()
+
+
+def increment(counter, amount=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[counter] += amount
+
+
+def observe(stage, seconds):
+    """Record one duration for a stage"""
+    histogram = _stages.get(stage)
+    if histogram is None:
+        with _lock:
+            histogram = _stages.setdefault(stage, Histogram(LATENCY_BUCKETS))
+    histogram.observe(seconds)
+
+
+class _StageTimer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.stage, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage):
+    """Context manager timing one stage; a shared no-op while metrics are disabled"""
+    return _StageTimer(stage) if _enabled else _NULL_TIMER
+
+
+def snapshot():
+    """Counters and per-stage latency summaries for display"""
+    with _lock:
+        counters = dict(_counters)
+        stages = dict(_stages)
+    return {
+        'enabled': _enabled,
+        'counters': counters,
+        'stages': {stage: histogram.snapshot() for stage, histogram in sorted(stages.items())}
+    }
+
+
+def _format_labels(labels):
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}' if labels else ''
+
+
+def render_histogram(name, histogram, labels=None, help_text=None):
+    """Prometheus text lines for one histogram (a Histogram or its snapshot())"""
+    data = histogram.snapshot() if isinstance(histogram, Histogram) else histogram
+    labels = labels or {}
+    lines = []
+    if help_text:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for bound, count in data['buckets'].items():
+        lines.append(f'{name}_bucket{_format_labels({**labels, "le": bound})} {count}')
+    lines.append(f'{name}_sum{_format_labels(labels)} {data["sum"]}')
+    lines.append(f'{name}_count{_format_labels(labels)} {data["count"]}')
+    return lines
+
+
+def render_prometheus(extra_histograms=None):
+    """
+    Everything recorded, in Prometheus text exposition format
+    extra_histograms: optional {metric name: (Histogram, help text)} to append
+    """
+    data = snapshot()
+    lines = []
+    for counter in sorted(set(COUNTER_HELP) | set(data['counters'])):
+        name = f'{PREFIX}_{counter}_total'
+        lines += [f'# HELP {name} {COUNTER_HELP.get(counter, counter)}', f'# TYPE {name} counter',
+                  f'{name} {data["counters"].get(counter, 0)}']
+
+    name = f'{PREFIX}_stage_seconds'
+    lines += [f'# HELP {name} Time spent in each stage of the scoring path', f'# TYPE {name} histogram']
+    for stage, histogram in data['stages'].items():
+        lines += render_histogram(name, histogram, {'stage': stage})
+
+    for metric, (histogram, help_text) in (extra_histograms or {}).items():
+        lines += render_histogram(f'{PREFIX}_{metric}', histogram, help_text=help_text)
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        extra = self.server.extra_histograms
+        body = render_prometheus(extra() if callable(extra) else extra).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1', extra_histograms=None):
+    """
+    Serve GET /metrics from a daemon thread; returns the server
+    extra_histograms: as for render_prometheus, or a callable returning them
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.extra_histograms = extra_histograms
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
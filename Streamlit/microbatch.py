@@ -0,0 +1,109 @@
+"""
+Micro-batching request coalescer.
+
+Under concurrent load every request pays the fixed cost of a booster call for a
+handful of rows. MicroBatcher collects requests that arrive within a short window
+(up to max_batch_size requests or max_wait_us microseconds, whichever comes
+first), scores them with one batched call and hands each caller its own result.
+
+Callers get a concurrent.futures.Future, so the batcher serves both threads
+(future.result()) and asyncio code (await asyncio.wrap_future(future)).
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import Histogram
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent scoring requests into batched calls
+    score_batch: callable taking a list of items and returning one result per item, in order
+    """
+
+    def __init__(self, score_batch, max_batch_size=32, max_wait_us=500, workers=1):
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_us / 1e6
+        self.batch_sizes = Histogram()
+        self.queue_depths = Histogram()
+        self._queue = queue.SimpleQueue()
+        self._threads = [
+            threading.Thread(target=self._run, name=f'microbatch-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, item):
+        """Queue one item for scoring; returns a Future resolving to its result"""
+        future = Future()
+        self.queue_depths.observe(self._queue.qsize())
+        self._queue.put((item, future))
+        return future
+
+    def score(self, item, timeout=None):
+        """Blocking convenience wrapper around submit()"""
+        return self.submit(item).result(timeout)
+
+    def close(self):
+        """Finish queued work and stop the worker threads"""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_us': self.max_wait * 1e6,
+            'queue_depth': self._queue.qsize(),
+            'batch_size_histogram': self.batch_sizes.snapshot(),
+            'queue_depth_histogram': self.queue_depths.snapshot()
+        }
+
+    def _collect(self, first):
+        """Gather more requests until the batch is full or the wait window closes"""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                # Put it back so this worker stops after scoring what it already holds
+                self._queue.put(_STOP)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+
+            # Skip callers that gave up (e.g. a cancelled asyncio task) while queued
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                results = list(self.score_batch([item for item, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            # A short result list must not leave callers waiting forever
+            for _, future in batch[len(results):]:
+                future.set_exception(ValueError(f"score_batch returned {len(results)} results for {len(batch)} items"))
@@ -0,0 +1,246 @@
+"""
+Registry of the model artifacts shipped in Streamlit/models/.
+
+Artifacts are discovered by scanning the directory and identified by file name
+(e.g. "3momtsim_fraud_model.bin"). Nothing is loaded until a model is first
+requested; loaded models are kept warm in an LRU bounded by an approximate
+memory budget, so a process can switch between models (A/B tests, shadow
+scoring) without restarting or holding every model in RAM. The file signature and
+checksum each warm model was loaded from are kept, so a changed artifact can be
+reloaded next to the warm copy and swapped in (see model_watcher.py).
+
+Native XGBoost files (binary, JSON or UBJSON) load as xgb.Booster; .npz files
+written by compiled_model.py load as a CompiledBooster with NumPy alone; joblib
+pickles (the calibrated scikit-learn wrappers) load with joblib, which needs the
+libraries they were trained with, into an ensemble.ServingEnsemble, and so do
+.model directories converted from them by ensemble.py, without unpickling.
+Neither xgboost nor joblib is imported until a model of that kind is actually
+loaded, so listing artifacts stays cheap.
+"""
+import collections
+import hashlib
+import os
+import threading
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+DEFAULT_MODEL_NAME = "3momtsim_fraud_model.bin"
+
+MODEL_EXTENSIONS = ('.bin', '.json', '.ubj', '.pkl', '.npz')
+
+# Native ensemble artifacts are directories (see ensemble.py)
+NATIVE_EXTENSION = '.model'
+
+# Formats the booster-based scoring path can serve
+SERVABLE_FORMATS = ('xgboost', 'compiled')
+
+# Warm models are evicted least-recently-used first once their footprint passes this
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+PICKLE_MAGIC = b'\x80'
+NPZ_MAGIC = b'PK'
+
+
+def artifact_format(path):
+    """
+    'pickle' for joblib/pickle files, 'compiled' for compiled .npz models, 'native' for
+    .model ensemble directories, 'xgboost' for native boosters
+    """
+    if os.path.isdir(path):
+        return 'native'
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic[:1] == PICKLE_MAGIC:
+        return 'pickle'
+    return 'compiled' if magic == NPZ_MAGIC else 'xgboost'
+
+
+def artifact_size(path):
+    """Bytes on disk of a model file or .model directory"""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def _artifact_files(path):
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    return [path]
+
+
+def artifact_signature(path):
+    """(mtime_ns, size) of every file of an artifact; cheap to poll for changes"""
+    signature = []
+    for file_path in _artifact_files(path):
+        stat = os.stat(file_path)
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def artifact_checksum(path):
+    """SHA-256 over the contents of every file of an artifact"""
+    digest = hashlib.sha256()
+    for file_path in _artifact_files(path):
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def is_servable(model):
+    """Whether the booster-based scoring path (inplace_predict) can score with this model"""
+    return hasattr(model, 'inplace_predict')
+
+
+def load_artifact(path):
+    """Load one artifact according to its format"""
+    artifact = artifact_format(path)
+    if artifact == 'pickle':
+        from ensemble import load_calibrated
+        return load_calibrated(path)
+    if artifact == 'native':
+        from ensemble import ServingEnsemble
+        return ServingEnsemble.load(path)
+    if artifact == 'compiled':
+        from compiled_model import CompiledBooster
+        return CompiledBooster.load(path)
+
+    import xgboost as xgb
+
+    classifier = xgb.Booster()
+    classifier.load_model(path)
+    return classifier
+
+
+class ModelRegistry:
+    """
+    Lazily loaded, memory-bounded set of models keyed by artifact file name
+    on_load: optional callable(name, model) run once after a model loads (e.g. warm-up)
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, max_bytes=DEFAULT_MAX_BYTES, on_load=None):
+        self.model_dir = model_dir
+        self.max_bytes = max_bytes
+        self.on_load = on_load
+        self.default_name = DEFAULT_MODEL_NAME
+        self._warm = collections.OrderedDict()  # name -> (model, footprint bytes, signature, checksum)
+        self._lock = threading.Lock()
+        self._load_locks = collections.defaultdict(threading.Lock)
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._reloads = 0
+
+    def names(self):
+        """Artifact names found in the model directory"""
+        if not os.path.isdir(self.model_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.model_dir)
+            if name.endswith(MODEL_EXTENSIONS) and os.path.isfile(os.path.join(self.model_dir, name))
+            or name.endswith(NATIVE_EXTENSION) and os.path.isdir(os.path.join(self.model_dir, name))
+        )
+
+    def path(self, name):
+        if name not in self.names():
+            raise KeyError(f"Unknown model {name!r}; available: {', '.join(self.names())}")
+        return os.path.join(self.model_dir, name)
+
+    def describe(self):
+        """Name, format, size and warm state of every artifact"""
+        with self._lock:
+            warm = set(self._warm)
+        return [
+            {
+                'name': name,
+                'format': artifact_format(os.path.join(self.model_dir, name)),
+                'size_bytes': artifact_size(os.path.join(self.model_dir, name)),
+                'loaded': name in warm
+            }
+            for name in self.names()
+        ]
+
+    def is_warm(self, name=None):
+        """Whether the model called name (the default model if None) is loaded"""
+        with self._lock:
+            return (name or self.default_name) in self._warm
+
+    def get(self, name=None):
+        """The model called name (the default model if None), loading it on first use"""
+        name = name or self.default_name
+        with self._lock:
+            if name in self._warm:
+                self._hits += 1
+                self._warm.move_to_end(name)
+                return self._warm[name][0]
+
+        path = self.path(name)
+
+        # One loader per name; concurrent requests for the same model wait for it
+        with self._load_locks[name]:
+            with self._lock:
+                if name in self._warm:
+                    self._hits += 1
+                    self._warm.move_to_end(name)
+                    return self._warm[name][0]
+                self._misses += 1
+
+            model, entry = self._load(name, path)
+            with self._lock:
+                self._warm[name] = entry
+                self._evict()
+            return model
+
+    def _load(self, name, path, validate=None):
+        signature, checksum = artifact_signature(path), artifact_checksum(path)
+        model = load_artifact(path)
+        if self.on_load is not None:
+            self.on_load(name, model)
+        if validate is not None:
+            validate(model)
+        # File size approximates the in-memory footprint of a tree model
+        return model, (model, artifact_size(path), signature, checksum)
+
+    def reload(self, name, validate=None):
+        """
+        Load name's artifact again and swap it in for the warm copy once it is warm
+        validate: optional callable(model) run before the swap; raising keeps the old model
+        Callers that already hold the old model keep using it; get() returns the old
+        model until the swap and the new one after it. Returns the new model.
+        """
+        path = self.path(name)
+        with self._load_locks[name]:
+            model, entry = self._load(name, path, validate)
+            with self._lock:
+                self._warm[name] = entry
+                self._reloads += 1
+                self._evict()
+            return model
+
+    def warm_artifacts(self):
+        """{name: (signature, checksum)} of the file every warm model was loaded from"""
+        with self._lock:
+            return {name: (signature, checksum) for name, (_, _, signature, checksum) in self._warm.items()}
+
+    def evict(self, name):
+        """Drop a warm model; it reloads on the next get()"""
+        with self._lock:
+            if self._warm.pop(name, None) is not None:
+                self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'warm': list(self._warm),
+                'warm_bytes': sum(entry[1] for entry in self._warm.values()),
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'reloads': self._reloads
+            }
+
+    def _evict(self):
+        # Always keep the most recently used model, even if it alone exceeds the budget
+        while len(self._warm) > 1 and sum(entry[1] for entry in self._warm.values()) > self.max_bytes:
+            self._warm.popitem(last=False)
+            self._evictions += 1
@@ -0,0 +1,166 @@
+"""
+Hot reload of retrained model artifacts without restarting the process.
+
+ModelWatcher polls the files the model registry's warm models were loaded from
+(mtime and size, every `interval` seconds). When one changes and then stays the
+same for one more poll (so a file still being copied in is never read), its
+checksum is compared with the loaded one; if the contents really changed, the
+artifact is reloaded in the watcher thread:
+
+    load      model_registry.load_artifact, next to the warm copy
+    warm      the registry's on_load hook (the app and the service score a dummy transaction)
+    validate  the canary batch must score to finite probabilities (validate_canary)
+    swap      one assignment under the registry lock; get() returns the new model from then on
+
+Scoring keeps using the old model until the swap, so a deploy costs no cold start,
+and whoever already holds the old model (an in-flight request, a running micro-batch)
+finishes on it; it is freed when the last reference goes. An artifact that fails
+to load or validate is logged and left alone until it changes again.
+
+on_swap(name, model) lets owners of derived state follow a swap, e.g. the service
+rebuilding its scoring pool and pointing its default path at the new model; retire()
+closes such replaced resources once requests that picked them up have finished.
+"""
+import os
+import threading
+import time
+
+from model_registry import artifact_checksum, artifact_signature, is_servable
+
+DEFAULT_WATCH_INTERVAL = 5.0
+
+# Lowest CPU priority (nice value) for the watcher thread, so loading a new model does not slow scoring
+WATCHER_NICE = 19
+
+# Seconds a replaced scoring pool keeps serving requests that picked it up before the swap
+RETIRE_DELAY = 30.0
+
+# (type, amount, old initiator balance) of the canary batch: one transaction per type,
+# including an emptied account and an unknown-recipient transfer
+CANARY_CASES = (
+    ('TRANSFER', 1000.0, 1000.0), ('PAYMENT', 25000.0, 300000.0), ('WITHDRAWAL', 950000.0, 950000.0),
+    ('DEPOSIT', 5000.0, 0.0), ('DEBIT', 120.5, 80000.0)
+)
+
+
+def validate_canary(model):
+    """Raise ValueError unless model scores the canary batch to one finite probability per transaction"""
+    # Imported here so starting a watcher does not pull in pandas and the scoring stack
+    import numpy as np
+    import pandas as pd
+
+    from preprocessing import preprocess_transactions
+    from scoring import WARMUP_TRANSACTION
+
+    if is_servable(model):
+        canary = [{**WARMUP_TRANSACTION, 'transactionType': transaction_type, 'amount': amount,
+                   'oldBalInitiator': old_balance, 'newBalInitiator': max(old_balance - amount, 0.0),
+                   'newBalRecipient': amount}
+                  for transaction_type, amount, old_balance in CANARY_CASES]
+        scores = model.inplace_predict(preprocess_transactions(pd.DataFrame(canary)))
+    elif hasattr(model, 'n_features_in_'):
+        # Calibrated ensembles take their own engineered features; check the output contract only
+        scores = model.predict(np.zeros((len(CANARY_CASES), model.n_features_in_)))
+    else:
+        raise ValueError(f"{type(model).__name__} cannot be validated")
+
+    scores = np.asarray(scores)
+    if scores.shape != (len(CANARY_CASES),):
+        raise ValueError(f"Canary batch scored to shape {scores.shape}")
+    if not np.all(np.isfinite(scores)) or scores.min() < 0 or scores.max() > 1:
+        raise ValueError("Canary batch scored outside [0, 1]")
+
+
+def retire(resource, delay=RETIRE_DELAY):
+    """Close a replaced resource (e.g. a ScoringPool) after delay seconds, off the calling thread"""
+    timer = threading.Timer(delay, resource.close)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+class ModelWatcher:
+    """
+    Reloads warm registry models whose artifact changed on disk
+    validate: callable(model) raising to reject a reloaded model before the swap
+    on_swap: optional callable(name, model) run after each swap
+    """
+
+    def __init__(self, registry, interval=DEFAULT_WATCH_INTERVAL, validate=validate_canary, on_swap=None):
+        self.registry = registry
+        self.interval = interval
+        self.validate = validate
+        self.on_swap = on_swap
+        self._seen = {}  # name -> signature seen on the previous poll
+        self._ignored = {}  # name -> signature that failed to load or validate, or did not change the contents
+        self._swaps = 0
+        self._failures = 0
+        self._last_error = None
+        self._last_swap = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """One poll; reloads and swaps changed artifacts, returns the names that were swapped"""
+        swapped = []
+        for name, (loaded_signature, loaded_checksum) in self.registry.warm_artifacts().items():
+            try:
+                path = self.registry.path(name)
+                signature = artifact_signature(path)
+            except (KeyError, OSError):
+                # Removed (or mid-replace); the warm copy keeps serving
+                continue
+            previous, self._seen[name] = self._seen.get(name), signature
+            if signature == loaded_signature or signature != previous or signature == self._ignored.get(name):
+                continue
+            try:
+                if artifact_checksum(path) == loaded_checksum:
+                    # Touched but unchanged
+                    self._ignored[name] = signature
+                    continue
+                model = self.registry.reload(name, self.validate)
+            except Exception as e:
+                self._ignored[name] = signature
+                self._failures += 1
+                self._last_error = f"{name}: {e}"
+                print(f"Error reloading model {name}: {e}")
+                continue
+
+            self._swaps += 1
+            self._last_swap = {'name': name, 'time': time.time()}
+            swapped.append(name)
+            if self.on_swap is not None:
+                self.on_swap(name, model)
+        return swapped
+
+    def start(self):
+        """Poll in a daemon thread until stop()"""
+        self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            # On Linux every thread is its own schedulable task (see shadow.py)
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WATCHER_NICE)
+        except (AttributeError, OSError):
+            pass
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Error watching models: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'swaps': self._swaps,
+            'failures': self._failures,
+            'last_swap': self._last_swap,
+            'last_error': self._last_error
+        }
@@ -0,0 +1,133 @@
+"""
+Feature preparation for the MomtSim XGBoost model, shared by the app and batch jobs.
+
+preprocess_transactions works on whole columns (a DataFrame or a mapping of
+arrays) and returns the model-ready float32 matrix. preprocess_transaction is a
+thin single-row wrapper over the same code, used by the form and the demos.
+"""
+import numpy as np
+import pandas as pd
+
+from account_ids import MODEL_ID_MODULUS, hash_account_ids
+
+# Raw MomtSim export columns
+MOMTSIM_COLUMNS = [
+    'step',
+    'transactionType',
+    'amount',
+    'initiator',
+    'oldBalInitiator',
+    'newBalInitiator',
+    'recipient',
+    'oldBalRecipient',
+    'newBalRecipient'
+]
+
+# Columns the booster was trained on, in training order
+FEATURE_COLUMNS = [
+    'step',
+    'transactionType',
+    'amount',
+    'oldBalInitiator',
+    'newBalInitiator',
+    'oldBalRecipient',
+    'newBalRecipient',
+    'errorbalanceRec',
+    'errorbalanceInit'
+]
+
+# Positions of the model columns inside the 11-value list built by
+# preprocess_transaction (indices 3 and 6 are the account IDs, which the model does not use)
+MODEL_FEATURE_INDEX = [0, 1, 2, 4, 5, 7, 8, 9, 10]
+
+# Transaction type encoding used when the MomtSim model was trained
+TYPE_MAPPING = {
+    'DEPOSIT': 0,
+    'WITHDRAWAL': 1,
+    'TRANSFER': 2,
+    'PAYMENT': 3,
+    'DEBIT': 4
+}
+
+# Precomputed lookup table: type names sorted for searchsorted, with their codes
+_TYPE_NAMES = np.array(sorted(TYPE_MAPPING))
+_TYPE_CODES = np.array([TYPE_MAPPING[name] for name in _TYPE_NAMES], dtype=np.float64)
+
+
+def encode_transaction_types(types):
+    """Vectorized TYPE_MAPPING lookup; unknown types encode as 0 like TYPE_MAPPING.get(type, 0)"""
+    if isinstance(getattr(types, 'dtype', None), pd.CategoricalDtype):
+        # Encode each category once, then broadcast through the integer codes (-1 = missing)
+        categorical = pd.Categorical(types)
+        category_codes = np.append(encode_transaction_types(np.asarray(categorical.categories)), 0)
+        return category_codes[categorical.codes]
+
+    values = np.asarray(types).astype(str)
+    position = np.searchsorted(_TYPE_NAMES, values).clip(0, len(_TYPE_NAMES) - 1)
+    return np.where(_TYPE_NAMES[position] == values, _TYPE_CODES[position], 0.0)
+
+
+def encode_account_ids(ids):
+    """
+    Numeric account IDs pass through, anything else maps to 0..999999 through a
+    stable hash, so the same ID gets the same value in every process
+    """
+    values = np.asarray(ids)
+    if values.dtype.kind in 'iufb':
+        return values.astype(np.float64)
+    return (hash_account_ids(values) % MODEL_ID_MODULUS).astype(np.float64)
+
+
+def model_feature_columns(transactions):
+    """
+    The nine model columns as float64 arrays, in FEATURE_COLUMNS order
+    transactions: DataFrame or mapping of MomtSim column name -> array-like
+    """
+    amount = np.asarray(transactions['amount'], dtype=np.float64)
+    old_init = np.asarray(transactions['oldBalInitiator'], dtype=np.float64)
+    new_init = np.asarray(transactions['newBalInitiator'], dtype=np.float64)
+    old_rec = np.asarray(transactions['oldBalRecipient'], dtype=np.float64)
+    new_rec = np.asarray(transactions['newBalRecipient'], dtype=np.float64)
+
+    return [
+        np.asarray(transactions['step'], dtype=np.float64),
+        encode_transaction_types(transactions['transactionType']),
+        amount,
+        old_init,
+        new_init,
+        old_rec,
+        new_rec,
+        old_rec + amount - new_rec,    # errorbalanceRec
+        new_init + amount - old_init   # errorbalanceInit
+    ]
+
+
+def preprocess_transactions(transactions):
+    """Turn columnar MomtSim transactions into the model-ready (n, 9) float32 matrix"""
+    columns = model_feature_columns(transactions)
+
+    matrix = np.empty((len(columns[0]), len(FEATURE_COLUMNS)), dtype=np.float32)
+    for j, column in enumerate(columns):
+        matrix[:, j] = column
+    return matrix
+
+
+def preprocess_transaction(step, transaction_type, amount, initiator, oldBalInitiator, newBalInitiator, recipient, oldBalRecipient, newBalRecipient):
+    """
+    Preprocess a single transaction through the columnar path
+    Returns: the 11-value feature list (model columns plus the encoded account IDs)
+    """
+    columns = model_feature_columns({
+        'step': [step],
+        'transactionType': [transaction_type],
+        'amount': [amount],
+        'oldBalInitiator': [oldBalInitiator],
+        'newBalInitiator': [newBalInitiator],
+        'oldBalRecipient': [oldBalRecipient],
+        'newBalRecipient': [newBalRecipient]
+    })
+    features = [float(column[0]) for column in columns]
+
+    features.insert(3, float(encode_account_ids([initiator])[0]))
+    features.insert(6, float(encode_account_ids([recipient])[0]))
+    return features
@@ -0,0 +1,130 @@
+"""
+Bounded TTL + LRU cache of model scoring results.
+
+Analysts re-submit the same transaction and re-click the same demo buttons, and
+every rerun would otherwise recompute the whole confidence pipeline. Results are
+keyed on the canonical 9-value model feature vector (account IDs are not model
+inputs, so they do not split the cache), the identity of the model object and
+the confidence mode, and hold the fraud score, confidence, method and breakdown.
+The breakdown is a mutable dict, so the cache keeps its own copy and hands every
+hit a fresh one: a caller editing its result cannot change what later hits see.
+
+Entries expire ttl_seconds after they were stored and the least recently used
+entry is evicted once max_entries is reached. Rule-based fallback results are
+never cached, so a transient model failure is not replayed.
+
+The cache is a plain thread-safe object: the Streamlit app shares one through
+st.cache_resource and the scoring service owns one per process.
+"""
+import collections
+import itertools
+import threading
+import time
+import weakref
+
+import metrics
+from confidence import confidence_mode
+from preprocessing import MODEL_FEATURE_INDEX
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_TTL_SECONDS = 300
+
+# Per-model tokens: id() can be reused once a model is freed, a counter cannot
+_MODEL_TOKENS = weakref.WeakKeyDictionary()
+_next_token = itertools.count(1)
+_token_lock = threading.Lock()
+
+
+def model_identity(classifier):
+    """A token that stays the same for a model object and is never reused for another"""
+    with _token_lock:
+        token = _MODEL_TOKENS.get(classifier)
+        if token is None:
+            token = _MODEL_TOKENS[classifier] = next(_next_token)
+        return token
+
+
+def canonical_features(features):
+    """The model's 9 feature values as hashable floats (-0.0 folded into 0.0)"""
+    return tuple(float(features[i]) + 0.0 for i in MODEL_FEATURE_INDEX)
+
+
+def _copy_result(result):
+    """result with its breakdown dict (and the lists and dicts in it) copied"""
+    breakdown = result[3]
+    if not isinstance(breakdown, dict):
+        return result
+    breakdown = {name: value.copy() if isinstance(value, (dict, list)) else value
+                 for name, value in breakdown.items()}
+    return (*result[:3], breakdown, *result[4:])
+
+
+class ResultCache:
+    """Thread-safe mapping of (model, confidence mode, features) -> prediction tuple"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = collections.OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def key(self, classifier, features):
+        mode = confidence_mode()
+        return model_identity(classifier), mode['mode'], mode['uncertain_band'], canonical_features(features)
+
+    def get(self, key):
+        """The cached result for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._entries[key]
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                metrics.increment('result_cache_misses')
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        metrics.increment('result_cache_hits')
+        return _copy_result(entry[1])
+
+    def put(self, key, result):
+        if result[2] == "Rule_Based_Fallback" or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, _copy_result(result))
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self._evictions += evicted
+        if evicted:
+            metrics.increment('result_cache_evictions', evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else None,
+                'evictions': self._evictions,
+                'expirations': self._expirations
+            }
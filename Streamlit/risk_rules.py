@@ -0,0 +1,310 @@
+"""
+Rule-based risk factors, declared as a table and evaluated over whole batches.
+
+Each rule is plain data (so a JSON file can replace the table without code changes):
+
+    {'factor': 'Account Emptying Pattern',
+     'when': [['oldBalInitiator', '>', 0], ['newBalInitiator', '==', 0]],    # all must hold
+     'impact': 0.35,                                                        # or {'column', 'divisor', 'max'}
+     'description': 'Complete account balance transferred'}                # str.format over the row
+
+Conditions compare a MomtSim column (or a derived column, see DERIVED_COLUMNS)
+with a constant using one of OPERATORS. RiskRules compiles the table once and
+evaluates it over a batch with one NumPy mask per condition, giving every row a
+bitset of the rules that fired (bit i = rule i) and their impacts; factor dicts
+are only built for the rows and rules that fired. A single transaction takes a
+scalar path over the same compiled rules, which returns the factor list the
+dashboard has always shown.
+
+The active table is RISK_RULES unless FRAUDGUARD_RISK_RULES (or configure())
+names a JSON file holding a list of rules.
+
+Usage:
+    python risk_rules.py --dump > rules.json                     # start a table from the defaults
+    python risk_rules.py [--rules rules.json] --input transactions.csv [--chunk-size 100000]
+"""
+import argparse
+import json
+import operator
+import os
+import string
+import time
+
+import numpy as np
+
+RISK_RULES = [
+    {
+        'factor': 'High Transaction Amount',
+        'when': [['amount', '>', 200000]],
+        'impact': {'column': 'amount', 'divisor': 1000000, 'max': 0.4},
+        'description': 'Large transaction: {amount:,.0f} UGX'
+    },
+    {
+        'factor': 'Risky Transaction Type',
+        'when': [['transactionType', 'in', ['WITHDRAWAL', 'TRANSFER']]],
+        'impact': 0.3,
+        'description': '{transactionType} transactions have elevated fraud risk'
+    },
+    {
+        'factor': 'Account Emptying Pattern',
+        'when': [['oldBalInitiator', '>', 0], ['newBalInitiator', '==', 0]],
+        'impact': 0.35,
+        'description': 'Complete account balance transferred'
+    },
+    {
+        'factor': 'Large Balance Change',
+        'when': [['oldBalInitiator', '>', 0], ['balanceChangeRatio', '>', 0.8]],
+        'impact': 0.25,
+        'description': 'Significant portion of account balance involved'
+    }
+]
+
+OPERATORS = {
+    '>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le,
+    '==': operator.eq, '!=': operator.ne, 'in': None, 'not in': None
+}
+
+# Rules and their bitsets fit in one uint64 per row
+MAX_RULES = 64
+
+
+def _balance_change_ratio(old_balance, new_balance):
+    """Share of the sender's balance the transaction moved (0 without a positive starting balance)"""
+    if isinstance(old_balance, np.ndarray):
+        old_balance = np.asarray(old_balance, dtype=np.float64)
+        change = np.abs(old_balance - np.asarray(new_balance, dtype=np.float64))
+        return np.divide(change, old_balance, out=np.zeros_like(change), where=old_balance > 0)
+    return abs(old_balance - new_balance) / old_balance if old_balance > 0 else 0.0
+
+
+# Derived column -> (input columns, function working on scalars and on arrays)
+DERIVED_COLUMNS = {
+    'balanceChangeRatio': (('oldBalInitiator', 'newBalInitiator'), _balance_change_ratio)
+}
+
+
+def _mask(op, values, constant):
+    """One condition over an array of column values"""
+    if op in ('in', 'not in'):
+        return np.isin(values, constant, invert=op == 'not in')
+    return OPERATORS[op](values, constant)
+
+
+def _predicate(column, op, constant):
+    """One condition over a single transaction's values, as a function"""
+    if op == 'in':
+        constant = frozenset(constant)
+        return lambda values: values[column] in constant
+    if op == 'not in':
+        constant = frozenset(constant)
+        return lambda values: values[column] not in constant
+    compare = OPERATORS[op]
+    return lambda values: compare(values[column], constant)
+
+
+def _conjunction(predicates):
+    """One function testing all predicates, short-circuiting like a chain of ifs"""
+    if not predicates:
+        return lambda values: True
+    test = predicates[0]
+    for predicate in predicates[1:]:
+        test = (lambda first, second: lambda values: first(values) and second(values))(test, predicate)
+    return test
+
+
+class RiskRules:
+    """
+    A compiled rule table
+    rules: list of rule dicts (see RISK_RULES); ValueError when one is malformed
+    """
+
+    def __init__(self, rules):
+        rules = list(rules)
+        if len(rules) > MAX_RULES:
+            raise ValueError(f"At most {MAX_RULES} risk rules are supported, got {len(rules)}")
+        self.rules = rules
+        self.names = []
+        self._conditions = []  # per rule: [(column, op, constant)]
+        self._tests = []  # per rule: the same conditions as one scalar function
+        self._impacts = []  # per rule: (constant, column, divisor, max)
+        self._descriptions = []
+        fields = set()
+        for i, rule in enumerate(rules):
+            try:
+                conditions = [(column, op, list(constant) if op in ('in', 'not in') else constant)
+                              for column, op, constant in rule['when']]
+                impact = rule['impact']
+                if isinstance(impact, dict):
+                    impact = (None, impact['column'], impact.get('divisor', 1), impact.get('max'))
+                else:
+                    impact = (float(impact), None, None, None)
+                description = rule.get('description', '')
+                referenced = [name for _, name, _, _ in string.Formatter().parse(description) if name]
+                self.names.append(rule['factor'])
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Malformed risk rule {i}: {e!r}")
+            unknown = [op for _, op, _ in conditions if op not in OPERATORS]
+            if unknown:
+                raise ValueError(f"Risk rule {rule['factor']!r} uses unknown operators: {', '.join(unknown)}")
+            self._conditions.append(conditions)
+            self._tests.append(_conjunction([_predicate(*condition) for condition in conditions]))
+            self._impacts.append(impact)
+            self._descriptions.append(description)
+            fields.update(column for column, _, _ in conditions)
+            fields.update(referenced)
+            if impact[1] is not None:
+                fields.add(impact[1])
+
+        self.derived = [name for name in DERIVED_COLUMNS if name in fields]
+        self.columns = sorted((fields - set(self.derived))
+                              | {column for name in self.derived for column in DERIVED_COLUMNS[name][0]})
+
+    def _columns(self, transactions):
+        """Column arrays the rules read, derived ones included, from a DataFrame or a list of dicts"""
+        if isinstance(transactions, list):
+            columns = {column: np.asarray([t[column] for t in transactions]) for column in self.columns}
+        else:
+            columns = {column: np.asarray(transactions[column]) for column in self.columns}
+        for name in self.derived:
+            inputs, function = DERIVED_COLUMNS[name]
+            columns[name] = function(*(columns[column] for column in inputs))
+        return columns
+
+    def _values(self, transaction):
+        values = {column: transaction[column] for column in self.columns}
+        for name in self.derived:
+            inputs, function = DERIVED_COLUMNS[name]
+            values[name] = function(*(values[column] for column in inputs))
+        return values
+
+    def _evaluate(self, columns, rows):
+        masks = np.zeros((rows, len(self.rules)), dtype=bool)
+        impacts = np.zeros((rows, len(self.rules)), dtype=np.float64)
+        for i, (conditions, (constant, column, divisor, cap)) in enumerate(zip(self._conditions, self._impacts)):
+            mask = np.ones(rows, dtype=bool)
+            for name, op, value in conditions:
+                mask &= _mask(op, columns[name], value)
+            masks[:, i] = mask
+            if column is None:
+                impacts[:, i] = np.where(mask, constant, 0.0)
+            else:
+                impact = columns[column] / divisor
+                impacts[:, i] = np.where(mask, impact if cap is None else np.minimum(cap, impact), 0.0)
+        return masks, impacts
+
+    def evaluate(self, transactions):
+        """
+        Rules fired per row of a batch (DataFrame or list of dicts), in one pass
+        Returns: (bits, impacts) - uint64 bitset per row (bit i = rule i) and a
+        rows x rules float64 matrix of impacts (0 where a rule did not fire)
+        """
+        masks, impacts = self._evaluate(self._columns(transactions), len(transactions))
+        return self.pack(masks), impacts
+
+    @staticmethod
+    def pack(masks):
+        """Bitsets from a rows x rules boolean matrix"""
+        return (masks.astype(np.uint64) << np.arange(masks.shape[1], dtype=np.uint64)).sum(axis=1, dtype=np.uint64)
+
+    def _factor(self, i, impact, values):
+        return {'factor': self.names[i], 'impact': impact, 'description': self._descriptions[i].format(**values)}
+
+    def factors(self, transaction):
+        """Risk factor dicts for one transaction (mapping of MomtSim column name -> value)"""
+        values = self._values(transaction)
+        factors = []
+        for i, (test, (constant, column, divisor, cap)) in enumerate(zip(self._tests, self._impacts)):
+            if test(values):
+                if column is not None:
+                    constant = values[column] / divisor
+                    constant = constant if cap is None else min(cap, constant)
+                factors.append(self._factor(i, constant, values))
+        return factors
+
+    def factor_lists(self, transactions):
+        """Risk factor dicts for every transaction of a batch (list of dicts or DataFrame), evaluated together"""
+        if isinstance(transactions, list) and len(transactions) == 1:
+            # Below NumPy's per-call overhead
+            return [self.factors(transactions[0])]
+        columns = self._columns(transactions)
+        masks, impacts = self._evaluate(columns, len(transactions))
+        factor_lists = [[] for _ in range(len(transactions))]
+        fired = np.flatnonzero(masks.any(axis=1))
+        # Python values of the fired rows only, converted in bulk
+        values = {name: column[fired].tolist() for name, column in columns.items()}
+        for k, (row, row_masks, row_impacts) in enumerate(zip(fired.tolist(), masks[fired].tolist(),
+                                                              impacts[fired].tolist())):
+            row_values = {name: column[k] for name, column in values.items()}
+            factor_lists[row] = [self._factor(i, impact, row_values)
+                                 for i, (fires, impact) in enumerate(zip(row_masks, row_impacts)) if fires]
+        return factor_lists
+
+    def labels(self, bits, separator='; '):
+        """Factor names per row of a bitset array, joined by separator ('' when no rule fired)"""
+        unique, inverse = np.unique(bits, return_inverse=True)
+        names = np.array([separator.join(name for i, name in enumerate(self.names) if int(value) >> i & 1)
+                          for value in unique], dtype=object)
+        return names[inverse]
+
+
+def load_rules(path):
+    """RiskRules from a JSON file holding a list of rules"""
+    with open(path) as f:
+        return RiskRules(json.load(f))
+
+
+_rules_path = os.environ.get('FRAUDGUARD_RISK_RULES') or None
+_active_rules = None
+
+
+def configure(rules_path=None):
+    """Use the rule table in rules_path (JSON) from now on; None restores RISK_RULES"""
+    global _rules_path, _active_rules
+    _rules_path = rules_path
+    _active_rules = None
+
+
+def active_rules():
+    """The compiled rule table in use, loaded on first use"""
+    global _active_rules
+    if _active_rules is None:
+        _active_rules = load_rules(_rules_path) if _rules_path else RiskRules(RISK_RULES)
+    return _active_rules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a risk rule table and how often its rules fire")
+    parser.add_argument('--rules', default=None, help="JSON rule table (defaults to the built-in rules)")
+    parser.add_argument('--dump', action='store_true', help="Print the rule table as JSON and exit")
+    parser.add_argument('--input', default=None, help="CSV or Parquet file with MomtSim columns")
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    args = parser.parse_args()
+
+    try:
+        rules = load_rules(args.rules) if args.rules else RiskRules(RISK_RULES)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"Error loading risk rules: {e}")
+    if args.dump:
+        print(json.dumps(rules.rules, indent=2))
+        return
+    print(f"{len(rules.names)} rules over columns: {', '.join(rules.columns)}")
+    if not args.input:
+        return
+
+    from batch_scoring import iter_chunks
+
+    rows, seconds = 0, 0.0
+    fired = np.zeros(len(rules.names), dtype=np.int64)
+    for chunk in iter_chunks(args.input, args.chunk_size):
+        start = time.perf_counter()
+        bits, _ = rules.evaluate(chunk)
+        seconds += time.perf_counter() - start
+        rows += len(chunk)
+        fired += [np.count_nonzero(bits >> np.uint64(i) & np.uint64(1)) for i in range(len(rules.names))]
+    print(f"Evaluated {rows:,} rows in {seconds:.2f}s ({rows / seconds if seconds else 0:,.0f} rows/s)")
+    for name, count in zip(rules.names, fired):
+        print(f"  {name}: {count:,} ({count / rows if rows else 0:.1%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+UI-free model loading and scoring helpers shared by the Streamlit app, batch jobs and services.
+"""
+import os
+import time
+
+import metrics
+from confidence import compute_confidence, compute_confidence_batch, contribution_shifts
+from model_registry import DEFAULT_MODEL_NAME, MODEL_DIR, load_artifact
+from preprocessing import FEATURE_COLUMNS, MODEL_FEATURE_INDEX, TYPE_MAPPING, preprocess_transaction
+from risk_rules import active_rules
+
+# Transaction used to warm a booster and its caches before the first real request
+WARMUP_TRANSACTION = {
+    'step': 1, 'transactionType': 'TRANSFER', 'amount': 1000.0, 'initiator': 'warmup',
+    'oldBalInitiator': 1000.0, 'newBalInitiator': 0.0, 'recipient': 'warmup',
+    'oldBalRecipient': 0.0, 'newBalRecipient': 1000.0
+}
+
+
+def load_booster(model_path=None):
+    """
+    Load an XGBoost booster (or a compiled .npz model) from disk
+    Returns: (classifier, model_loaded)
+    """
+    try:
+        # Build absolute path so it works both locally and on Streamlit Cloud
+        model_path = model_path or os.path.join(MODEL_DIR, DEFAULT_MODEL_NAME)
+
+        if os.path.exists(model_path):
+            return load_artifact(model_path), True
+        else:
+            return None, False
+    except Exception as e:
+        print(f"Error loading model: {e}")
+        return None, False
+
+
+def risk_level(fraud_score):
+    """Bucket a fraud probability into LOW / MEDIUM / HIGH"""
+    return "LOW" if fraud_score < 0.4 else "MEDIUM" if fraud_score < 0.7 else "HIGH"
+
+
+def recommend(fraud_score, confidence_score):
+    """
+    Confidence-aware decision policy used by the dashboard
+    Returns: (base_risk, recommendation)
+    """
+    base_risk = risk_level(fraud_score)
+
+    # Require 70%+ confidence for automatic financial decisions
+    if confidence_score < 0.7:
+        # Any fraud score above 30% with low confidence = block
+        recommendation = "BLOCK_LOW_CONFIDENCE" if fraud_score > 0.3 else "HUMAN_REVIEW_REQUIRED"
+    elif base_risk == "LOW":
+        recommendation = "APPROVE"
+    elif base_risk == "MEDIUM":
+        recommendation = "REVIEW"
+    else:
+        recommendation = "BLOCK"
+
+    return base_risk, recommendation
+
+
+def fallback_prediction(features, error):
+    """Rule-based score used when the model cannot score a transaction"""
+    amount_risk = min(features[2] / 1000000, 0.5)
+    balance_risk = 0.3 if features[4] > 0 and features[5] == 0 else 0.1
+    type_risk = 0.2 if features[1] in [1, 2] else 0.05
+
+    fallback_score = min(amount_risk + balance_risk + type_risk, 0.95)
+    # Fallback has low confidence since it's rule-based
+    fallback_confidence = 0.3
+
+    return fallback_score, fallback_confidence, "Rule_Based_Fallback", {'error': str(error)}
+
+
+def predict_with_confidence(classifier, features, cache=None):
+    """
+    Fraud probability with model confidence, falling back to rules if the model fails
+    cache: optional ResultCache consulted before scoring
+    Returns: (fraud_probability, confidence_score, method_used, confidence_breakdown)
+    """
+    if cache is not None:
+        key = cache.key(classifier, features)
+        result = cache.get(key)
+        if result is not None:
+            return result
+
+    if hasattr(classifier, 'predict_with_confidence_batch'):
+        # A ScoringPool scores (and falls back) in its worker processes
+        result = classifier.predict_with_confidence_batch([features])[0]
+        metrics.increment('transactions_scored')
+        if cache is not None:
+            cache.put(key, result)
+        return result
+
+    metrics.increment('transactions_scored')
+    try:
+        fraud_prob, final_confidence, confidence_scores = compute_confidence(classifier, features)
+        result = fraud_prob, final_confidence, "XGBoost_Model", confidence_scores
+    except Exception as e:
+        metrics.increment('fallback_activations')
+        return fallback_prediction(features, e)
+
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+def predict_with_confidence_batch(classifier, feature_lists, cache=None):
+    """
+    predict_with_confidence for many transactions with one booster call
+    If the batched call fails, each transaction is retried on its own so one bad
+    row falls back to rules without taking the rest of the batch with it
+    cache: optional ResultCache; only the misses are scored
+    """
+    if cache is not None:
+        keys = [cache.key(classifier, features) for features in feature_lists]
+        results = [cache.get(key) for key in keys]
+        misses = [k for k, result in enumerate(results) if result is None]
+        if misses:
+            scored = predict_with_confidence_batch(classifier, [feature_lists[k] for k in misses])
+            for k, result in zip(misses, scored):
+                results[k] = result
+                cache.put(keys[k], result)
+        return results
+
+    if hasattr(classifier, 'predict_with_confidence_batch'):
+        # A ScoringPool scores (and falls back) in its worker processes
+        results = classifier.predict_with_confidence_batch(feature_lists)
+        metrics.increment('transactions_scored', len(results))
+        return results
+
+    try:
+        results = [
+            (fraud_prob, final_confidence, "XGBoost_Model", confidence_scores)
+            for fraud_prob, final_confidence, confidence_scores in compute_confidence_batch(classifier, feature_lists)
+        ]
+    except Exception:
+        return [predict_with_confidence(classifier, features) for features in feature_lists]
+    metrics.increment('transactions_scored', len(results))
+    return results
+
+
+# Name and description of the risk factor each model feature stands for
+CONTRIBUTION_FACTORS = {
+    'step': ('Transaction Timing', 'Time step {step:.0f} sees more fraud than usual'),
+    'transactionType': ('Risky Transaction Type', '{type} transactions have elevated fraud risk'),
+    'amount': ('High Transaction Amount', 'Transaction of {amount:,.0f} UGX'),
+    'oldBalInitiator': ('Sender Balance', 'Sender balance of {oldBalInitiator:,.0f} UGX before the transaction'),
+    'newBalInitiator': ('Large Balance Change', 'Sender left with {newBalInitiator:,.0f} UGX'),
+    'oldBalRecipient': ('Recipient Balance', 'Recipient balance of {oldBalRecipient:,.0f} UGX before the transaction'),
+    'newBalRecipient': ('Recipient Balance Change', 'Recipient balance of {newBalRecipient:,.0f} UGX afterwards'),
+    'errorbalanceRec': ('Recipient Balance Mismatch', 'Recipient balances are off by {errorbalanceRec:,.0f} UGX'),
+    'errorbalanceInit': ('Sender Balance Mismatch', 'Sender balances are off by {errorbalanceInit:,.0f} UGX')
+}
+
+TYPE_NAMES = {code: name for name, code in TYPE_MAPPING.items()}
+
+# Model-driven explanations list at most this many factors, each adding at least MIN_FACTOR_IMPACT
+MAX_RISK_FACTORS = 4
+MIN_FACTOR_IMPACT = 0.01
+
+
+def contribution_risk_factors(features, contributions):
+    """
+    Model-driven risk factors: the features whose TreeSHAP contributions push the
+    score up the most, each with the fraud probability it adds as its impact
+    contributions: {feature name: contribution} from the confidence breakdown
+    """
+    values = dict(zip(FEATURE_COLUMNS, (features[i] for i in MODEL_FEATURE_INDEX)))
+    values['type'] = TYPE_NAMES.get(features[1], 'UNKNOWN')
+    shifts = contribution_shifts([contributions[name] for name in FEATURE_COLUMNS] + [contributions['bias']])
+
+    factors = []
+    for name, impact in sorted(zip(FEATURE_COLUMNS, shifts), key=lambda item: -item[1])[:MAX_RISK_FACTORS]:
+        if impact < MIN_FACTOR_IMPACT:
+            break
+        if name == 'newBalInitiator' and values['oldBalInitiator'] > 0 and values['newBalInitiator'] == 0:
+            factor, description = 'Account Emptying Pattern', 'Complete account balance transferred'
+        else:
+            factor, description = CONTRIBUTION_FACTORS[name]
+        factors.append({'factor': factor, 'impact': float(impact), 'description': description.format(**values)})
+    return factors
+
+
+def explain_risk_factors(features, confidence_breakdown, transaction, rule_factors=None):
+    """
+    Risk factors from the model's TreeSHAP contributions when the breakdown has
+    them, from the rule table otherwise (fallback scores, compiled models, tiered
+    fast path)
+    rule_factors: this transaction's rule factors when the batch was already evaluated
+    (risk_rules.RiskRules.factor_lists)
+    """
+    contributions = confidence_breakdown.get('contributions')
+    if contributions:
+        return contribution_risk_factors(features, contributions)
+    return rule_factors if rule_factors is not None else active_rules().factors(transaction)
+
+
+def calculate_risk_factors(transaction_type, amount, oldBalInitiator, newBalInitiator):
+    """Calculate risk factors for explanation (active rule table, see risk_rules.py)"""
+    return active_rules().factors({
+        'transactionType': transaction_type, 'amount': amount,
+        'oldBalInitiator': oldBalInitiator, 'newBalInitiator': newBalInitiator
+    })
+
+
+def analyze_transaction(classifier, transaction, progress=None, cache=None, feature_store=None, shadow=None):
+    """
+    Score one transaction end to end: features, model confidence, decision and risk factors
+    transaction: mapping of MomtSim column name -> value
+    progress: optional callable(stage, fraction_done) called after each stage
+    cache: optional ResultCache for the model prediction
+    feature_store: optional velocity.AccountFeatureStore; the transaction is recorded
+    in it and the accounts' velocity features are returned under 'velocity'
+    shadow: optional callable(feature_lists, fraud_scores, latency_ms), e.g. ShadowScorer.submit,
+    handed the primary score once it is decided
+    Returns: dict of the results plus per-stage timings in milliseconds
+    """
+    timings = {}
+    start = stage_start = time.perf_counter()
+
+    def finish(stage, fraction_done):
+        nonlocal stage_start
+        now = time.perf_counter()
+        timings[stage] = (now - stage_start) * 1000
+        if metrics.enabled():
+            metrics.observe(stage, now - stage_start)
+        stage_start = now
+        if progress is not None:
+            progress(stage, fraction_done)
+
+    features = preprocess_transaction(
+        transaction['step'], transaction['transactionType'], transaction['amount'],
+        transaction['initiator'], transaction['oldBalInitiator'], transaction['newBalInitiator'],
+        transaction['recipient'], transaction['oldBalRecipient'], transaction['newBalRecipient']
+    )
+    velocity = feature_store.record(transaction) if feature_store is not None else None
+    finish('preprocess', 0.2)
+
+    fraud_score, confidence, method, confidence_breakdown = predict_with_confidence(classifier, features, cache)
+    finish('predict', 0.8)
+    if shadow is not None:
+        shadow([features], [fraud_score], timings['predict'])
+
+    base_risk, recommendation = recommend(fraud_score, confidence)
+    risk_factors = explain_risk_factors(features, confidence_breakdown, transaction)
+    finish('risk_factors', 1.0)
+
+    timings['total'] = (time.perf_counter() - start) * 1000
+    return {
+        'features': features,
+        'fraud_score': fraud_score,
+        'confidence': confidence,
+        'method': method,
+        'confidence_breakdown': confidence_breakdown,
+        'risk_level': base_risk,
+        'recommendation': recommendation,
+        'risk_factors': risk_factors,
+        'velocity': velocity,
+        'timings_ms': timings
+    }
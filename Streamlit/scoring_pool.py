@@ -0,0 +1,186 @@
+"""
+Multi-process scoring over one shared model image.
+
+XGBoost releases the GIL while predicting, but the confidence pipeline around it
+(preprocessing the perturbation matrix, combining tiers, building breakdowns) is
+Python and runs one core at a time. ScoringPool spreads that work over worker
+processes.
+
+The model is written once into a multiprocessing.shared_memory block and every
+worker builds its model from that block instead of reading the model file itself:
+
+    booster   the booster's UBJSON bytes; each worker still deserializes them with
+              Booster.load_model, so every worker builds and holds its own copy of
+              the trees (only the file reads are shared)
+    compiled  the flat node arrays of compiled_model.CompiledBooster, TreeSHAP path
+              tables included; workers wrap read-only views of the shared pages, so
+              the model exists once in memory however many workers there are, and
+              workers never import xgboost
+
+Only compiled mode is zero-copy. It scores, explains and computes confidence
+like the booster (see compiled_model.py), so prefer it unless the model cannot
+be compiled (categorical splits, very deep trees).
+
+Work is sent in batches (batch_size transactions, or an even share of the rows
+for inplace_predict) and results come back in input order. Workers are started
+with 'spawn', which is safe from threaded hosts such as Streamlit and uvicorn,
+and copy the parent's confidence mode. Stage metrics are recorded in the workers
+and are not merged into the parent's.
+
+A pool offers predict_with_confidence_batch and inplace_predict, so it can be
+passed wherever the scoring code takes a classifier (scoring.predict_with_confidence,
+batch_scoring.score_file, the service).
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import confidence
+from compiled_model import PATH_ARRAYS, CompiledBooster, compile_booster
+
+# Transactions per task on the confidence path
+DEFAULT_BATCH_SIZE = 64
+
+# inplace_predict only splits inputs into tasks of at least this many rows
+MIN_PREDICT_ROWS = 4096
+
+# Shared arrays start on cache-line boundaries
+_ALIGNMENT = 64
+
+# Array attributes and scalar attributes of a CompiledBooster
+_COMPILED_ARRAYS = ('feature', 'threshold', 'default_right', 'leaf_value', 'leaf_node', 'iteration_indptr')
+_COMPILED_SCALARS = ('base_margin', 'objective', 'feature_names', 'num_features')
+
+# Per-process state of a pool worker
+_worker_model = None
+_worker_memory = None
+
+
+def _model_image(model, compiled):
+    """(kind, {name: array}, {name: scalar}) describing the model to share"""
+    if compiled or isinstance(model, CompiledBooster):
+        if not isinstance(model, CompiledBooster):
+            model = compile_booster(model)
+        arrays = {name: getattr(model, name) for name in _COMPILED_ARRAYS}
+        # TreeSHAP tables, so workers explain and score confidence like the booster does
+        arrays.update((name, model.path_tables[name]) for name in PATH_ARRAYS if name in model.path_tables)
+        scalars = {name: getattr(model, name) for name in _COMPILED_SCALARS}
+        scalars['base_margin'] = float(scalars['base_margin'])
+        scalars['expected_margin'] = model.expected_margin
+        return 'compiled', arrays, scalars
+    raw = np.frombuffer(bytes(model.save_raw('ubj')), dtype=np.uint8)
+    return 'booster', {'raw': raw}, {}
+
+
+def _attach_arrays(memory, layout):
+    arrays = {}
+    for name, (offset, shape, dtype) in layout.items():
+        array = np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)
+        array.flags.writeable = False
+        arrays[name] = array
+    return arrays
+
+
+def _init_worker(memory_name, kind, layout, scalars, confidence_settings):
+    global _worker_model, _worker_memory
+
+    # Spawned workers share the parent's resource tracker, so the block is unlinked once, by the parent
+    memory = shared_memory.SharedMemory(name=memory_name)
+    arrays = _attach_arrays(memory, layout)
+
+    if kind == 'compiled':
+        _worker_model = CompiledBooster(**arrays, **scalars)
+    else:
+        import xgboost as xgb
+
+        _worker_model = xgb.Booster()
+        _worker_model.load_model(bytearray(arrays['raw']))
+        # Parallelism comes from the processes; one OpenMP thread each avoids oversubscription
+        _worker_model.set_param({'nthread': 1})
+    _worker_memory = memory
+    confidence.configure(**confidence_settings)
+
+
+def _score_batch(feature_lists):
+    from scoring import predict_with_confidence_batch
+
+    return predict_with_confidence_batch(_worker_model, feature_lists)
+
+
+def _predict_rows(data, predict_type):
+    return _worker_model.inplace_predict(data, predict_type=predict_type)
+
+
+def _worker_pid(_):
+    return os.getpid()
+
+
+class ScoringPool:
+    """
+    Worker processes scoring with one model image in shared memory
+    compiled: share compiled node arrays (one copy in memory) instead of the booster's bytes (one copy per worker)
+    """
+
+    def __init__(self, model, processes=None, batch_size=DEFAULT_BATCH_SIZE, compiled=False):
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.kind, arrays, scalars = _model_image(model, compiled)
+
+        layout, size = {}, 0
+        for name, array in arrays.items():
+            offset = -(-size // _ALIGNMENT) * _ALIGNMENT
+            layout[name] = (offset, array.shape, array.dtype.str)
+            size = offset + array.nbytes
+        self.image_bytes = size
+        self._memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            offset, shape, dtype = layout[name]
+            np.ndarray(shape, dtype=dtype, buffer=self._memory.buf, offset=offset)[...] = array
+
+        mode = confidence.confidence_mode()
+        settings = {'tiered': mode['mode'] == 'tiered', 'uncertain_band': mode['uncertain_band']}
+        self._executor = ProcessPoolExecutor(
+            self.processes, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+            initargs=(self._memory.name, self.kind, layout, scalars, settings)
+        )
+        self.warm()
+
+    def warm(self):
+        """Start every worker now rather than on the first request"""
+        list(self._executor.map(_worker_pid, range(self.processes)))
+
+    def predict_with_confidence_batch(self, feature_lists):
+        """scoring.predict_with_confidence_batch, batch_size transactions per worker task, in input order"""
+        batches = [feature_lists[start:start + self.batch_size]
+                   for start in range(0, len(feature_lists), self.batch_size)]
+        return [result for batch in self._executor.map(_score_batch, batches) for result in batch]
+
+    def inplace_predict(self, data, predict_type='value'):
+        """Booster.inplace_predict with the rows split evenly over the workers"""
+        rows = len(data)
+        tasks = max(1, min(self.processes, rows // MIN_PREDICT_ROWS))
+        bounds = np.linspace(0, rows, tasks + 1).astype(int)
+        parts = [data[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+        return np.concatenate(list(self._executor.map(_predict_rows, parts, [predict_type] * tasks)))
+
+    def stats(self):
+        return {
+            'processes': self.processes,
+            'batch_size': self.batch_size,
+            'image': self.kind,
+            'image_bytes': self.image_bytes
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._memory.close()
+        self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,512 @@
+"""
+Async HTTP scoring service for the Next.js dashboard.
+
+    POST /predict  -> {fraudScore, confidence, riskLevel, recommendation, confidenceTiers, factors}
+                      (?model=<name> scores with another artifact from models/)
+    GET  /models   -> available artifacts and which ones are warm
+    GET  /metrics  -> stage timers and counters in Prometheus text format (with --metrics)
+    GET  /health   -> model status
+    GET  /stats    -> request count, p50/p99 scoring latency, micro-batch histograms, result cache
+                      counters and velocity store occupancy
+
+The booster is loaded and warmed once at startup and shared by a bounded thread
+pool (XGBoost releases the GIL while predicting). When every worker and queue slot
+is busy the service answers 503 instead of letting latency grow without bound.
+
+With --batch-size > 1, concurrent requests are coalesced by a MicroBatcher and
+scored together in one booster call (see microbatch.py).
+
+With --confidence tiered, transactions whose score alone settles the decision
+skip the expensive confidence tiers (see confidence.py); confidenceTiers lists
+the tiers that ran.
+
+Usage:
+    python service.py [--host 127.0.0.1] [--port 8000] [--workers 4] [--max-pending 64]
+                      [--batch-size 32] [--max-wait-us 500] [--metrics]
+                      [--confidence tiered] [--uncertain-band 0.05]
+                      [--result-cache-size 4096] [--result-cache-ttl 300] [--velocity-mb 256]
+                      [--velocity-snapshot snapshot_dir] [--snapshot-interval 60]
+                      [--processes 8] [--pool-compiled]
+                      [--shadow-models 2momtsim_fraud_model.bin ...] [--shadow-log shadow.log]
+                      [--watch-interval 5]
+
+With --processes N, the default model is scored by N worker processes (see
+scoring_pool.py); the scoring threads only dispatch batches, so use at least as
+many --workers as processes. Add --pool-compiled to keep a single copy of the
+model in shared memory; without it every worker deserializes its own copy.
+
+With --velocity-snapshot, the velocity store starts from the latest snapshot under
+that directory (memory-mapped, see velocity.py) and publishes a new one every
+--snapshot-interval seconds and at shutdown, so a restart does not lose account
+history.
+
+With --shadow-models, every request scored by the default model is also scored
+by those candidate models on a background thread, after the response is decided;
+score deltas, risk-level flips and latencies go to --shadow-log (see shadow.py).
+
+Warm models whose artifact in models/ is replaced are reloaded, validated on a
+canary batch and swapped in without a restart (polled every --watch-interval
+seconds, 0 disables; see model_watcher.py). Requests already scoring finish on
+the old model. A --model path outside models/ is not watched.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import confidence
+import metrics
+from microbatch import MicroBatcher
+from model_registry import DEFAULT_MAX_BYTES, ModelRegistry, is_servable
+from model_watcher import DEFAULT_WATCH_INTERVAL, ModelWatcher, retire
+from preprocessing import preprocess_transaction
+from result_cache import DEFAULT_TTL_SECONDS, ResultCache
+from risk_rules import active_rules
+from scoring import WARMUP_TRANSACTION, explain_risk_factors, load_booster, predict_with_confidence_batch, recommend
+from scoring_pool import ScoringPool
+from shadow import DEFAULT_SHADOW_LOG, ShadowScorer
+from velocity import DEFAULT_SNAPSHOT_INTERVAL, AccountFeatureStore
+
+# Dashboard form field names -> MomtSim columns
+FIELD_ALIASES = {
+    'type': 'transactionType',
+    'nameOrig': 'initiator',
+    'oldbalanceOrg': 'oldBalInitiator',
+    'newbalanceOrig': 'newBalInitiator',
+    'nameDest': 'recipient',
+    'oldbalanceDest': 'oldBalRecipient',
+    'newbalanceDest': 'newBalRecipient'
+}
+
+# PaySim-style transaction types offered by the dashboard form
+TYPE_ALIASES = {
+    'CASH_OUT': 'WITHDRAWAL',
+    'CASH_IN': 'DEPOSIT'
+}
+
+# The dashboard only renders BLOCK / REVIEW / APPROVE
+DASHBOARD_RECOMMENDATIONS = {
+    'BLOCK_LOW_CONFIDENCE': 'BLOCK',
+    'HUMAN_REVIEW_REQUIRED': 'REVIEW'
+}
+
+BALANCE_FIELDS = ['oldBalInitiator', 'newBalInitiator', 'oldBalRecipient', 'newBalRecipient']
+
+MAX_BODY_BYTES = 64 * 1024
+
+def parse_transaction(payload):
+    """Normalize a JSON payload (MomtSim or dashboard field names) into MomtSim columns"""
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    fields = {FIELD_ALIASES.get(key, key): value for key, value in payload.items()}
+
+    errors = []
+    for key in ('initiator', 'recipient'):
+        if not str(fields.get(key) or '').strip():
+            errors.append(f"{key} is required")
+
+    try:
+        amount = float(fields.get('amount') or 0)
+        step = float(fields.get('step') or 1)  # the form's default when no step is given
+        balances = {key: float(fields.get(key) or 0) for key in BALANCE_FIELDS}
+    except (TypeError, ValueError):
+        raise ValueError("step, amount and balances must be numbers")
+    if amount <= 0:
+        errors.append("amount must be greater than 0")
+    if errors:
+        raise ValueError("; ".join(errors))
+
+    transaction_type = str(fields.get('transactionType') or '').upper()
+    return {
+        'step': step,
+        'transactionType': TYPE_ALIASES.get(transaction_type, transaction_type),
+        'amount': amount,
+        'initiator': str(fields['initiator']).strip(),
+        'recipient': str(fields['recipient']).strip(),
+        **balances
+    }
+
+
+def score_transaction(classifier, transaction, cache=None, feature_store=None, shadow=None):
+    """Score one parsed transaction into the dashboard's prediction object"""
+    return score_transactions(classifier, [transaction], cache, feature_store, shadow)[0]
+
+
+def score_transactions(classifier, transactions, cache=None, feature_store=None, shadow=None):
+    """
+    Score parsed transactions with one batched booster call, one prediction object each
+    cache: optional ResultCache; cached transactions skip the booster
+    feature_store: optional AccountFeatureStore; adds each transaction's velocity features
+    shadow: optional callable(feature_lists, fraud_scores, latency_ms), e.g. ShadowScorer.submit
+    """
+    with metrics.timer('preprocess'):
+        feature_lists = [
+            preprocess_transaction(
+                t['step'], t['transactionType'], t['amount'], t['initiator'], t['oldBalInitiator'],
+                t['newBalInitiator'], t['recipient'], t['oldBalRecipient'], t['newBalRecipient']
+            )
+            for t in transactions
+        ]
+        velocity = [feature_store.record(t) for t in transactions] if feature_store is not None else None
+
+    start = time.perf_counter()
+    with metrics.timer('predict'):
+        predictions = predict_with_confidence_batch(classifier, feature_lists, cache)
+    if shadow is not None:
+        shadow(feature_lists, [prediction[0] for prediction in predictions], (time.perf_counter() - start) * 1000)
+
+    with metrics.timer('risk_factors'):
+        # Transactions without TreeSHAP contributions are explained by the rule table, one pass for all of them
+        ruled = [k for k, prediction in enumerate(predictions) if not prediction[3].get('contributions')]
+        rule_factors = dict(zip(ruled, active_rules().factor_lists([transactions[k] for k in ruled]))) if ruled else {}
+
+    results = []
+    for k, (transaction, features, (fraud_score, confidence, _, breakdown)) in enumerate(
+            zip(transactions, feature_lists, predictions)):
+        risk, recommendation = recommend(fraud_score, confidence)
+        with metrics.timer('risk_factors'):
+            factors = explain_risk_factors(features, breakdown, transaction, rule_factors.get(k))
+        results.append({
+            'fraudScore': float(fraud_score),
+            'confidence': float(confidence),
+            'riskLevel': risk,
+            'recommendation': DASHBOARD_RECOMMENDATIONS.get(recommendation, recommendation),
+            'confidenceTiers': breakdown.get('tiers', []),
+            'factors': [
+                {'name': f['factor'], 'impact': float(f['impact']), 'description': f['description']}
+                for f in factors
+            ]
+        })
+        if velocity is not None:
+            results[-1]['velocity'] = velocity[k]
+    return results
+
+
+class ScoringService:
+    """ASGI application serving the warm, shared booster"""
+
+    def __init__(self, model_path=None, workers=4, max_pending=64, latency_window=10000,
+                 batch_size=1, max_wait_us=500, max_model_bytes=DEFAULT_MAX_BYTES,
+                 result_cache_size=0, result_cache_ttl=DEFAULT_TTL_SECONDS, velocity_bytes=0,
+                 velocity_snapshot=None, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL,
+                 processes=1, pool_compiled=False, shadow_models=(), shadow_log=DEFAULT_SHADOW_LOG,
+                 watch_interval=DEFAULT_WATCH_INTERVAL):
+        self.model_path = model_path
+        self.max_pending = max_pending
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait_us = max_wait_us
+        self.classifier = None
+        self.model_loaded = False
+        self._batcher = None
+        self.result_cache = ResultCache(result_cache_size, result_cache_ttl) if result_cache_size > 0 else None
+        self.velocity_bytes = velocity_bytes
+        self.velocity_snapshot = velocity_snapshot
+        self.snapshot_interval = snapshot_interval
+        self.feature_store = None
+        self.processes = processes
+        self.pool_compiled = pool_compiled
+        self.scoring_pool = None
+        self.shadow_models = list(shadow_models)
+        self.shadow_log = shadow_log
+        self.shadow = None
+        self.watch_interval = watch_interval
+        self.watcher = None
+        self.registry = ModelRegistry(max_bytes=max_model_bytes, on_load=self._prepare_model)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scoring')
+        self._pending = 0
+        self._requests = 0
+        self._rejected = 0
+        self._latencies_ms = collections.deque(maxlen=latency_window)
+
+    def _prepare_model(self, name, model):
+        """Configure and warm a booster right after it loads"""
+        if is_servable(model):
+            if hasattr(model, 'set_param'):
+                # Parallelism comes from the worker pool; one OpenMP thread per call avoids oversubscription
+                model.set_param({'nthread': 1})
+            score_transaction(model, WARMUP_TRANSACTION)
+
+    def startup(self):
+        """Load the default booster once and warm it with a dummy prediction"""
+        self._open_feature_store()
+        if self.model_path:
+            self.classifier, self.model_loaded = load_booster(self.model_path)
+            if self.model_loaded:
+                self._prepare_model(self.model_path, self.classifier)
+        else:
+            try:
+                self.classifier, self.model_loaded = self.registry.get(), True
+            except Exception as e:
+                print(f"Error loading model: {e}")
+        if self.model_loaded and self.processes > 1:
+            self.scoring_pool = ScoringPool(self.classifier, self.processes, compiled=self.pool_compiled)
+            self.classifier = self.scoring_pool
+        if self.model_loaded and self.shadow_models:
+            primary = os.path.basename(self.model_path) if self.model_path else self.registry.default_name
+            self.shadow = ShadowScorer(self.registry, self.shadow_models, self.shadow_log, primary=primary)
+            self.shadow.warm()
+        if self.model_loaded and self.batch_size > 1:
+            self._batcher = MicroBatcher(
+                lambda transactions: score_transactions(self.classifier, transactions, self.result_cache,
+                                                        self.feature_store, self._shadow_submit()),
+                max_batch_size=self.batch_size, max_wait_us=self.max_wait_us, workers=self.workers
+            )
+        if self.watch_interval > 0:
+            self.watcher = ModelWatcher(self.registry, self.watch_interval, on_swap=self._swap_model).start()
+
+    def _swap_model(self, name, model):
+        """Point the default path at a reloaded default model; ?model= requests pick it up from the registry"""
+        if self.model_path or name != self.registry.default_name:
+            return
+        if self.scoring_pool is not None:
+            old_pool = self.scoring_pool
+            self.scoring_pool = ScoringPool(model, self.processes, compiled=self.pool_compiled)
+            self.classifier = self.scoring_pool
+            # Requests that already picked up the old pool keep dispatching to it until it is closed
+            retire(old_pool)
+        else:
+            self.classifier = model
+
+    def _shadow_submit(self):
+        return self.shadow.submit if self.shadow is not None else None
+
+    def _open_feature_store(self):
+        """Velocity store from the latest snapshot, or an empty one"""
+        if self.velocity_snapshot:
+            self.feature_store = AccountFeatureStore.load_snapshot(self.velocity_snapshot, writable=True)
+        if self.feature_store is None and self.velocity_bytes > 0:
+            self.feature_store = AccountFeatureStore(max_bytes=self.velocity_bytes)
+        elif self.feature_store is None and self.velocity_snapshot:
+            self.feature_store = AccountFeatureStore()
+        if self.velocity_snapshot:
+            self.feature_store.start_autosave(self.velocity_snapshot, self.snapshot_interval)
+
+    def shutdown(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self._batcher is not None:
+            self._batcher.close()
+        self._executor.shutdown(wait=True)
+        if self.scoring_pool is not None:
+            self.scoring_pool.close()
+        if self.feature_store is not None:
+            self.feature_store.stop_autosave()
+        if self.shadow is not None:
+            self.shadow.close()
+
+    def stats(self):
+        latencies = np.asarray(self._latencies_ms)
+        stats = {
+            'requests': self._requests,
+            'rejected': self._rejected,
+            'pending': self._pending,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'confidence': confidence.confidence_mode()
+        }
+        if self.result_cache is not None:
+            stats['result_cache'] = self.result_cache.stats()
+        if self.feature_store is not None:
+            stats['velocity'] = self.feature_store.stats()
+        if self._batcher is not None:
+            stats['microbatch'] = self._batcher.stats()
+        if self.scoring_pool is not None:
+            stats['pool'] = self.scoring_pool.stats()
+        if self.shadow is not None:
+            stats['shadow'] = self.shadow.stats()
+        if self.watcher is not None:
+            stats['watcher'] = self.watcher.stats()
+        return stats
+
+    def render_metrics(self):
+        """Scoring-path metrics plus the micro-batcher's histograms, in Prometheus text format"""
+        extra = {}
+        if self._batcher is not None:
+            extra = {
+                'microbatch_batch_size': (self._batcher.batch_sizes, 'Requests scored per micro-batch'),
+                'microbatch_queue_depth': (self._batcher.queue_depths, 'Requests already queued when one arrives')
+            }
+        return metrics.render_prometheus(extra)
+
+    async def predict(self, body, model_name=None):
+        if not self.model_loaded:
+            return 503, {'error': 'Model not loaded'}
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            return 503, {'error': 'Scoring queue is full, retry shortly'}
+
+        try:
+            transaction = parse_transaction(json.loads(body or b'null'))
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            if model_name:
+                # Named models skip the micro-batcher, which is bound to the default booster
+                try:
+                    classifier = await loop.run_in_executor(self._executor, self.registry.get, model_name)
+                except KeyError as e:
+                    return 404, {'error': e.args[0]}
+                if not is_servable(classifier):
+                    return 400, {'error': f"{model_name} is not an XGBoost or compiled booster and cannot be served here"}
+                result = await loop.run_in_executor(self._executor, score_transaction, classifier, transaction,
+                                                    self.result_cache, self.feature_store)
+            elif self._batcher is not None:
+                result = await asyncio.wrap_future(self._batcher.submit(transaction))
+            else:
+                result = await loop.run_in_executor(self._executor, score_transaction, self.classifier, transaction,
+                                                    self.result_cache, self.feature_store, self._shadow_submit())
+        finally:
+            self._pending -= 1
+        self._requests += 1
+        self._latencies_ms.append((time.perf_counter() - start) * 1000)
+        return 200, result
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        method, path = scope['method'], scope['path']
+        if method == 'OPTIONS':
+            await self._respond(send, 204, None)
+        elif method == 'POST' and path == '/predict':
+            body = await self._read_body(receive)
+            if body is None:
+                await self._respond(send, 413, {'error': 'Request body too large'})
+            else:
+                query = urllib.parse.parse_qs(scope.get('query_string', b'').decode())
+                status, payload = await self.predict(body, query.get('model', [None])[0])
+                await self._respond(send, status, payload)
+        elif method == 'GET' and path == '/health':
+            await self._respond(send, 200 if self.model_loaded else 503, {'modelLoaded': self.model_loaded})
+        elif method == 'GET' and path == '/stats':
+            await self._respond(send, 200, self.stats())
+        elif method == 'GET' and path == '/metrics':
+            await self._respond_text(send, 200, self.render_metrics())
+        elif method == 'GET' and path == '/models':
+            await self._respond(send, 200, {'models': self.registry.describe(), **self.registry.stats()})
+        else:
+            await self._respond(send, 404, {'error': f'No route for {method} {path}'})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await asyncio.get_running_loop().run_in_executor(self._executor, self.startup)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY_BYTES:
+                return None
+            if not message.get('more_body', False):
+                return body
+
+    async def _respond_text(self, send, status, text):
+        headers = [(b'content-type', b'text/plain; version=0.0.4; charset=utf-8')]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': text.encode()})
+
+    async def _respond(self, send, status, payload):
+        headers = [
+            (b'access-control-allow-origin', b'*'),
+            (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+            (b'access-control-allow-headers', b'content-type')
+        ]
+        body = b''
+        if payload is not None:
+            body = json.dumps(payload).encode()
+            headers.append((b'content-type', b'application/json'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fraud predictions over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4, help="Scoring threads sharing the booster")
+    parser.add_argument('--max-pending', type=int, default=64, help="Requests in flight before answering 503")
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help="Coalesce up to this many concurrent requests into one booster call (1 disables)")
+    parser.add_argument('--max-wait-us', type=int, default=500,
+                        help="Longest a request waits for others to join its batch")
+    parser.add_argument('--model', default=None, help="Model file (defaults to the app's model)")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Record stage timers and counters for GET /metrics (also FRAUDGUARD_METRICS=1)")
+    parser.add_argument('--confidence', choices=('full', 'tiered'), default=None,
+                        help="'tiered' skips the expensive confidence tiers when the score alone settles "
+                             "the decision (also FRAUDGUARD_CONFIDENCE=tiered)")
+    parser.add_argument('--uncertain-band', type=float, default=None,
+                        help="Half-width of the score band around each decision threshold where tiered "
+                             f"mode still runs every tier (default {confidence.DEFAULT_UNCERTAIN_BAND})")
+    parser.add_argument('--result-cache-size', type=int, default=0,
+                        help="Cache this many recent predictions for resubmitted transactions (0 disables)")
+    parser.add_argument('--result-cache-ttl', type=float, default=DEFAULT_TTL_SECONDS,
+                        help="Seconds a cached prediction stays valid")
+    parser.add_argument('--velocity-mb', type=int, default=0,
+                        help="Memory budget for per-account velocity features added to each prediction (0 disables)")
+    parser.add_argument('--velocity-snapshot', default=None,
+                        help="Directory to load velocity state from at startup and publish snapshots into")
+    parser.add_argument('--snapshot-interval', type=float, default=DEFAULT_SNAPSHOT_INTERVAL,
+                        help="Seconds between velocity snapshots")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Score the default model on this many worker processes sharing one copy of it")
+    parser.add_argument('--pool-compiled', action='store_true',
+                        help="Share the model with the workers as compiled node arrays, held once in memory "
+                             "(otherwise every worker deserializes its own copy of the booster)")
+    parser.add_argument('--shadow-models', nargs='+', default=(),
+                        help="Candidate models from models/ scored off the request path for comparison")
+    parser.add_argument('--shadow-log', default=DEFAULT_SHADOW_LOG, help="Append-only shadow comparison log")
+    parser.add_argument('--watch-interval', type=float, default=DEFAULT_WATCH_INTERVAL,
+                        help="Seconds between checks for replaced model artifacts (0 disables hot reload)")
+    parser.add_argument('--max-model-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Memory budget for warm models selected with ?model=")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    for name in args.shadow_models:
+        try:
+            ModelRegistry().path(name)
+        except KeyError as e:
+            raise SystemExit(e.args[0])
+    if args.metrics:
+        metrics.enable()
+    confidence.configure(tiered=args.confidence == 'tiered' if args.confidence else None,
+                         uncertain_band=args.uncertain_band)
+
+    app = ScoringService(args.model, workers=args.workers, max_pending=args.max_pending,
+                         batch_size=args.batch_size, max_wait_us=args.max_wait_us,
+                         max_model_bytes=args.max_model_mb * 1024 * 1024,
+                         result_cache_size=args.result_cache_size, result_cache_ttl=args.result_cache_ttl,
+                         velocity_bytes=args.velocity_mb * 1024 * 1024,
+                         velocity_snapshot=args.velocity_snapshot, snapshot_interval=args.snapshot_interval,
+                         processes=args.processes, pool_compiled=args.pool_compiled,
+                         shadow_models=args.shadow_models, shadow_log=args.shadow_log,
+                         watch_interval=args.watch_interval)
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
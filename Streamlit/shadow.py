@@ -0,0 +1,269 @@
+"""
+Shadow scoring: candidate models score live traffic off the request path.
+
+The primary model's decision is what callers get. After it is made, the scoring
+path hands the transactions' feature lists, the primary scores and the primary
+predict latency to ShadowScorer.submit(), which only enqueues them (a full
+queue drops the batch and counts it; it never waits). A background thread then
+scores the same feature matrix with every candidate model from the model
+registry, one booster call per candidate, and appends one record per
+(transaction, candidate) to an append-only log of fixed-size binary records:
+
+    time            float64  unix seconds the primary scored the batch
+    primary         uint16   model index (see below)
+    candidate       uint16   model index
+    batch           uint16   transactions scored in the same call
+    primary_score   float32
+    candidate_score float32  NaN when the candidate failed
+    primary_ms      float32  predict latency of the primary call (whole batch)
+    candidate_ms    float32  booster call latency of the candidate (whole batch)
+    flags           uint8    LEVEL_FLIP: the risk level (LOW/MEDIUM/HIGH) differs, FAILED: the candidate
+                             could not score
+
+Only the risk levels of the two scores are compared: a risk-level flip is not
+necessarily a different recommend() outcome, which also weighs confidence.
+
+Model indexes refer to the names in the sidecar file <log>.models (JSON list),
+which only ever grows, so a log can span restarts and model changes. A record is
+SHADOW_RECORD.itemsize (31) bytes; a crash can at most leave a torn last record,
+which read_log() ignores and the next ShadowScorer on that log cuts off.
+
+Usage:
+    python shadow.py shadow.log [--json summary.json]    # per-model deltas, risk-level flip rate and latency
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from preprocessing import MODEL_FEATURE_INDEX
+
+SHADOW_RECORD = np.dtype([
+    ('time', '<f8'), ('primary', '<u2'), ('candidate', '<u2'), ('batch', '<u2'),
+    ('primary_score', '<f4'), ('candidate_score', '<f4'), ('primary_ms', '<f4'), ('candidate_ms', '<f4'),
+    ('flags', 'u1')
+])
+
+LEVEL_FLIP = 1
+FAILED = 2
+
+# Bucket bounds of scoring.risk_level (LOW < 0.4 <= MEDIUM < 0.7 <= HIGH)
+RISK_LEVEL_BOUNDS = np.array([0.4, 0.7], dtype=np.float32)
+
+# Lowest CPU priority (nice value) for the shadow thread where the OS supports per-thread priorities
+SHADOW_NICE = 19
+
+# Batches waiting for the shadow thread; more are dropped rather than queued
+DEFAULT_MAX_PENDING = 1024
+
+DEFAULT_SHADOW_LOG = 'shadow.log'
+MODELS_SUFFIX = '.models'
+
+
+def _models_path(log_path):
+    return log_path + MODELS_SUFFIX
+
+
+def read_models(log_path):
+    try:
+        with open(_models_path(log_path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def read_log(log_path):
+    """(records, model names) of a shadow log; a torn last record is ignored"""
+    with open(log_path, 'rb') as f:
+        data = f.read()
+    usable = len(data) - len(data) % SHADOW_RECORD.itemsize
+    return np.frombuffer(data[:usable], dtype=SHADOW_RECORD), read_models(log_path)
+
+
+def summarize(records, names):
+    """
+    Per primary -> candidate pair: score deltas, risk-level flips, failures and latency percentiles
+    Candidate latencies cover only the calls it scored (None if it never did).
+    """
+    summary = {}
+    pairs = sorted(set(zip(records['primary'].tolist(), records['candidate'].tolist())))
+    for primary, candidate in pairs:
+        pair = records[(records['primary'] == primary) & (records['candidate'] == candidate)]
+        scored = pair[(pair['flags'] & FAILED) == 0]
+        delta = scored['candidate_score'].astype(np.float64) - scored['primary_score']
+        # Latencies are per call, so count each batch once
+        calls = pair[np.r_[True, pair['time'][1:] != pair['time'][:-1]]]
+        scored_calls = calls[(calls['flags'] & FAILED) == 0]
+        level_flips = int(np.count_nonzero(scored['flags'] & LEVEL_FLIP))
+        summary[f'{names[primary]} -> {names[candidate]}'] = {
+            'transactions': len(pair),
+            'failed': int(len(pair) - len(scored)),
+            'mean_delta': float(delta.mean()) if len(delta) else None,
+            'mean_abs_delta': float(np.abs(delta).mean()) if len(delta) else None,
+            'max_abs_delta': float(np.abs(delta).max()) if len(delta) else None,
+            'risk_level_flips': level_flips,
+            'risk_level_flip_rate': float(level_flips / len(scored)) if len(scored) else None,
+            'primary_p50_ms': float(np.percentile(calls['primary_ms'], 50)),
+            'primary_p99_ms': float(np.percentile(calls['primary_ms'], 99)),
+            'candidate_p50_ms': float(np.percentile(scored_calls['candidate_ms'], 50)) if len(scored_calls) else None,
+            'candidate_p99_ms': float(np.percentile(scored_calls['candidate_ms'], 99)) if len(scored_calls) else None
+        }
+    return summary
+
+
+class ShadowScorer:
+    """
+    Scores candidate models on a background thread and logs how they compare with the primary
+    registry: model_registry.ModelRegistry the candidates are loaded from (lazily, on the shadow thread)
+    primary: name recorded for the primary model when submit() is not given one
+    """
+
+    def __init__(self, registry, candidates, log_path, primary=None, max_pending=DEFAULT_MAX_PENDING):
+        self.registry = registry
+        self.candidates = list(candidates)
+        self.log_path = log_path
+        self.primary = primary or registry.default_name
+        self._names = read_models(log_path)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._log = open(log_path, 'ab')
+        # Drop a record torn by a crash, so new records stay aligned
+        torn = os.path.getsize(log_path) % SHADOW_RECORD.itemsize
+        if torn:
+            self._log.truncate(os.path.getsize(log_path) - torn)
+        self._submitted = 0
+        self._dropped = 0
+        self._scored = 0
+        self._level_flips = 0
+        self._failures = {}
+        self._thread = threading.Thread(target=self._run, name='shadow-scorer', daemon=True)
+        self._thread.start()
+
+    def _model_index(self, name):
+        if name not in self._names:
+            self._names.append(name)
+            with open(_models_path(self.log_path) + '.tmp', 'w') as f:
+                json.dump(self._names, f)
+            os.replace(_models_path(self.log_path) + '.tmp', _models_path(self.log_path))
+        return self._names.index(name)
+
+    def submit(self, feature_lists, fraud_scores, latency_ms, primary=None):
+        """Queue a primary batch for shadow scoring; never blocks (full queue: the batch is dropped)"""
+        try:
+            self._queue.put_nowait((time.time(), primary or self.primary, feature_lists, fraud_scores, latency_ms))
+            self._submitted += 1
+        except queue.Full:
+            self._dropped += 1
+            metrics.increment('shadow_dropped')
+
+    def warm(self):
+        """Load every candidate now, so the first shadow batches do not load them while requests are served"""
+        for name in self.candidates:
+            try:
+                self.registry.get(name)
+            except Exception as e:
+                self._failures[name] = str(e)
+
+    def _run(self):
+        try:
+            # On Linux every thread is its own schedulable task, so only this thread yields the CPU
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), SHADOW_NICE)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            try:
+                self._score(*batch)
+            except Exception as e:
+                print(f"Error in shadow scoring: {e}")
+
+    def _score(self, timestamp, primary, feature_lists, fraud_scores, latency_ms):
+        # Same float64 -> float32 rounding as the primary's confidence matrix
+        matrix = np.asarray(feature_lists, dtype=np.float64)[:, MODEL_FEATURE_INDEX].astype(np.float32)
+        primary_scores = np.asarray(fraud_scores, dtype=np.float32)
+        primary_levels = np.searchsorted(RISK_LEVEL_BOUNDS, primary_scores, side='right')
+
+        records = np.zeros(len(self.candidates) * len(matrix), dtype=SHADOW_RECORD)
+        records['time'] = timestamp
+        records['primary'] = self._model_index(primary)
+        records['batch'] = min(len(matrix), np.iinfo(np.uint16).max)
+        records['primary_score'] = np.tile(primary_scores, len(self.candidates))
+        records['primary_ms'] = latency_ms
+
+        for k, name in enumerate(self.candidates):
+            rows = records[k * len(matrix):(k + 1) * len(matrix)]
+            rows['candidate'] = self._model_index(name)
+            try:
+                candidate = self.registry.get(name)
+                start = time.perf_counter()
+                scores = np.asarray(candidate.inplace_predict(matrix), dtype=np.float32)
+            except Exception as e:
+                rows['candidate_score'] = np.nan
+                rows['flags'] = FAILED
+                self._failures[name] = str(e)
+                continue
+            rows['candidate_ms'] = (time.perf_counter() - start) * 1000
+            rows['candidate_score'] = scores
+            rows['flags'] = np.where(np.searchsorted(RISK_LEVEL_BOUNDS, scores, side='right') != primary_levels,
+                                    LEVEL_FLIP, 0)
+
+        level_flips = int(np.count_nonzero(records['flags'] & LEVEL_FLIP))
+        self._log.write(records.tobytes())
+        self._log.flush()
+        self._scored += len(matrix)
+        self._level_flips += level_flips
+        metrics.increment('shadow_scored', len(matrix))
+        metrics.increment('shadow_risk_level_flips', level_flips)
+
+    def stats(self):
+        return {
+            'candidates': self.candidates,
+            'log': self.log_path,
+            'submitted': self._submitted,
+            'dropped': self._dropped,
+            'pending': self._queue.qsize(),
+            'scored': self._scored,
+            'risk_level_flips': self._level_flips,
+            'failures': dict(self._failures)
+        }
+
+    def close(self, timeout=None):
+        """Finish the queued batches and close the log"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a shadow scoring log")
+    parser.add_argument('log', help="Log written by ShadowScorer")
+    parser.add_argument('--json', default=None, help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    records, names = read_log(args.log)
+    summary = summarize(records, names)
+    if not summary:
+        print("No shadow records yet")
+    for pair, result in summary.items():
+        delta = result['mean_delta']
+        print(f"{pair}: {result['transactions']:,} transactions, {result['failed']:,} failed"
+              + (f" | delta mean {delta:+.4f}, mean |delta| {result['mean_abs_delta']:.4f}, "
+                 f"max |delta| {result['max_abs_delta']:.4f} | {result['risk_level_flips']:,} risk-level flips "
+                 f"({result['risk_level_flip_rate']:.2%})" if delta is not None else "")
+              + f" | p50/p99 ms primary {result['primary_p50_ms']:.2f}/{result['primary_p99_ms']:.2f}"
+              + (f", candidate {result['candidate_p50_ms']:.2f}/{result['candidate_p99_ms']:.2f}"
+                 if result['candidate_p50_ms'] is not None else ", candidate never scored"))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+"""
+Headless streaming consumer for a live transaction feed.
+
+Events are newline-delimited JSON objects with MomtSim or dashboard field names
+(anything service.parse_transaction accepts). They are read from a file that is
+tailed like `tail -F`, from stdin, or from a local Unix or TCP socket, scored in
+batches and answered with one NDJSON decision per event, in the order the events
+were read:
+
+    {"offset": 41, "event": "tx-123", "recommendation": "REVIEW", "riskLevel": "MEDIUM",
+     "fraudScore": 0.52, "confidence": 0.81, "confidenceTiers": [...], "factors": [...], "lagMs": 12.4}
+
+Decisions follow the dashboard's policy (scoring.recommend, shown as BLOCK / REVIEW /
+APPROVE like the service does). An event that cannot be parsed gets an "error"
+decision instead, and the stream carries on.
+
+Backpressure: readers parse events into a bounded queue that a single scoring
+thread drains batch by batch. When scoring falls behind, the queue fills and
+readers stop reading: a tailed file simply grows on disk, and a socket producer is
+throttled by the socket's flow control. Memory stays bounded by queue_size events
+plus one batch, and event lines longer than MAX_EVENT_BYTES are cut off.
+
+Lag is measured end to end, from the event's own time (eventTime or timestamp, in
+epoch seconds or milliseconds) or else from when it was read, to when its
+decision was written. Throughput, lag percentiles and queue depth are printed to
+stderr every --report-interval seconds; with --metrics-port the counters and the
+lag histogram are served in Prometheus text format.
+
+Usage:
+    python streaming.py events.ndjson [--follow] [--output decisions.ndjson]
+    python streaming.py --socket /tmp/fraudguard.sock | --port 9009 [--host 127.0.0.1]
+    python streaming.py - < events.ndjson
+    (all modes also take [--batch-size 256] [--max-wait-ms 20] [--queue-size 4096] [--model name]
+     [--processes 4] [--confidence tiered] [--velocity-mb 256] [--metrics-port 9100])
+"""
+import argparse
+import collections
+import itertools
+import json
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+import confidence
+import metrics
+from metrics import Histogram
+from service import MAX_BODY_BYTES, parse_transaction, score_transactions
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_MAX_WAIT_MS = 20
+DEFAULT_QUEUE_SIZE = 4096
+
+# Longest event line kept; longer ones are cut and reported as invalid
+MAX_EVENT_BYTES = MAX_BODY_BYTES
+
+# How often a followed file is checked for new lines, and how often progress is printed
+POLL_INTERVAL = 0.2
+DEFAULT_REPORT_INTERVAL = 10
+
+# Event fields carrying the producer's timestamp and the event's own identifier
+EVENT_TIME_FIELDS = ('eventTime', 'timestamp')
+EVENT_ID_FIELDS = ('id', 'eventId', 'transactionId')
+
+# End-to-end lag bucket bounds, in seconds (1 ms .. 5 min)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 60.0, 300.0)
+
+# Recent lags kept for the percentiles in stats()
+LAG_WINDOW = 10000
+
+_END = object()
+
+
+def _event_time(payload):
+    for field in EVENT_TIME_FIELDS:
+        value = payload.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            # Anything past the year 5000 in seconds is a millisecond timestamp
+            return value / 1000 if value > 1e11 else float(value)
+    return None
+
+
+def _event_id(payload):
+    for field in EVENT_ID_FIELDS:
+        if payload.get(field) is not None:
+            return payload[field]
+    return None
+
+
+def read_lines(readline):
+    """Lines from readline(limit) until EOF, each cut at MAX_EVENT_BYTES"""
+    partial = b''
+    while True:
+        chunk = readline(MAX_EVENT_BYTES)
+        if not chunk:
+            if partial:
+                yield partial
+            return
+        if len(partial) < MAX_EVENT_BYTES:
+            partial += chunk[:MAX_EVENT_BYTES - len(partial)]
+        if chunk.endswith(b'\n'):
+            yield partial
+            partial = b''
+
+
+def _replaced(f, path):
+    """Whether the file at path was rotated away from f or truncated below what f has read"""
+    try:
+        current = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return current.st_ino != os.fstat(f.fileno()).st_ino or current.st_size < f.tell()
+
+
+def tail_lines(path, follow=False, stop=None, poll_interval=POLL_INTERVAL):
+    """
+    Lines of an NDJSON file, each cut at MAX_EVENT_BYTES
+    follow: keep waiting for appended lines like tail -F, reopening the file from
+    its start when it is rotated or truncated, until stop is set
+    """
+    stop = stop or threading.Event()
+    f = open(path, 'rb')
+    partial = b''
+    try:
+        while not stop.is_set():
+            chunk = f.readline(MAX_EVENT_BYTES)
+            if chunk:
+                if len(partial) < MAX_EVENT_BYTES:
+                    partial += chunk[:MAX_EVENT_BYTES - len(partial)]
+                if chunk.endswith(b'\n'):
+                    yield partial
+                    partial = b''
+            elif not follow:
+                if partial:
+                    yield partial
+                return
+            elif _replaced(f, path):
+                f.close()
+                f = open(path, 'rb')
+                partial = b''
+            else:
+                # A line still being written stays in partial until its newline arrives
+                stop.wait(poll_interval)
+    finally:
+        f.close()
+
+
+class StreamConsumer:
+    """Score a feed of NDJSON events in batches and write one decision per event to a sink"""
+
+    def __init__(self, classifier, sink, batch_size=DEFAULT_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 queue_size=DEFAULT_QUEUE_SIZE, cache=None, feature_store=None):
+        self.classifier = classifier
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue_size = queue_size
+        self.cache = cache
+        self.feature_store = feature_store
+        self.lags = Histogram(LAG_BUCKETS)
+        self.stop_event = threading.Event()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._offsets = itertools.count()
+        self._recent_lags = collections.deque(maxlen=LAG_WINDOW)
+        self._events = 0
+        self._decisions = 0
+        self._invalid = 0
+        self._started = time.monotonic()
+
+    def feed(self, lines):
+        """
+        Parse event lines into the queue, blocking while it is full
+        Returns False if the consumer was stopped before the lines ran out.
+        """
+        for line in lines:
+            if not line.strip():
+                continue
+            received = time.time()
+            event_id = error = transaction = None
+            event_time = received
+            try:
+                payload = json.loads(line)
+                if isinstance(payload, dict):
+                    event_id = _event_id(payload)
+                    event_time = _event_time(payload) or received
+                transaction = parse_transaction(payload)
+            except (ValueError, UnicodeDecodeError) as e:
+                error = str(e)
+            if not self._put((next(self._offsets), event_id, event_time, transaction, error)):
+                return False
+        return True
+
+    def finish(self):
+        """No more events will be fed; run() returns once the queue is drained"""
+        self._put(_END)
+
+    def stop(self):
+        """Stop reading and scoring as soon as possible"""
+        self.stop_event.set()
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _collect(self):
+        """The next batch of up to batch_size events, or None at the end of the stream"""
+        while True:
+            if self.stop_event.is_set():
+                return None
+            try:
+                first = self._queue.get(timeout=POLL_INTERVAL)
+                break
+            except queue.Empty:
+                continue
+        if first is _END:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END:
+                # Put it back so the next _collect ends the stream after this batch
+                self._queue.put(_END)
+                break
+            batch.append(item)
+        return batch
+
+    def run(self):
+        """Score batches until finish() has been called and the queue is drained, or stop()"""
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            self._score(batch)
+
+    def _score(self, batch):
+        valid = [transaction for _, _, _, transaction, _ in batch if transaction is not None]
+        try:
+            results = iter(score_transactions(self.classifier, valid, self.cache, self.feature_store))
+        except Exception as e:
+            print(f"Error scoring batch: {e}", file=sys.stderr)
+            results = itertools.repeat({'error': f"Scoring failed: {e}"})
+
+        decisions = []
+        for offset, event_id, _, transaction, error in batch:
+            decision = {'offset': offset}
+            if event_id is not None:
+                decision['event'] = event_id
+            decision.update({'error': error} if transaction is None else next(results))
+            decisions.append(decision)
+        self.sink.write(''.join(json.dumps(decision) + '\n' for decision in decisions))
+        self.sink.flush()
+
+        written = time.time()
+        invalid = 0
+        for (_, _, event_time, _, _), decision in zip(batch, decisions):
+            lag = max(0.0, written - event_time)
+            self.lags.observe(lag)
+            self._recent_lags.append(lag)
+            invalid += 'error' in decision
+        self._events += len(batch)
+        self._decisions += len(batch) - invalid
+        self._invalid += invalid
+        metrics.increment('stream_events', len(batch))
+        metrics.increment('stream_decisions', len(batch) - invalid)
+        metrics.increment('stream_invalid_events', invalid)
+
+    def stats(self):
+        lags = np.asarray(self._recent_lags) * 1000
+        elapsed = time.monotonic() - self._started
+        return {
+            'events': self._events,
+            'decisions': self._decisions,
+            'invalid': self._invalid,
+            'events_per_second': self._events / elapsed if elapsed > 0 else 0.0,
+            'lag_p50_ms': float(np.percentile(lags, 50)) if len(lags) else None,
+            'lag_p99_ms': float(np.percentile(lags, 99)) if len(lags) else None,
+            'queue_depth': self._queue.qsize(),
+            'queue_size': self.queue_size
+        }
+
+    def extra_histograms(self):
+        """The lag histogram for metrics.render_prometheus"""
+        return {'stream_lag_seconds': (self.lags, 'End-to-end lag from event time to written decision')}
+
+
+def serve_socket(consumer, address):
+    """
+    Accept producers on a Unix socket path or a (host, port) TCP address and feed
+    their lines to the consumer, one thread per connection, until it is stopped
+    """
+    if isinstance(address, str):
+        if os.path.exists(address):
+            os.unlink(address)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(address)
+    server.listen()
+    server.settimeout(POLL_INTERVAL)
+
+    def handle(connection):
+        with connection, connection.makefile('rb') as stream:
+            consumer.feed(read_lines(stream.readline))
+
+    try:
+        while not consumer.stop_event.is_set():
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+            connection.settimeout(None)
+            threading.Thread(target=handle, args=(connection,), name='stream-connection', daemon=True).start()
+    finally:
+        server.close()
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)
+
+
+def _report(consumer, interval):
+    last_events, last_time = 0, time.monotonic()
+    while not consumer.stop_event.wait(interval):
+        stats, now = consumer.stats(), time.monotonic()
+        rate = (stats['events'] - last_events) / (now - last_time)
+        last_events, last_time = stats['events'], now
+        lag = (f"lag p50 {stats['lag_p50_ms']:.0f} ms p99 {stats['lag_p99_ms']:.0f} ms"
+               if stats['lag_p50_ms'] is not None else "lag -")
+        print(f"  {stats['events']:,} events ({rate:,.0f}/s), {stats['invalid']:,} invalid, {lag}, "
+              f"queue {stats['queue_depth']}/{stats['queue_size']}", file=sys.stderr, flush=True)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    # Service managers stop the consumer with SIGTERM: treat it like Ctrl-C
+    signal.signal(signal.SIGTERM, _interrupt)
+    parser = argparse.ArgumentParser(description="Score a live NDJSON transaction feed")
+    parser.add_argument('input', nargs='?', help="NDJSON file to read ('-' for stdin)")
+    parser.add_argument('--follow', action='store_true', help="Keep reading lines appended to the file")
+    parser.add_argument('--socket', default=None, help="Unix socket path to accept producers on")
+    parser.add_argument('--port', type=int, default=None, help="TCP port to accept producers on")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--output', default='-', help="NDJSON file to append decisions to ('-' for stdout)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="Longest an event waits for others to join its batch")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Events buffered before readers are paused")
+    parser.add_argument('--model', default=None,
+                        help="Model name from models/ (see model_registry.py) or a model file path")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Score on this many worker processes sharing the model (see scoring_pool.py)")
+    parser.add_argument('--confidence', choices=('full', 'tiered'), default=None)
+    parser.add_argument('--velocity-mb', type=int, default=0,
+                        help="Memory budget for per-account velocity features added to each decision (0 disables)")
+    parser.add_argument('--metrics-port', type=int, default=None, help="Serve Prometheus metrics on this port")
+    parser.add_argument('--report-interval', type=float, default=DEFAULT_REPORT_INTERVAL,
+                        help="Seconds between progress lines on stderr (0 disables)")
+    args = parser.parse_args()
+    if sum(source is not None for source in (args.input, args.socket, args.port)) != 1:
+        parser.error("give exactly one of an input file, --socket or --port")
+
+    from model_registry import ModelRegistry
+    from scoring import load_booster
+
+    if args.model and not os.path.exists(args.model):
+        try:
+            classifier = ModelRegistry().get(args.model)
+        except KeyError as e:
+            raise SystemExit(e.args[0])
+    else:
+        classifier, model_loaded = load_booster(args.model)
+        if not model_loaded:
+            raise SystemExit("Model could not be loaded")
+
+    confidence.configure(tiered=args.confidence == 'tiered' if args.confidence else None)
+    pool = None
+    if args.processes > 1:
+        from scoring_pool import ScoringPool
+
+        classifier = pool = ScoringPool(classifier, args.processes)
+    feature_store = None
+    if args.velocity_mb > 0:
+        from velocity import AccountFeatureStore
+
+        feature_store = AccountFeatureStore(max_bytes=args.velocity_mb * 1024 * 1024)
+
+    sink = sys.stdout if args.output == '-' else open(args.output, 'a')
+    consumer = StreamConsumer(classifier, sink, args.batch_size, args.max_wait_ms, args.queue_size,
+                              feature_store=feature_store)
+    if args.metrics_port:
+        metrics.enable()
+        metrics.start_http_server(args.metrics_port, extra_histograms=consumer.extra_histograms)
+    if args.report_interval > 0:
+        threading.Thread(target=_report, args=(consumer, args.report_interval),
+                         name='stream-report', daemon=True).start()
+
+    if args.input is not None:
+        def read():
+            if args.input == '-':
+                consumer.feed(read_lines(sys.stdin.buffer.readline))
+            else:
+                consumer.feed(tail_lines(args.input, args.follow, consumer.stop_event))
+            consumer.finish()
+    else:
+        address = args.socket or (args.host, args.port)
+
+        def read():
+            serve_socket(consumer, address)
+    reader = threading.Thread(target=read, name='stream-reader', daemon=True)
+    reader.start()
+
+    try:
+        consumer.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        consumer.stop()
+        reader.join(timeout=1)
+        if sink is not sys.stdout:
+            sink.close()
+        if pool is not None:
+            pool.close()
+    stats = consumer.stats()
+    print(f"Scored {stats['decisions']:,} events ({stats['invalid']:,} invalid) at "
+          f"{stats['events_per_second']:,.0f} events/s, lag p99 {stats['lag_p99_ms'] or 0:.0f} ms",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Parity of compiled_model.CompiledBooster with the XGBoost booster it was compiled from
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+xgb = pytest.importorskip('xgboost')
+
+from compiled_model import (MARGIN_ATOL, MAX_COMPILED_DEPTH, CompiledBooster, compile_booster,  # noqa: E402
+                            max_contribution_difference, max_margin_difference)
+from model_registry import MODEL_DIR  # noqa: E402
+
+# TreeSHAP sums float32 leaf values in a different order than XGBoost
+CONTRIBUTION_ATOL = 1e-4
+
+
+def _train(max_depth, num_features, rounds=20, seed=0):
+    rng = np.random.default_rng(seed)
+    data = rng.standard_normal((4000, num_features)).astype(np.float32)
+    # Interactions between many features, so leaf paths split on more than 8 of them
+    label = (np.sin(data @ rng.standard_normal(num_features)) + data[:, :4].prod(axis=1) > 0).astype(np.float32)
+    data[rng.random(data.shape) < 0.02] = np.nan
+    params = {'max_depth': max_depth, 'eta': 0.3, 'objective': 'binary:logistic', 'min_child_weight': 0, 'seed': seed}
+    return xgb.train(params, xgb.DMatrix(data, label=label), rounds)
+
+
+# (max_depth, features, rounds): deep trees have thousands of leaves, so they get fewer rounds
+@pytest.mark.parametrize('max_depth, num_features, rounds', [(3, 9, 20), (6, 9, 20), (10, 12, 20),
+                                                             (MAX_COMPILED_DEPTH, 20, 3)])
+def test_trained_booster_parity(max_depth, num_features, rounds):
+    booster = _train(max_depth, num_features, rounds)
+    compiled = compile_booster(booster)
+    if max_depth > 8:
+        # Paths over more than 8 distinct features, which an 8-bit path mask cannot hold
+        assert compiled.path_tables['path_element'].max() + 1 > 8
+    assert max_margin_difference(booster, compiled, rows=2000) <= MARGIN_ATOL
+    assert max_contribution_difference(booster, compiled, rows=200) <= CONTRIBUTION_ATOL
+
+
+def test_shipped_model_parity(tmp_path):
+    path = os.path.join(MODEL_DIR, '3momtsim_fraud_model.bin')
+    if not os.path.exists(path):
+        pytest.skip(f"{path} not found")
+    booster = xgb.Booster()
+    booster.load_model(path)
+    compiled = compile_booster(booster)
+    compiled.save(str(tmp_path / 'model.npz'))
+    loaded = CompiledBooster.load(str(tmp_path / 'model.npz'))
+    assert max_margin_difference(booster, loaded, rows=2000) <= MARGIN_ATOL
+    assert max_contribution_difference(booster, loaded, rows=500) <= CONTRIBUTION_ATOL
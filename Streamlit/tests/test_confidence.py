@@ -0,0 +1,66 @@
+"""
+The batched confidence engine must give the dashboard the decisions of the original
+per-row implementation (benchmarks/bench_confidence.legacy_confidence), whether the
+model is served as a booster or compiled
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, 'benchmarks'))
+
+xgb = pytest.importorskip('xgboost')
+
+from bench_confidence import TREE_VARIANCE_ATOL, legacy_confidence  # noqa: E402
+from bench_models import synthetic_transactions  # noqa: E402
+from compiled_model import compile_booster  # noqa: E402
+from confidence import CONFIDENCE_WEIGHTS, compute_confidence_batch  # noqa: E402
+from model_registry import MODEL_DIR  # noqa: E402
+from preprocessing import preprocess_transaction  # noqa: E402
+from scoring import recommend  # noqa: E402
+
+TRANSACTIONS = 60
+
+
+@pytest.fixture(scope='module')
+def booster():
+    path = os.path.join(MODEL_DIR, '3momtsim_fraud_model.bin')
+    if not os.path.exists(path):
+        pytest.skip(f"{path} not found")
+    classifier = xgb.Booster()
+    classifier.load_model(path)
+    return classifier
+
+
+@pytest.fixture(scope='module')
+def feature_lists():
+    return [preprocess_transaction(*row) for row in synthetic_transactions(TRANSACTIONS, seed=7).itertuples(index=False)]
+
+
+@pytest.fixture(scope='module')
+def legacy(booster, feature_lists):
+    return [legacy_confidence(booster, features) for features in feature_lists]
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_decisions_match_legacy(booster, feature_lists, legacy, compiled):
+    classifier = compile_booster(booster) if compiled else booster
+    results = compute_confidence_batch(classifier, feature_lists, tiered=False)
+    for (fraud_prob, confidence, breakdown), (expected_prob, expected_confidence, expected) in zip(results, legacy):
+        np.testing.assert_allclose(fraud_prob, expected_prob, rtol=0, atol=1e-6)
+        for method in CONFIDENCE_WEIGHTS:
+            np.testing.assert_allclose(breakdown[method], expected[method], rtol=0, atol=TREE_VARIANCE_ATOL)
+        np.testing.assert_allclose(confidence, expected_confidence, rtol=0, atol=TREE_VARIANCE_ATOL)
+        assert recommend(fraud_prob, confidence) == recommend(expected_prob, expected_confidence)
+
+
+def test_breakdown_keeps_contributions(booster, feature_lists):
+    (fraud_prob, _, breakdown), = compute_confidence_batch(booster, feature_lists[:1], tiered=False)
+    margin = sum(breakdown['contributions'].values())
+    assert abs(1 / (1 + np.exp(-margin)) - fraud_prob) < 1e-5
@@ -0,0 +1,83 @@
+"""
+Parity of ensemble.ServingEnsemble with the calibrated pickles in models/
+
+The serving path must give the probabilities of scikit-learn's own estimators and
+calibrators, not only survive its own save/load round trip.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import warnings
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('joblib')
+pytest.importorskip('xgboost')
+pytest.importorskip('lightgbm')
+pytest.importorskip('catboost')
+
+from ensemble import (PROBABILITY_ATOL, ServingEnsemble, load_pickle,  # noqa: E402
+                      reference_predict, sample_features)
+from model_registry import MODEL_DIR  # noqa: E402
+
+ARTIFACTS = ('CalibratedEnsemble.pkl', 'LightGBM_calibrated.pkl', 'XGBoost_calibrated.pkl')
+ROWS = 5000
+
+
+def _load(name):
+    path = os.path.join(MODEL_DIR, name)
+    if not os.path.exists(path):
+        pytest.skip(f"{name} not in {MODEL_DIR}")
+    with warnings.catch_warnings():
+        # The pickles were written by older scikit-learn and XGBoost releases
+        warnings.simplefilter('ignore')
+        pickled = load_pickle(path)
+    return pickled, ServingEnsemble.from_calibrated(pickled)
+
+
+@pytest.fixture(scope='module', params=ARTIFACTS)
+def artifact(request):
+    pickled, served = _load(request.param)
+    yield pickled, served, sample_features(served, ROWS, seed=1)
+    served.close()
+
+
+def test_serving_matches_reference(artifact):
+    pickled, served, data = artifact
+    np.testing.assert_allclose(served.predict(data), reference_predict(pickled, data), rtol=0, atol=PROBABILITY_ATOL)
+
+
+def test_converted_matches_pickle(artifact, tmp_path):
+    pickled, served, data = artifact
+    served.save(str(tmp_path / 'converted.model'))
+    converted = ServingEnsemble.load(str(tmp_path / 'converted.model'))
+    try:
+        np.testing.assert_allclose(converted.predict(data), reference_predict(pickled, data),
+                                   rtol=0, atol=PROBABILITY_ATOL)
+    finally:
+        converted.close()
+
+
+def test_xgboost_matches_predict_proba():
+    pickled, served = _load('XGBoost_calibrated.pkl')
+    try:
+        data = sample_features(served, ROWS, seed=2)
+        np.testing.assert_allclose(served.predict(data), pickled.predict_proba(data)[:, 1],
+                                   rtol=0, atol=PROBABILITY_ATOL)
+    finally:
+        served.close()
+
+
+def test_lightgbm_matches_calibrator_on_probabilities():
+    pickled, served = _load('LightGBM_calibrated.pkl')
+    try:
+        data = sample_features(served, ROWS, seed=3)
+        expected = np.mean([fold.calibrators[0].predict(fold.estimator.predict_proba(data)[:, 1])
+                            for fold in pickled.calibrated_classifiers_], axis=0)
+        np.testing.assert_allclose(served.predict(data), expected, rtol=0, atol=PROBABILITY_ATOL)
+    finally:
+        served.close()
@@ -16,24 +16,23 @@ export default function FraudDetectionDashboard() {
 
   const handlePrediction = async (transactionData: any) => {
     setIsLoading(true)
-    // Simulate API call to your ML model
-    setTimeout(() => {
-      const fraudScore = Math.random()
-      const result = {
-        fraudScore: fraudScore,
-        riskLevel: fraudScore > 0.7 ? "HIGH" : fraudScore > 0.4 ? "MEDIUM" : "LOW",
-        confidence: 0.85 + Math.random() * 0.1,
-        factors: [
-          { name: "Transaction Amount", impact: 0.3, description: "Unusually high amount for this user" },
-          { name: "Time Pattern", impact: 0.2, description: "Transaction outside normal hours" },
-          { name: "Location", impact: 0.15, description: "New location detected" },
-          { name: "Frequency", impact: 0.1, description: "Multiple transactions in short period" },
-        ],
-        recommendation: fraudScore > 0.7 ? "BLOCK" : fraudScore > 0.4 ? "REVIEW" : "APPROVE",
+    // Scored by the Python service in Streamlit/service.py
+    try {
+      const response = await fetch(`${process.env.NEXT_PUBLIC_SCORING_URL ?? "http://127.0.0.1:8000"}/predict`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(transactionData),
+      })
+      if (!response.ok) {
+        throw new Error(`Scoring service returned ${response.status}`)
       }
-      setPrediction(result)
+      setPrediction(await response.json())
+    } catch (error) {
+      console.error(error)
+      setPrediction(null)
+    } finally {
       setIsLoading(false)
-    }, 2000)
+    }
   }
 
   return (